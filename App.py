@@ -1,555 +1,707 @@
 import streamlit as st
 import pandas as pd
-import requests
-from bs4 import BeautifulSoup
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from selenium.common.exceptions import TimeoutException, WebDriverException
-import time
-import io
 import os
 import sys
 from datetime import datetime
-import logging
-import subprocess
 
-# Cấu hình logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
-
-# Cấu hình trang
-st.set_page_config(
-    page_title="UniProt 3D Structure Extractor",
-    page_icon="🧬",
-    layout="wide",
-    initial_sidebar_state="collapsed"
+# Lõi xử lý nằm trong uniprot_pipeline (không phụ thuộc Streamlit), file này chỉ chứa giao diện
+from uniprot_pipeline import (
+    ACCESSION_INDEX_PATH, JOB_DONE, JOB_FAILED, JOB_QUEUED, MAX_WORKERS, REQUIRED_COLUMNS,
+    STRUCTURE_DOWNLOAD_DIR, STRUCTURE_METHODS, SYNC_STATE_PATH,
+    AccessionIndex, DeltaSync, JobCheckpoint, JobRunner, ResponseCache, SpanRecorder, StructureDownloader,
+    build_partial_xlsx, cli_main, create_run_exporter, format_duration,
+    get_browser_setup, load_input_table, read_input_header, structure_records, test_driver
 )
 
-def install_chromium():
-    """Cài đặt chromium nếu chưa có"""
-    try:
-        # Kiểm tra xem chromium đã được cài đặt chưa
-        result = subprocess.run(['which', 'chromium'], capture_output=True, text=True)
-        if result.returncode == 0:
-            logger.info(f"Chromium đã được cài đặt tại: {result.stdout.strip()}")
-            return result.stdout.strip()
-        
-        # Thử các đường dẫn khác
-        possible_paths = [
-            '/usr/bin/chromium',
-            '/usr/bin/chromium-browser',
-            '/usr/bin/google-chrome',
-            '/usr/bin/google-chrome-stable'
-        ]
-        
-        for path in possible_paths:
-            if os.path.exists(path):
-                logger.info(f"Tìm thấy browser tại: {path}")
-                return path
-        
-        logger.warning("Không tìm thấy chromium")
+
+# Chu kỳ giao diện hỏi trạng thái job chạy nền
+JOB_POLL_SECONDS = 1.0
+
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# Số checkpoint (mỗi file upload một kết nối SQLite) giữ mở cùng lúc
+CHECKPOINT_CACHE_ENTRIES = 32
+
+# Bảng kết quả trên giao diện chỉ gửi từng trang, không gửi cả bảng mỗi lần rerun
+EXPLORER_PAGE_SIZES = [50, 100, 500]
+
+@st.cache_resource
+def get_response_cache():
+    """Cache dùng chung cho toàn bộ tiến trình Streamlit"""
+    return ResponseCache()
+
+def get_accession_index():
+    """Index offline dùng chung cho tiến trình Streamlit, None nếu chưa dựng
+    
+    Kiểm tra file ngoài hàm có cache: index dựng sau khi app đã chạy vẫn được nhận.
+    """
+    if not os.path.exists(ACCESSION_INDEX_PATH):
         return None
+    return _open_accession_index(ACCESSION_INDEX_PATH)
+
+@st.cache_resource
+def _open_accession_index(path):
+    return AccessionIndex(path)
+
+@st.cache_resource(max_entries=CHECKPOINT_CACHE_ENTRIES)
+def get_job_checkpoint(job_id):
+    """Checkpoint của một file upload, mở một lần và dùng lại qua các lần rerun và cho job chạy nền"""
+    return JobCheckpoint(job_id)
+
+@st.cache_resource
+def get_job_runner():
+    """Job runner dùng chung cho mọi phiên Streamlit, sống qua các lần rerun"""
+    return JobRunner()
+
+class StreamlitProgress:
+    """Hiển thị tiến độ của job đang chạy trên các placeholder cố định, mỗi lần giao diện hỏi trạng thái"""
+
+    def __init__(self, exporter=None):
+        self.exporter = exporter
         
-    except Exception as e:
-        logger.error(f"Lỗi khi kiểm tra chromium: {e}")
-        return None
+        st.markdown("### 🔄 Đang xử lý dữ liệu...")
+        self.overall_progress = st.progress(0)
+        self.current_step = st.empty()
+        self.step_progress = st.progress(0)
+        self.status_text = st.empty()
+        self.time_estimate = st.empty()
+        self.export_status = st.empty()
+        
+        # Tạo một lần và cập nhật tại chỗ, không thêm widget mới mỗi dòng
+        self.metric_slots = [column.empty() for column in st.columns(4)]
 
-def create_driver():
-    """Tạo Chrome driver với cấu hình tối ưu"""
-    # Tìm chromium
-    chromium_path = install_chromium()
-    
-    chrome_options = Options()
-    
-    # Cấu hình cơ bản
-    chrome_options.add_argument("--headless")
-    chrome_options.add_argument("--no-sandbox")
-    chrome_options.add_argument("--disable-dev-shm-usage")
-    chrome_options.add_argument("--disable-gpu")
-    chrome_options.add_argument("--disable-software-rasterizer")
-    chrome_options.add_argument("--disable-extensions")
-    chrome_options.add_argument("--disable-plugins")
-    chrome_options.add_argument("--disable-images")
-    chrome_options.add_argument("--disable-javascript")
-    chrome_options.add_argument("--window-size=1920,1080")
-    chrome_options.add_argument("--remote-debugging-port=9222")
-    chrome_options.add_argument("--single-process")
-    chrome_options.add_argument("--no-zygote")
-    chrome_options.add_argument("--disable-background-timer-throttling")
-    chrome_options.add_argument("--disable-backgrounding-occluded-windows")
-    chrome_options.add_argument("--disable-renderer-backgrounding")
-    chrome_options.add_argument("--disable-features=TranslateUI,VizDisplayCompositor")
-    chrome_options.add_argument("--disable-ipc-flooding-protection")
-    chrome_options.add_argument("--memory-pressure-off")
-    chrome_options.add_argument("--max_old_space_size=4096")
+    def render(self, stage, done, total, info):
+        """Vẽ một sự kiện tiến độ; tốc độ và ETA lấy từ info ('rate', 'eta') đã tính sẵn"""
+        if stage == 'entries':
+            self._show_entries(done, total, info)
+        elif stage == 'structures':
+            self._show_structures(done, total, info)
+        elif stage == 'downloads':
+            self._show_downloads(done, total, info)
+        elif stage == 'done':
+            self._show_done(info)
+
+    def show_job(self, job):
+        """Vẽ lại tiến độ mới nhất của một job chạy nền (mỗi lần giao diện hỏi trạng thái)"""
+        for stage, done, total, info in job.progress.snapshot():
+            self.render(stage, done, total, info)
+
+    def _show_throughput(self, info, unit):
+        rate = info.get('rate')
+        if rate is None:
+            self.time_estimate.text("⏱️ Đang tính toán...")
+            return
+        self.time_estimate.text(f"⏱️ {rate:.1f} {unit}/giây - {format_duration(info['eta'])}")
+
+    def _show_metrics(self, metrics):
+        for slot, (label, value) in zip(self.metric_slots, metrics):
+            slot.metric(label, value)
+
+    def _show_entries(self, done, total, info):
+        self.current_step.markdown("**🔍 Bước 1/2: Lấy Entry IDs từ UniProt**")
+        if 'message' in info:
+            self.status_text.text(info['message'])
+            return
+        
+        current_progress = done / total if total else 1.0
+        self.step_progress.progress(current_progress)
+        self.overall_progress.progress(current_progress * 0.4)
+        if 'label' in info:
+            self.status_text.text(f"Đã xử lý {done}/{total}: {info['label']}")
+        self._show_throughput(info, "dòng")
+        
+        if done:
+            success_count = info.get('success', 0)
+            self._show_metrics([
+                ("Đã xử lý", f"{done}/{total}"),
+                ("Thành công", success_count),
+                ("Thất bại", done - success_count),
+                ("Tỷ lệ thành công", f"{success_count / done * 100:.1f}%")
+            ])
+
+    def _show_structures(self, done, total, info):
+        self.current_step.markdown("**🧬 Bước 2/2: Lấy dữ liệu 3D Structure**")
+        current_progress = done / total if total else 1.0
+        self.step_progress.progress(current_progress)
+        self.overall_progress.progress(0.4 + (current_progress * 0.6))
+        if 'label' in info:
+            self.status_text.text(f"Đã lấy 3D structure {done}/{total}: {info['label']}")
+        self._show_throughput(info, "protein")
+        
+        if info.get('rows_written') is not None:
+            self.export_status.caption(f"💾 Đã ghi {info['rows_written']} dòng vào `{self.exporter.structures_path}`")
+        
+        if done:
+            self._show_metrics([
+                ("Proteins đã xử lý", f"{done}/{total}"),
+                ("Structures tìm thấy", info.get('structures', 0)),
+                ("Trung bình/protein", f"{info.get('protein_structures', 0) / done:.1f}"),
+                ("Hoàn thành", f"{done / total * 100:.1f}%")
+            ])
+
+    def _show_downloads(self, done, total, info):
+        self.current_step.markdown("**📦 Bước 3: Tải file cấu trúc (mmCIF/AlphaFold)**")
+        self.step_progress.progress(done / total if total else 1.0)
+        if 'label' in info:
+            self.status_text.text(f"Đã tải {done}/{total}: {info['label']}")
+        self._show_throughput(info, "file")
+        
+        if done:
+            self._show_metrics([
+                ("Files đã xử lý", f"{done}/{total}"),
+                ("Tải mới", info.get('downloaded', 0)),
+                ("Đã có sẵn", done - info.get('downloaded', 0) - info.get('failed', 0)),
+                ("Thất bại", info.get('failed', 0))
+            ])
+
+    def _show_done(self, info):
+        self.overall_progress.progress(1.0)
+        self.step_progress.progress(1.0)
+        self.status_text.text("✅ Hoàn thành tất cả!")
+        
+        total_time = info.get('elapsed', 0)
+        minutes = int(total_time // 60)
+        seconds = int(total_time % 60)
+        self.time_estimate.text(f"🎉 Hoàn thành trong {minutes} phút {seconds} giây!")
+
+def show_download_results(downloader, package_path, key=None):
+    """Thống kê bước tải file cấu trúc và nút tải file zip/manifest"""
+    records = pd.DataFrame(downloader.records, columns=['source', 'identifier', 'file', 'status', 'error'])
+    counts = records['status'].value_counts()
     
-    # User agent
-    chrome_options.add_argument("--user-agent=Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
+    st.markdown("### 📦 File cấu trúc")
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Tải mới", int(counts.get('downloaded', 0)))
+    with col2:
+        st.metric("Đã có sẵn", int(counts.get('skipped', 0)))
+    with col3:
+        st.metric("Thất bại", int(counts.get('failed', 0)))
     
-    # Tắt automation detection
-    chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
-    chrome_options.add_experimental_option('useAutomationExtension', False)
+    as_zip = package_path.endswith('.zip')
+    st.caption(f"📁 File lưu tại `{downloader.output_dir}`, manifest: `{package_path}`")
+    with open(package_path, 'rb') as f:
+        st.download_button(
+            label="📥 Tải file cấu trúc (.zip)" if as_zip else "📥 Tải manifest",
+            data=f.read(),
+            file_name=os.path.basename(package_path),
+            mime="application/zip" if as_zip else "application/json",
+            use_container_width=True,
+            key=key
+        )
     
-    # Đặt binary location nếu tìm thấy
-    if chromium_path:
-        chrome_options.binary_location = chromium_path
+    with st.expander("📄 Chi tiết file cấu trúc", expanded=False):
+        st.dataframe(records, use_container_width=True)
+
+def show_timing_panel(spans, key=""):
+    """Bảng thời gian theo bước, histogram và nút tải dữ liệu thô"""
+    with st.expander("⏱️ Phân tích thời gian theo từng bước", expanded=False):
+        if spans.to_frame().empty:
+            st.caption("Chưa có dữ liệu thời gian")
+            return
+        
+        st.dataframe(spans.summary(), use_container_width=True)
+        st.caption("Số lần theo khoảng thời gian")
+        st.bar_chart(spans.histogram())
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            st.download_button("📥 Tải timings.json", data=spans.to_json(), file_name="timings.json",
+                               mime="application/json", key=f"timings_json_{key}")
+        with col2:
+            st.download_button("📥 Tải timings.csv", data=spans.to_csv(), file_name="timings.csv", mime="text/csv",
+                               key=f"timings_csv_{key}")
+
+class ResultExplorer:
+    """Kết quả của một job để xem trên giao diện: bảng có kiểu, tổng hợp theo protein và bộ lọc
     
-    try:
-        # Thử tạo driver
-        service = Service()
-        driver = webdriver.Chrome(service=service, options=chrome_options)
-        driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
-        logger.info("Tạo driver thành công")
-        return driver
-        
-    except Exception as e:
-        logger.error(f"Lỗi tạo driver: {e}")
-        
-        # Thử với webdriver-manager
-        try:
-            from webdriver_manager.chrome import ChromeDriverManager
-            service = Service(ChromeDriverManager().install())
-            driver = webdriver.Chrome(service=service, options=chrome_options)
-            driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
-            logger.info("Tạo driver thành công với webdriver-manager")
-            return driver
-        except Exception as e2:
-            logger.error(f"Lỗi với webdriver-manager: {e2}")
+    Tạo một lần khi job xong và giữ trong st.session_state; mỗi lần rerun chỉ lọc
+    (vector hóa, nhớ kết quả của bộ lọc gần nhất) và cắt ra trang đang xem.
+    """
+
+    def __init__(self, result):
+        self.entries = result['entries']
+        self.records = structure_records(result['structures']) if result['structures'] is not None else None
+        self.summary = self._protein_summary(self.records) if self.records is not None else None
+        self.paths = {'xlsx': result['xlsx_path'], 'parquet': result['parquet_path']}
+        self._files = {}
+        self._filter_key = None
+        self._filtered = None
+        self._filtered_csv = None
+
+    @staticmethod
+    def _protein_summary(records):
+        """Mỗi protein: số structure, số PDB, resolution tốt nhất, các method, vùng phủ, có AlphaFold"""
+        keys = ['Query', 'Entry Name']
+        flags = records[keys].assign(
+            PDB=(records['Source'] == 'PDB').to_numpy(),
+            AlphaFold=(records['Source'] == 'AlphaFoldDB').to_numpy()
+        )
+        summary = records.groupby(keys, sort=False).agg(
+            Structures=('Identifier', 'size'),
+            **{'Best Resolution': ('Resolution', 'min'), 'Start': ('Start', 'min'), 'End': ('End', 'max')}
+        )
+        summary = summary.join(flags.groupby(keys, sort=False).agg(PDB=('PDB', 'sum'), AlphaFold=('AlphaFold', 'any')))
+        
+        # Mỗi protein chỉ ghép các method khác nhau
+        methods = records[keys].assign(Method=records['Method'].astype(str)).drop_duplicates()
+        methods = methods[methods['Method'] != ""].sort_values('Method')
+        summary['Methods'] = methods.groupby(keys, sort=False)['Method'].agg(', '.join)
+        summary['Methods'] = summary['Methods'].fillna("")
+        return summary.reset_index()[keys + ['Structures', 'PDB', 'Best Resolution', 'Methods', 'Start', 'End',
+                                             'AlphaFold']]
+
+    def options(self, column):
+        """Các giá trị có trong cột phân loại (Method, Source)"""
+        return sorted(value for value in self.records[column].astype(str).unique() if value)
+
+    def filter(self, methods=None, sources=None, max_resolution=None, protein=""):
+        """Các dòng 3D structure thỏa bộ lọc; gọi lại với cùng bộ lọc thì dùng kết quả cũ"""
+        key = (tuple(methods or ()), tuple(sources or ()), max_resolution, protein.strip().upper())
+        if key == self._filter_key:
+            return self._filtered
+        
+        records = self.records
+        keep = pd.Series(True, index=records.index)
+        if methods:
+            keep &= records['Method'].isin(methods)
+        if sources:
+            keep &= records['Source'].isin(sources)
+        if max_resolution is not None:
+            # Structure không có resolution (NMR, AlphaFold) được giữ lại
+            keep &= records['Resolution'].isna() | (records['Resolution'] <= max_resolution)
+        if key[3]:
+            keep &= (records['Query'].str.upper().str.contains(key[3], regex=False)
+                     | records['Entry Name'].str.upper().str.contains(key[3], regex=False))
+        
+        self._filter_key = key
+        self._filtered = records[keep]
+        self._filtered_csv = None
+        return self._filtered
+
+    def filtered_csv(self):
+        """CSV của các dòng đang lọc, chỉ tạo lại khi bộ lọc đổi"""
+        if self._filtered_csv is None:
+            self._filtered_csv = self._filtered.to_csv(index=False).encode('utf-8-sig')
+        return self._filtered_csv
+
+    def file_bytes(self, kind):
+        """Nội dung file kết quả (xlsx/parquet), đọc từ đĩa một lần"""
+        path = self.paths.get(kind)
+        if not path:
             return None
+        if kind not in self._files:
+            with open(path, 'rb') as f:
+                self._files[kind] = f.read()
+        return self._files[kind]
+
+def get_result_explorer(job):
+    """ResultExplorer của job, tạo một lần cho mỗi phiên"""
+    explorers = st.session_state.setdefault('result_explorers', {})
+    if job.id not in explorers:
+        explorers[job.id] = ResultExplorer(job.result)
+        job.release_frames()
+    return explorers[job.id]
+
+def get_uploaded_input(uploaded_file):
+    """Header, bảng input và job id của file upload, đọc một lần cho mỗi file trong phiên"""
+    cached = st.session_state.get('uploaded_input')
+    if cached is None or cached['file_id'] != uploaded_file.file_id:
+        columns = read_input_header(uploaded_file, uploaded_file.name)
+        df_input = None
+        if all(col in columns for col in REQUIRED_COLUMNS):
+            df_input = load_input_table(uploaded_file, uploaded_file.name)
+        cached = {
+            'file_id': uploaded_file.file_id,
+            'columns': columns,
+            'df_input': df_input,
+            'job_id': JobCheckpoint.job_id_for(uploaded_file.getvalue()),
+        }
+        st.session_state['uploaded_input'] = cached
+    return cached
+
+def show_page(frame, key, **dataframe_options):
+    """Hiển thị một trang của bảng, chỉ gửi các dòng của trang đó lên trình duyệt"""
+    col_size, col_page, col_info = st.columns([1, 1, 2])
+    with col_size:
+        page_size = st.selectbox("Số dòng/trang", EXPLORER_PAGE_SIZES, index=1, key=f"{key}_size")
+    page_count = max(1, -(-len(frame) // page_size))
+    with col_page:
+        page = st.number_input("Trang", min_value=1, max_value=page_count, value=1, key=f"{key}_page")
+    start = (min(page, page_count) - 1) * page_size
+    with col_info:
+        st.caption(f"Dòng {start + 1 if len(frame) else 0}-{min(start + page_size, len(frame))} / {len(frame)}")
+    st.dataframe(frame.iloc[start:start + page_size], use_container_width=True, hide_index=True,
+                 **dataframe_options)
+
+def show_changes(df_changes, stats, key):
+    """Thống kê delta-sync và bảng structure thêm/bị gỡ so với lần chạy trước"""
+    st.markdown("### 🔁 Thay đổi so với lần chạy trước")
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Entry không đổi", stats['unchanged'])
+    with col2:
+        st.metric("Entry đã đổi", stats['changed'])
+    with col3:
+        st.metric("Entry mới", stats['new'])
+    with col4:
+        st.metric("Structure thêm/gỡ", len(df_changes))
+    if len(df_changes):
+        with st.expander("📋 Chi tiết thay đổi (sheet Structure_Changes)", expanded=False):
+            show_page(df_changes, key)
 
-def test_driver():
-    """Test driver functionality"""
-    try:
-        driver = create_driver()
-        if driver:
-            driver.get("https://www.google.com")
-            title = driver.title
-            driver.quit()
-            logger.info(f"Driver test thành công: {title}")
-            return True, f"Thành công: {title}"
-        return False, "Không thể tạo driver"
-    except Exception as e:
-        logger.error(f"Driver test thất bại: {e}")
-        return False, f"Lỗi: {str(e)}"
-
-def get_entry_from_uniprot_selenium(gene_id, entry_name):
-    """Lấy Entry ID từ UniProt"""
-    url = f"https://www.uniprot.org/uniprotkb?query={gene_id}"
+def show_job_results(job):
+    """Kết quả của một job đã xong: thống kê, bảng dữ liệu theo trang và các nút tải xuống"""
+    result = job.result
+    st.caption(f"💾 Cache: {result['cache_hits']} hit / {result['cache_misses']} miss")
     
-    driver = create_driver()
-    if not driver:
-        logger.error("Không thể tạo driver")
-        return None
+    explorer = get_result_explorer(job)
+    df_entry_results = explorer.entries
+    if df_entry_results is None:
+        st.error("❌ Không thể xử lý dữ liệu")
+        return
     
-    try:
-        logger.info(f"Đang truy cập: {url}")
-        driver.get(url)
-        
-        # Chờ trang tải
-        try:
-            WebDriverWait(driver, 30).until(
-                EC.presence_of_element_located((By.CLASS_NAME, "data-table"))
-            )
-        except TimeoutException:
-            logger.warning(f"Timeout chờ bảng tải cho {gene_id}")
-            return None
-        
-        # Chấp nhận cookie
-        try:
-            cookie_button = WebDriverWait(driver, 10).until(
-                EC.element_to_be_clickable((By.XPATH, "//button[contains(text(), 'I agree, dismiss this banner')]"))
-            )
-            cookie_button.click()
-            time.sleep(2)
-        except TimeoutException:
-            logger.info("Không có cookie banner")
-        
-        html_content = driver.page_source
-        soup = BeautifulSoup(html_content, 'html.parser')
-        
-        # Tìm bảng
-        table = soup.find('table', class_='data-table')
-        if not table:
-            table = soup.find('table')
-        
-        if not table:
-            logger.warning(f"Không tìm thấy bảng cho {gene_id}")
-            return None
-        
-        tbody = table.find('tbody')
-        if not tbody:
-            logger.warning(f"Không tìm thấy tbody cho {gene_id}")
-            return None
-        
-        rows = tbody.find_all('tr')
-        for row in rows:
-            cols = row.find_all('td')
-            if len(cols) > 3:
-                current_entry_name = cols[3].text.strip()
-                if current_entry_name == entry_name:
-                    entry = cols[1].text.strip()
-                    logger.info(f"Tìm thấy entry {entry} cho {gene_id}")
-                    return entry
-        
-        logger.warning(f"Không tìm thấy entry name '{entry_name}' cho {gene_id}")
-        return None
-        
-    except Exception as e:
-        logger.error(f"Lỗi khi xử lý {gene_id}: {e}")
-        return None
-    finally:
-        try:
-            driver.quit()
-        except:
-            pass
-
-def extract_3d_structure_table(final_url, query, entry_name):
-    """Lấy thông tin từ bảng 3D structure"""
-    driver = create_driver()
-    if not driver:
-        logger.error("Không thể tạo driver cho 3D structure")
-        return None
+    st.markdown("### 📊 Kết quả Entry IDs")
     
-    try:
-        logger.info(f"Đang truy cập 3D structure: {final_url}")
-        driver.get(final_url)
-        time.sleep(8)
-        
-        # Chấp nhận cookie
-        try:
-            cookie_button = WebDriverWait(driver, 10).until(
-                EC.element_to_be_clickable((By.XPATH, "//button[contains(text(), 'I agree, dismiss this banner')]"))
-            )
-            cookie_button.click()
-            time.sleep(3)
-        except TimeoutException:
-            logger.info("Không có cookie banner")
-        
-        html_content = driver.page_source
-        soup = BeautifulSoup(html_content, 'html.parser')
-        
-        # Tìm bảng 3D structure
-        table = None
-        tables = soup.find_all('table')
-        
-        structure_keywords = ['SOURCE', 'IDENTIFIER', 'METHOD', 'RESOLUTION', 'CHAIN', 'POSITIONS', 'LINKS']
-        
-        for t in tables:
-            headers = []
-            thead = t.find('thead')
-            if thead:
-                header_cells = thead.find_all(['th', 'td'])
-                headers = [cell.get_text(strip=True).upper() for cell in header_cells]
-            else:
-                first_row = t.find('tr')
-                if first_row:
-                    header_cells = first_row.find_all(['th', 'td'])
-                    headers = [cell.get_text(strip=True).upper() for cell in header_cells]
-            
-            matching_keywords = sum(1 for keyword in structure_keywords if keyword in ' '.join(headers))
-            if matching_keywords >= 3:
-                table = t
-                break
-        
-        if not table:
-            for t in tables:
-                table_text = t.get_text().upper()
-                if ('ALPHAFOLD' in table_text or 'PDB' in table_text or 'AF-' in table_text) and len(t.find_all('tr')) > 1:
-                    table = t
-                    break
-        
-        if not table:
-            logger.warning(f"Không tìm thấy bảng 3D structure cho {query}")
-            return None
-        
-        # Lấy headers
-        headers = []
-        thead = table.find('thead')
-        if thead:
-            header_row = thead.find('tr')
-            if header_row:
-                for th in header_row.find_all(['th', 'td']):
-                    header_text = th.get_text(strip=True)
-                    if header_text:
-                        headers.append(header_text)
-        
-        if not headers:
-            first_row = table.find('tr')
-            if first_row:
-                header_cells = first_row.find_all(['th', 'td'])
-                for cell in header_cells:
-                    header_text = cell.get_text(strip=True)
-                    if header_text:
-                        headers.append(header_text)
-        
-        # Lấy dữ liệu
-        data = []
-        tbody = table.find('tbody')
-        if tbody:
-            rows = tbody.find_all('tr')
-        else:
-            all_rows = table.find_all('tr')
-            if all_rows and headers:
-                rows = all_rows[1:]
-            else:
-                rows = all_rows
-        
-        for row in rows:
-            cells = row.find_all(['td', 'th'])
-            row_data = []
-            
-            for cell in cells:
-                cell_text = cell.get_text(strip=True)
-                
-                links = cell.find_all('a')
-                if links:
-                    link_urls = []
-                    for link in links:
-                        href = link.get('href', '')
-                        if href:
-                            if href.startswith('/'):
-                                href = 'https://www.uniprot.org' + href
-                            elif not href.startswith('http'):
-                                href = 'https://www.uniprot.org/' + href
-                            link_urls.append(href)
-                    
-                    if link_urls:
-                        cell_text = f"{cell_text} | Links: {'; '.join(link_urls)}"
-                
-                row_data.append(cell_text)
+    success_count = int((df_entry_results['Entry ID'] != "").sum())
+    total_count = len(df_entry_results)
+    fail_count = total_count - success_count
+    
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Tổng số", total_count)
+    with col2:
+        st.metric("Thành công", success_count)
+    with col3:
+        st.metric("Thất bại", fail_count)
+    with col4:
+        st.metric("Tỷ lệ thành công", f"{success_count/total_count*100:.1f}%" if total_count else "-")
+    
+    with st.expander("📋 Chi tiết Entry IDs", expanded=False):
+        statuses = st.multiselect("Trạng thái", sorted(df_entry_results['Status'].unique()), key=f"status_{job.id}")
+        entries = df_entry_results[df_entry_results['Status'].isin(statuses)] if statuses else df_entry_results
+        show_page(entries, f"entries_{job.id}")
+    
+    if explorer.records is not None:
+        st.markdown("### 🧬 Kết quả 3D Structure")
+        
+        unique_proteins = len(explorer.summary)
+        total_structures = len(explorer.records)
+        
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Tổng dòng dữ liệu", total_structures)
+        with col2:
+            st.metric("Số proteins", unique_proteins)
+        with col3:
+            st.metric("Trung bình/protein", f"{total_structures/unique_proteins:.1f}")
+        
+        with st.expander("🧾 Tổng hợp theo protein", expanded=False):
+            show_page(explorer.summary, f"summary_{job.id}")
+        
+        with st.expander("🔬 Chi tiết 3D Structure", expanded=True):
+            col_method, col_source, col_resolution, col_protein = st.columns(4)
+            with col_method:
+                methods = st.multiselect("Method", explorer.options('Method'), key=f"methods_{job.id}")
+            with col_source:
+                sources = st.multiselect("Source", explorer.options('Source'), key=f"sources_{job.id}")
+            with col_resolution:
+                max_resolution = st.number_input("Resolution tối đa (Å, 0 = tất cả)", min_value=0.0, value=0.0,
+                                                 step=0.5, key=f"resolution_{job.id}")
+            with col_protein:
+                protein = st.text_input("Protein (Query/Entry Name)", key=f"protein_{job.id}")
             
-            if row_data and any(cell.strip() for cell in row_data):
-                while len(row_data) < len(headers):
-                    row_data.append("")
-                
-                full_row = [query, entry_name] + row_data[:len(headers)]
-                data.append(full_row)
+            filtered = explorer.filter(methods, sources, max_resolution or None, protein)
+            show_page(filtered, f"structures_{job.id}",
+                      column_config={'Links': st.column_config.ListColumn("Links")})
+            if len(filtered) < total_structures:
+                st.download_button(
+                    label=f"📥 Tải {len(filtered)} dòng đang lọc (.csv)",
+                    data=explorer.filtered_csv(),
+                    file_name="3D_Structures_filtered.csv",
+                    mime="text/csv",
+                    key=f"filtered_{job.id}"
+                )
+        
+        if result['changes'] is not None:
+            show_changes(result['changes'], result['sync_stats'], key=f"changes_{job.id}")
+        
+        st.markdown("### 💾 Tải xuống kết quả")
+        
+        st.download_button(
+            label="📥 Tải xuống kết quả Excel",
+            data=explorer.file_bytes('xlsx'),
+            file_name=os.path.basename(result['xlsx_path']),
+            mime=XLSX_MIME,
+            use_container_width=True,
+            key=f"xlsx_{job.id}"
+        )
+        if result['parquet_path']:
+            st.download_button(
+                label="📥 Tải bảng có kiểu (.parquet)",
+                data=explorer.file_bytes('parquet'),
+                file_name=os.path.basename(result['parquet_path']),
+                mime="application/vnd.apache.parquet",
+                use_container_width=True,
+                key=f"parquet_{job.id}"
+            )
         
-        if data:
-            full_headers = ['Query', 'Entry Name'] + headers
-            logger.info(f"Lấy được {len(data)} dòng dữ liệu cho {query}")
-            return data, full_headers
-        else:
-            logger.warning(f"Không có dữ liệu cho {query}")
-            return None
-            
-    except Exception as e:
-        logger.error(f"Lỗi khi lấy dữ liệu 3D structure cho {query}: {e}")
-        return None
-    finally:
-        try:
-            driver.quit()
-        except:
-            pass
-
-def calculate_time_estimate(total_items, current_item, start_time):
-    """Tính toán thời gian ước tính"""
-    if current_item == 0:
-        return "Đang tính toán..."
+        if result['package_path']:
+            show_download_results(result['downloader'], result['package_path'], key=f"structures_{job.id}")
+    else:
+        st.warning("⚠️ Không lấy được dữ liệu 3D structure nào")
     
-    elapsed_time = time.time() - start_time
-    avg_time_per_item = elapsed_time / current_item
-    remaining_items = total_items - current_item
-    estimated_remaining = remaining_items * avg_time_per_item
+    if result['spans'] is not None:
+        show_timing_panel(result['spans'], key=job.id)
+
+def show_partial_results(job):
+    """Kết quả đã ghi được của job đang chạy, bị hủy hoặc lỗi
     
-    minutes = int(estimated_remaining // 60)
-    seconds = int(estimated_remaining % 60)
+    File CSV/Excel chỉ được đọc khi người dùng bấm nút (fragment chạy lại mỗi giây),
+    bản đã tạo được giữ trong phiên cho tới khi job xong.
+    """
+    exporter = job.exporter
+    if exporter is None or not os.path.exists(exporter.structures_path):
+        return
     
-    if minutes > 0:
-        return f"Còn khoảng {minutes} phút {seconds} giây"
-    else:
-        return f"Còn khoảng {seconds} giây"
+    st.markdown("**📂 Kết quả tạm thời**")
+    st.caption(f"Thư mục: `{exporter.run_dir}` - đã ghi {exporter.rows_written} dòng 3D structure")
+    partials = st.session_state.setdefault('partial_results', {})
+    if st.button("📊 Tạo file từ kết quả tạm thời", key=f"partial_{job.id}"):
+        with open(exporter.structures_path, 'rb') as f:
+            structures_csv = f.read()
+        partials[job.id] = {
+            'rows': exporter.rows_written,
+            'csv': structures_csv,
+            'xlsx': build_partial_xlsx(exporter.run_dir)
+        }
+    
+    partial = partials.get(job.id)
+    if partial is None:
+        return
+    st.caption(f"Bản đã tạo gồm {partial['rows']} dòng, bấm nút trên để cập nhật")
+    col_csv, col_xlsx = st.columns(2)
+    with col_csv:
+        st.download_button(
+            label="📥 Tải 3D_Structures.csv",
+            data=partial['csv'],
+            file_name="3D_Structures_partial.csv",
+            mime="text/csv",
+            key=f"partial_csv_{job.id}"
+        )
+    with col_xlsx:
+        st.download_button(
+            label="📥 Tải file Excel tạm thời",
+            data=partial['xlsx'],
+            file_name="UniProt_3D_Structures_partial.xlsx",
+            mime=XLSX_MIME,
+            key=f"partial_xlsx_{job.id}"
+        )
 
-def process_complete_workflow(df_input):
-    """Xử lý toàn bộ workflow"""
-    progress_container = st.container()
+def show_jobs_panel():
+    """Danh sách job của phiên hiện tại; tự làm mới khi còn job đang chạy"""
+    job_ids = st.session_state.get('job_ids')
+    if not job_ids:
+        return
     
-    with progress_container:
-        st.markdown("### 🔄 Đang xử lý dữ liệu...")
-        
-        overall_progress = st.progress(0)
-        current_step = st.empty()
-        step_progress = st.progress(0)
-        status_text = st.empty()
-        time_estimate = st.empty()
-        
-        stats_container = st.container()
-        
-        start_time = time.time()
-        
-        # Bước 1: Lấy Entry IDs
-        current_step.markdown("**🔍 Bước 1/2: Lấy Entry IDs từ UniProt**")
-        
-        results = []
-        total_rows = len(df_input)
-        success_count = 0
-        
-        for index, row in df_input.iterrows():
-            query = str(row['Query']).strip()
-            entry_name = str(row['Entry Name']).strip()
-            
-            current_progress = (index + 1) / total_rows
-            step_progress.progress(current_progress)
-            overall_progress.progress(current_progress * 0.4)
-            
-            status_text.text(f"Đang xử lý {index + 1}/{total_rows}: {query}")
-            
-            if index > 0:
-                time_est = calculate_time_estimate(total_rows, index + 1, start_time)
-                time_estimate.text(f"⏱️ {time_est}")
-            
-            entry_id = get_entry_from_uniprot_selenium(query, entry_name)
-            
-            if entry_id:
-                final_url = f"https://www.uniprot.org/uniprotkb/{entry_id}/entry#structure"
-                status = "✅ Thành công"
-                success_count += 1
+    # Job đã bị runner bỏ khỏi lịch sử thì phiên cũng bỏ luôn kết quả đã dựng
+    jobs = get_job_runner().jobs(job_ids)
+    live_ids = {job.id for job in jobs}
+    st.session_state['job_ids'] = [job_id for job_id in job_ids if job_id in live_ids]
+    for key in ['result_explorers', 'partial_results']:
+        built = st.session_state.get(key, {})
+        for job_id in [job_id for job_id in built if job_id not in live_ids]:
+            del built[job_id]
+    if not jobs:
+        return
+    
+    # Streamlit không tự đẩy cập nhật từ luồng nền: khi còn job đang chạy chỉ fragment này
+    # tự chạy lại theo chu kỳ, phần còn lại của trang (và file upload) không bị xử lý lại
+    polling = any(job.active for job in jobs)
+    job_ids = st.session_state['job_ids']
+    st.fragment(_show_jobs, run_every=JOB_POLL_SECONDS if polling else None)(job_ids, polling)
+
+def _show_jobs(job_ids, polling):
+    """Nội dung panel job, chạy trong fragment"""
+    runner = get_job_runner()
+    jobs = runner.jobs(job_ids)
+    st.markdown("### 🗂️ Các lần xử lý")
+    for job in jobs:
+        started = datetime.fromtimestamp(job.created_at).strftime("%H:%M:%S")
+        with st.expander(f"{job.label} - {job.status} ({started})", expanded=job is jobs[0] or job.active):
+            if job.active:
+                if job.status == JOB_QUEUED:
+                    st.info("⏳ Đang chờ đến lượt...")
+                StreamlitProgress(exporter=job.exporter).show_job(job)
+                if st.button("⏹️ Hủy", key=f"cancel_{job.id}"):
+                    runner.cancel(job.id)
+                    st.rerun()
+                show_partial_results(job)
+            elif job.status == JOB_DONE:
+                st.session_state.get('partial_results', {}).pop(job.id, None)
+                show_job_results(job)
+            elif job.status == JOB_FAILED:
+                st.error(f"❌ Lỗi: {job.error}")
+                show_partial_results(job)
             else:
-                final_url = ""
-                status = "❌ Không tìm thấy"
-            
-            results.append({
-                'Query': query,
-                'Entry Name': entry_name,
-                'Entry ID': entry_id if entry_id else "",
-                'Final URL': final_url,
-                'Status': status
-            })
-            
-            with stats_container:
-                col1, col2, col3, col4 = st.columns(4)
-                with col1:
-                    st.metric("Đã xử lý", f"{index + 1}/{total_rows}")
-                with col2:
-                    st.metric("Thành công", success_count)
-                with col3:
-                    st.metric("Thất bại", (index + 1) - success_count)
-                with col4:
-                    success_rate = (success_count / (index + 1)) * 100
-                    st.metric("Tỷ lệ thành công", f"{success_rate:.1f}%")
-            
-            time.sleep(3)
-        
-        step_progress.progress(1.0)
-        overall_progress.progress(0.4)
-        
-        df_entry_results = pd.DataFrame(results)
-        
-        # Bước 2: Lấy 3D Structure data
-        current_step.markdown("**🧬 Bước 2/2: Lấy dữ liệu 3D Structure**")
-        
-        valid_results = df_entry_results[df_entry_results['Entry ID'] != ""]
-        
-        if len(valid_results) == 0:
-            st.error("❌ Không có Entry ID nào hợp lệ")
-            return df_entry_results, None
-        
-        all_structure_data = []
-        all_headers = None
-        structure_count = 0
-        
-        step2_start_time = time.time()
-        
-        for idx, (index, row) in enumerate(valid_results.iterrows()):
-            query = row['Query']
-            entry_name = row['Entry Name']
-            final_url = row['Final URL']
-            
-            current_progress = (idx + 1) / len(valid_results)
-            step_progress.progress(current_progress)
-            overall_progress.progress(0.4 + (current_progress * 0.6))
-            
-            status_text.text(f"Đang lấy 3D structure {idx + 1}/{len(valid_results)}: {query}")
-            
-            if idx > 0:
-                time_est = calculate_time_estimate(len(valid_results), idx + 1, step2_start_time)
-                time_estimate.text(f"⏱️ {time_est}")
-            
-            result = extract_3d_structure_table(final_url, query, entry_name)
-            
-            if result:
-                data, headers = result
-                if all_headers is None:
-                    all_headers = headers
-                all_structure_data.extend(data)
-                structure_count += len(data)
-            
-            with stats_container:
-                col1, col2, col3, col4 = st.columns(4)
-                with col1:
-                    st.metric("Proteins đã xử lý", f"{idx + 1}/{len(valid_results)}")
-                with col2:
-                    st.metric("Structures tìm thấy", structure_count)
-                with col3:
-                    st.metric("Trung bình/protein", f"{structure_count/(idx+1):.1f}" if idx >= 0 else "0")
-                with col4:
-                    completion_rate = ((idx + 1) / len(valid_results)) * 100
-                    st.metric("Hoàn thành", f"{completion_rate:.1f}%")
-            
-            time.sleep(4)
-        
-        overall_progress.progress(1.0)
-        step_progress.progress(1.0)
-        status_text.text("✅ Hoàn thành tất cả!")
-        
-        total_time = time.time() - start_time
-        minutes = int(total_time // 60)
-        seconds = int(total_time % 60)
-        time_estimate.text(f"🎉 Hoàn thành trong {minutes} phút {seconds} giây!")
-        
-        if all_structure_data:
-            df_final_results = pd.DataFrame(all_structure_data, columns=all_headers)
-            return df_entry_results, df_final_results
-        else:
-            return df_entry_results, None
+                st.info("⏹️ Đã hủy. Các dòng đã xong được lưu trong checkpoint, chạy lại sẽ tiếp tục từ chỗ dừng.")
+                show_partial_results(job)
+    
+    # Hết job đang chạy thì chạy lại cả trang một lần để dừng tự làm mới
+    if polling and not any(job.active for job in jobs):
+        st.rerun()
 
 def main():
     """Hàm chính"""
+    # Cấu hình trang
+    st.set_page_config(
+        page_title="UniProt 3D Structure Extractor",
+        page_icon="🧬",
+        layout="wide",
+        initial_sidebar_state="collapsed"
+    )
+    
     st.markdown("# 🧬 UniProt 3D Structure Extractor")
     st.markdown("Trích xuất thông tin cấu trúc 3D từ UniProt Database")
     
     # Test driver
     with st.expander("🔧 Kiểm tra hệ thống", expanded=False):
-        if st.button("🧪 Test Browser Driver"):
+        browser_setup = get_browser_setup()
+        st.caption(f"🌐 {browser_setup.describe()}")
+        col_test, col_refresh = st.columns(2)
+        with col_test:
+            run_test = st.button("🧪 Test Browser Driver")
+        with col_refresh:
+            refresh_test = st.button("🔁 Kiểm tra lại")
+        if run_test or refresh_test:
             with st.spinner("Đang test driver..."):
-                success, message = test_driver()
+                success, message = test_driver(refresh=refresh_test)
+                if not refresh_test and browser_setup.checked_at:
+                    message = f"{message} (kiểm tra lúc {browser_setup.checked_at.strftime('%H:%M:%S')})"
                 if success:
                     st.success(f"✅ {message}")
                 else:
                     st.error(f"❌ {message}")
+        
+        cache = get_response_cache()
+        st.caption(f"💾 Cache: {cache.size()} mục tại `{cache.path}`")
+        if st.button("🗑️ Xóa cache"):
+            cache.clear()
+            st.success("✅ Đã xóa cache")
+        
+        accession_index = get_accession_index()
+        if accession_index is not None:
+            st.caption(f"📚 Index offline: {accession_index.size()} Entry Name tại `{accession_index.path}`")
+        else:
+            st.caption(
+                "📚 Chưa có index offline, dựng bằng "
+                "`python App.py build-index HUMAN_9606_idmapping.dat.gz`"
+            )
     
     # Upload section
     st.markdown("### 📁 Upload File Excel")
-    st.markdown("File Excel cần có **2 cột**: `Query` và `Entry Name`")
+    st.markdown(
+        "File Excel/CSV/TSV cần có **2 cột**: `Query` và `Entry Name`, "
+        "hoặc file .txt mỗi dòng một mã (vd: `TP53 P53_HUMAN` hoặc `P53_HUMAN`)"
+    )
     
     uploaded_file = st.file_uploader(
         "Chọn file Excel",
-        type=['xlsx', 'xls'],
+        type=['xlsx', 'xls', 'csv', 'tsv', 'txt'],
         help="File Excel với 2 cột: Query và Entry Name"
     )
     
     if uploaded_file is not None:
         try:
-            df_input = pd.read_excel(uploaded_file)
-            
-            required_columns = ['Query', 'Entry Name']
-            missing_columns = [col for col in required_columns if col not in df_input.columns]
+            # Kiểm tra cột từ dòng header trước khi đọc toàn bộ file, file đã đọc được giữ trong phiên
+            uploaded_input = get_uploaded_input(uploaded_file)
+            columns = uploaded_input['columns']
+            missing_columns = [col for col in REQUIRED_COLUMNS if col not in columns]
             
             if missing_columns:
                 st.error(f"❌ File thiếu cột: {missing_columns}")
-                st.error(f"Các cột hiện tại: {list(df_input.columns)}")
+                st.error(f"Các cột hiện tại: {columns}")
                 return
             
+            df_input = uploaded_input['df_input']
+            
             st.success(f"✅ File hợp lệ - {len(df_input)} dòng dữ liệu")
             
-            estimated_time = len(df_input) * 12
+            max_workers = st.number_input(
+                "Số luồng xử lý song song",
+                min_value=1,
+                max_value=16,
+                value=MAX_WORKERS,
+                help="Số browser chạy đồng thời, tốc độ request tới UniProt vẫn được giới hạn chung"
+            )
+            
+            force_refresh = st.checkbox(
+                "🔄 Bỏ qua cache (force refresh)",
+                value=False,
+                help="Tra cứu lại toàn bộ từ UniProt và ghi đè kết quả đã lưu"
+            )
+            
+            use_index = False
+            if get_accession_index() is not None:
+                use_index = st.checkbox(
+                    "📚 Tra index offline trước",
+                    value=True,
+                    help="Entry Name có trong index được lấy accession ngay, chỉ các dòng còn lại mới gọi UniProt"
+                )
+            
+            delta_sync = st.checkbox(
+                "🔁 Chỉ lấy lại entry đã thay đổi (delta-sync)",
+                value=os.path.exists(SYNC_STATE_PATH),
+                help="So version entry trên UniProt với lần chạy trước, entry không đổi dùng lại kết quả đã lưu; "
+                     "file Excel có thêm sheet Structure_Changes"
+            )
+            
+            download_structures = st.checkbox(
+                "📦 Tải file cấu trúc (mmCIF từ RCSB, model AlphaFold)",
+                value=False,
+                help=f"File đã tải ở lần trước trong `{STRUCTURE_DOWNLOAD_DIR}` sẽ được bỏ qua"
+            )
+            if download_structures:
+                col_methods, col_resolution, col_options = st.columns(3)
+                with col_methods:
+                    download_methods = st.multiselect("Method", STRUCTURE_METHODS, default=STRUCTURE_METHODS)
+                with col_resolution:
+                    max_resolution = st.number_input(
+                        "Resolution tối đa (Å, 0 = không giới hạn)", min_value=0.0, value=0.0, step=0.5
+                    )
+                with col_options:
+                    include_alphafold = st.checkbox("Gồm model AlphaFold", value=True)
+                    zip_structures = st.checkbox("Đóng gói file .zip", value=True)
+            
+            # Checkpoint theo nội dung file: upload lại cùng file sẽ chạy tiếp
+            checkpoint = get_job_checkpoint(uploaded_input['job_id'])
+            # Job khác đang ghi vào checkpoint này thì không cho xóa checkpoint hay chạy song song
+            active_job = get_job_runner().active_job(checkpoint.job_id)
+            checkpoint_summary = checkpoint.summary()
+            retry_failed = False
+            resume = False
+            if checkpoint_summary:
+                # Chỉ chạy tiếp khi lần trước bị ngắt giữa chừng; chạy lại file đã xong (vd: hàng tuần)
+                # thì lấy dữ liệu mới, để cache TTL và delta-sync quyết định entry nào cần gọi UniProt
+                interrupted = checkpoint_summary.get('pending', 0) + checkpoint_summary.get('resolved', 0) > 0
+                st.info(
+                    "📌 File này đã được xử lý trước đó - "
+                    f"xong: {checkpoint_summary.get('extracted', 0)}, "
+                    f"đã có Entry ID: {checkpoint_summary.get('resolved', 0)}, "
+                    f"chờ: {checkpoint_summary.get('pending', 0)}, "
+                    f"thất bại: {checkpoint_summary.get('failed', 0)}."
+                )
+                col_resume, col_retry, col_reset = st.columns(3)
+                with col_resume:
+                    resume = st.checkbox("▶️ Chạy tiếp, bỏ qua các dòng đã xong", value=interrupted)
+                with col_retry:
+                    retry_failed = st.checkbox("🔁 Thử lại các dòng thất bại", value=False, disabled=not resume)
+                with col_reset:
+                    if st.button("♻️ Xử lý lại từ đầu", disabled=active_job is not None):
+                        checkpoint.clear()
+                        st.rerun()
+            
+            estimated_time = len(df_input) * 12 // max_workers
             est_minutes = estimated_time // 60
             est_seconds = estimated_time % 60
             
@@ -558,79 +710,49 @@ def main():
             with st.expander("👀 Xem trước dữ liệu", expanded=True):
                 st.dataframe(df_input.head(10), use_container_width=True)
             
+            if active_job is not None:
+                st.warning(f"⏳ File này đang được xử lý ({active_job.label} - {active_job.status}), "
+                           "hãy chờ xong hoặc hủy trước khi chạy lại")
+            
             col1, col2, col3 = st.columns([1, 2, 1])
             with col2:
-                if st.button("🚀 Bắt đầu xử lý", type="primary", use_container_width=True):
+                if st.button("🚀 Bắt đầu xử lý", type="primary", use_container_width=True,
+                             disabled=active_job is not None):
+                    if not resume:
+                        checkpoint.clear()
+                    elif retry_failed:
+                        checkpoint.reset_failed()
                     
-                    df_entry_results, df_final_results = process_complete_workflow(df_input)
+                    exporter = create_run_exporter()
+                    downloader = None
+                    if download_structures:
+                        downloader = StructureDownloader(
+                            methods=download_methods, max_resolution=max_resolution or None,
+                            include_alphafold=include_alphafold
+                        )
                     
-                    if df_entry_results is not None:
-                        st.markdown("### 📊 Kết quả Entry IDs")
-                        
-                        success_count = len(df_entry_results[df_entry_results['Entry ID'] != ""])
-                        total_count = len(df_entry_results)
-                        fail_count = total_count - success_count
-                        
-                        col1, col2, col3, col4 = st.columns(4)
-                        with col1:
-                            st.metric("Tổng số", total_count)
-                        with col2:
-                            st.metric("Thành công", success_count)
-                        with col3:
-                            st.metric("Thất bại", fail_count)
-                        with col4:
-                            st.metric("Tỷ lệ thành công", f"{success_count/total_count*100:.1f}%")
-                        
-                        with st.expander("📋 Chi tiết Entry IDs", expanded=False):
-                            st.dataframe(df_entry_results, use_container_width=True)
-                        
-                        if df_final_results is not None:
-                            st.markdown("### 🧬 Kết quả 3D Structure")
-                            
-                            unique_proteins = df_final_results['Query'].nunique()
-                            total_structures = len(df_final_results)
-                            
-                            col1, col2, col3 = st.columns(3)
-                            with col1:
-                                st.metric("Tổng dòng dữ liệu", total_structures)
-                            with col2:
-                                st.metric("Số proteins", unique_proteins)
-                            with col3:
-                                st.metric("Trung bình/protein", f"{total_structures/unique_proteins:.1f}")
-                            
-                            with st.expander("🔬 Chi tiết 3D Structure", expanded=True):
-                                st.dataframe(df_final_results, use_container_width=True)
-                            
-                            st.markdown("### 💾 Tải xuống kết quả")
-                            
-                            output = io.BytesIO()
-                            with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                                df_final_results.to_excel(writer, sheet_name='3D_Structures', index=False)
-                                df_entry_results.to_excel(writer, sheet_name='Entry_IDs', index=False)
-                            
-                            output.seek(0)
-                            
-                            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                            filename = f"UniProt_3D_Structures_{timestamp}.xlsx"
-                            
-                            st.download_button(
-                                label="📥 Tải xuống kết quả Excel",
-                                data=output.getvalue(),
-                                file_name=filename,
-                                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                                use_container_width=True
-                            )
-                            
-                        else:
-                            st.warning("⚠️ Không lấy được dữ liệu 3D structure nào")
-                    else:
-                        st.error("❌ Không thể xử lý dữ liệu")
+                    # Chạy nền: đóng tab hay tương tác với giao diện không làm dừng job
+                    job = get_job_runner().submit(
+                        uploaded_file.name, df_input, exporter, spans=SpanRecorder(), downloader=downloader,
+                        zip_structures=download_structures and zip_structures, max_workers=max_workers,
+                        cache=get_response_cache(), force_refresh=force_refresh, checkpoint=checkpoint,
+                        index=get_accession_index() if use_index else None,
+                        sync=DeltaSync() if delta_sync else None
+                    )
+                    st.session_state.setdefault('job_ids', []).append(job.id)
+                    st.toast(f"🚀 Đã đưa `{uploaded_file.name}` vào hàng đợi")
         
         except Exception as e:
             st.error(f"❌ Lỗi khi đọc file: {str(e)}")
     
+    show_jobs_panel()
+    
     st.markdown("---")
     st.markdown("**🔬 UniProt 3D Structure Extractor** - Văn Quân Bùi")
 
 if __name__ == "__main__":
-    main()
+    # `streamlit run App.py` chạy giao diện, `python App.py run ...` chạy dòng lệnh
+    if st.runtime.exists():
+        main()
+    else:
+        sys.exit(cli_main())
@@ -0,0 +1,182 @@
+"""So sánh tốc độ parse bảng 3D structure: lxml (parse_structure_table) và BeautifulSoup
+
+Chạy: python benchmarks/bench_parse.py [trang_da_luu.html ...]
+Không truyền file thì dùng trang giả lập có cấu trúc giống trang entry của UniProt.
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import uniprot_pipeline as pipeline
+
+def synthetic_page(structure_rows=200, other_tables=20, other_rows=30):
+    """Trang HTML giả lập: nhiều bảng không liên quan và một bảng trong #structure"""
+    parts = ["<html><head><title>P04637 · P53_HUMAN</title></head><body><nav>"]
+    parts.extend(f"<a href='/menu/{i}'>Menu {i}</a>" for i in range(200))
+    parts.append("</nav>")
+    
+    for t in range(other_tables):
+        parts.append(f"<section id='section-{t}'><table><thead><tr><th>Feature</th><th>Position</th>"
+                     "<th>Description</th></tr></thead><tbody>")
+        parts.extend(f"<tr><td>Region {r}</td><td>{r}-{r + 10}</td><td><span>Note</span> {r}</td></tr>"
+                     for r in range(other_rows))
+        parts.append("</tbody></table></section>")
+    
+    parts.append("<section id='structure'><h2>Structure</h2><table><thead><tr>"
+                 + ''.join(f"<th>{column}</th>" for column in pipeline.STRUCTURE_COLUMNS)
+                 + "</tr></thead><tbody>")
+    for r in range(structure_rows):
+        pdb_id = f"{r % 10}X{r:02d}"
+        parts.append(
+            f"<tr><td>PDB</td><td>{pdb_id}</td><td>X-ray</td><td>{1.5 + r % 20 / 10:.2f} Å</td><td>A/B</td>"
+            f"<td>94-312</td><td><a href='https://www.rcsb.org/structure/{pdb_id}'>RCSB-PDB</a>"
+            f"<a href='/uniprotkb/P04637/entry'>PDBe</a></td></tr>"
+        )
+    parts.append("</tbody></table></section></body></html>")
+    return ''.join(parts)
+
+def parse_structure_table_soup(html_content, query, entry_name):
+    """Bản parse bằng BeautifulSoup trước khi chuyển sang lxml, giữ lại làm mốc so sánh"""
+    from bs4 import BeautifulSoup
+    
+    soup = BeautifulSoup(html_content, 'html.parser')
+    
+    # Tìm bảng 3D structure
+    table = None
+    tables = soup.find_all('table')
+    
+    for t in tables:
+        headers = []
+        thead = t.find('thead')
+        if thead:
+            header_cells = thead.find_all(['th', 'td'])
+            headers = [cell.get_text(strip=True).upper() for cell in header_cells]
+        else:
+            first_row = t.find('tr')
+            if first_row:
+                header_cells = first_row.find_all(['th', 'td'])
+                headers = [cell.get_text(strip=True).upper() for cell in header_cells]
+    
+        matching_keywords = sum(1 for keyword in pipeline.STRUCTURE_KEYWORDS if keyword in ' '.join(headers))
+        if matching_keywords >= 3:
+            table = t
+            break
+    
+    if not table:
+        for t in tables:
+            table_text = t.get_text().upper()
+            if ('ALPHAFOLD' in table_text or 'PDB' in table_text or 'AF-' in table_text) and len(t.find_all('tr')) > 1:
+                table = t
+                break
+    
+    if not table:
+        return None
+    
+    # Lấy headers
+    headers = []
+    thead = table.find('thead')
+    if thead:
+        header_row = thead.find('tr')
+        if header_row:
+            for th in header_row.find_all(['th', 'td']):
+                header_text = th.get_text(strip=True)
+                if header_text:
+                    headers.append(header_text)
+    
+    if not headers:
+        first_row = table.find('tr')
+        if first_row:
+            header_cells = first_row.find_all(['th', 'td'])
+            for cell in header_cells:
+                header_text = cell.get_text(strip=True)
+                if header_text:
+                    headers.append(header_text)
+    
+    # Lấy dữ liệu
+    data = []
+    tbody = table.find('tbody')
+    if tbody:
+        rows = tbody.find_all('tr')
+    else:
+        all_rows = table.find_all('tr')
+        if all_rows and headers:
+            rows = all_rows[1:]
+        else:
+            rows = all_rows
+    
+    for row in rows:
+        cells = row.find_all(['td', 'th'])
+        row_data = []
+    
+        for cell in cells:
+            cell_text = cell.get_text(strip=True)
+        
+            links = cell.find_all('a')
+            if links:
+                link_urls = []
+                for link in links:
+                    href = link.get('href', '')
+                    if href:
+                        if href.startswith('/'):
+                            href = 'https://www.uniprot.org' + href
+                        elif not href.startswith('http'):
+                            href = 'https://www.uniprot.org/' + href
+                        link_urls.append(href)
+            
+                if link_urls:
+                    cell_text = f"{cell_text} | Links: {'; '.join(link_urls)}"
+        
+            row_data.append(cell_text)
+    
+        if row_data and any(cell.strip() for cell in row_data):
+            while len(row_data) < len(headers):
+                row_data.append("")
+        
+            full_row = [query, entry_name] + row_data[:len(headers)]
+            data.append(full_row)
+    
+    if data:
+        full_headers = ['Query', 'Entry Name'] + headers
+        return data, full_headers
+    else:
+        return None
+
+def parse_with_soup(html):
+    result = parse_structure_table_soup(html, 'TP53', 'P53_HUMAN')
+    return pipeline._normalize_structure_rows(*result) if result else None
+
+def parse_with_lxml(html):
+    result = pipeline.parse_structure_table(html, 'TP53', 'P53_HUMAN')
+    return result[0] if result else None
+
+def bench(name, html, repeat):
+    soup_rows, lxml_rows = parse_with_soup(html), parse_with_lxml(html)
+    if soup_rows != lxml_rows:
+        print(f"{name}: kết quả hai cách parse khác nhau", file=sys.stderr)
+    
+    soup_time = min(timeit.repeat(lambda: parse_with_soup(html), number=1, repeat=repeat))
+    lxml_time = min(timeit.repeat(lambda: parse_with_lxml(html), number=1, repeat=repeat))
+    rows = len(lxml_rows) if lxml_rows else 0
+    print(f"{name}: {len(html) / 1024:.0f} KB, {rows} dòng | "
+          f"BeautifulSoup {soup_time * 1000:.1f} ms | lxml {lxml_time * 1000:.1f} ms | "
+          f"nhanh hơn {soup_time / lxml_time:.1f}x")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('pages', nargs='*', help="Các trang entry UniProt đã lưu (.html)")
+    parser.add_argument('-r', '--repeat', type=int, default=5, help="Số lần đo, lấy thời gian nhỏ nhất")
+    args = parser.parse_args()
+    
+    if args.pages:
+        for path in args.pages:
+            with open(path, encoding='utf-8') as f:
+                bench(os.path.basename(path), f.read(), args.repeat)
+    else:
+        for rows in (20, 200, 1000):
+            bench(f"synthetic-{rows}", synthetic_page(structure_rows=rows), args.repeat)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""Benchmark pipeline trên server giả lập: bước 1, bước 2 và end-to-end
+
+Chạy: python benchmarks/bench_pipeline.py [--rows 10 100 1000] [--workers 1 4 8] [--latency 20]
+Mỗi kịch bản chạy trong một process riêng để đo peak RSS độc lập. Kết quả gồm
+throughput (dòng/giây), p50/p95 thời gian xử lý một dòng (request tra cứu Entry ID
+hoặc lấy 3D structure mà dòng đó phải chờ) và peak RSS.
+"""
+import argparse
+import csv
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import fixtures
+
+SCENARIOS = ['entries', 'structures', 'html', 'e2e']
+
+# Tỷ lệ dòng có Entry Name không hợp lệ, buộc pipeline tra từng dòng
+INVALID_ROW_RATIO = 0.05
+
+def benchmark_rows(proteins, count):
+    """Dòng đầu vào lặp lại trên bộ protein (giống file thật có Query trùng nhau)"""
+    rows = []
+    for i in range(count):
+        protein = proteins[i % len(proteins)]
+        entry_name = protein['entry_name']
+        if i % int(1 / INVALID_ROW_RATIO) == 1:
+            entry_name = entry_name.replace('_', '-')
+        rows.append((protein['query'], entry_name))
+    return rows
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss tính bằng KB trên Linux, byte trên macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def percentile(samples, fraction):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+class LatencyRecorder:
+    """Bọc các hàm xử lý từng dòng của uniprot_pipeline để ghi lại thời gian mỗi lần gọi"""
+
+    def __init__(self, app):
+        self.samples = []
+        self._lock = threading.Lock()
+        app.get_entry_id = self._timed(app.get_entry_id)
+        app.get_structure_rows = self._timed(app.get_structure_rows)
+        # Mỗi Entry Name trong lô phải chờ cả truy vấn của lô
+        app.fetch_accessions_by_entry_names = self._timed(
+            app.fetch_accessions_by_entry_names, weight=lambda args: len(args[0])
+        )
+
+    def _timed(self, func, weight=None):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                with self._lock:
+                    self.samples.extend([elapsed] * (weight(args) if weight else 1))
+        return wrapper
+
+class _StopAfterEntries(Exception):
+    pass
+
+def run_scenario(scenario, rows, workers, fixture_dir):
+    """Chạy một kịch bản trong process hiện tại (UNIPROT_REST_URL đã trỏ tới server giả lập)"""
+    import uniprot_pipeline as pipeline
+    pipeline.USE_SELENIUM_FALLBACK = False
+    recorder = LatencyRecorder(pipeline)
+    
+    proteins = fixtures.load_proteins(fixture_dir)
+    input_rows = benchmark_rows(proteins, rows)
+    df_input = pipeline.pd.DataFrame(input_rows, columns=pipeline.REQUIRED_COLUMNS)
+    
+    start = time.perf_counter()
+    if scenario == 'entries':
+        def stop_after_entries(stage, done, total, **info):
+            if stage != 'entries':
+                raise _StopAfterEntries()
+        try:
+            pipeline.run_pipeline(df_input, max_workers=workers, progress_callback=stop_after_entries)
+        except _StopAfterEntries:
+            pass
+    elif scenario == 'structures':
+        accessions = [proteins[i % len(proteins)]['accession'] for i in range(rows)]
+        unique = list(dict.fromkeys(accessions))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(lambda accession: pipeline.get_structure_rows(accession, ""), unique))
+    elif scenario == 'html':
+        # Parse trang entry đã ghi lại (phần việc của Selenium sau khi trang đã tải xong)
+        pages = {}
+        for i in range(rows):
+            accession = proteins[i % len(proteins)]['accession']
+            if accession not in pages:
+                with open(fixtures.structure_path(fixture_dir, accession), encoding='utf-8') as f:
+                    pages[accession] = f.read()
+            row_start = time.perf_counter()
+            pipeline.parse_structure_table(pages[accession], accession, "")
+            recorder.samples.append(time.perf_counter() - row_start)
+    elif scenario == 'e2e':
+        with tempfile.TemporaryDirectory() as run_dir:
+            exporter = pipeline.StreamingExporter(run_dir)
+            df_entries, df_structures = pipeline.run_pipeline(df_input, max_workers=workers, exporter=exporter)
+            structure_rows = df_structures.itertuples(index=False) if df_structures is not None else []
+            exporter.write_xlsx(df_entries, structure_rows, "bench.xlsx")
+    else:
+        raise ValueError(f"Kịch bản không hợp lệ: {scenario}")
+    elapsed = time.perf_counter() - start
+    
+    p50, p95 = percentile(recorder.samples, 0.5), percentile(recorder.samples, 0.95)
+    peak_rss = peak_rss_mb()
+    return {
+        'scenario': scenario,
+        'rows': rows,
+        'workers': workers,
+        'seconds': round(elapsed, 3),
+        'rows_per_second': round(rows / elapsed, 1) if elapsed else None,
+        'p50_ms': round(p50 * 1000, 2) if p50 is not None else None,
+        'p95_ms': round(p95 * 1000, 2) if p95 is not None else None,
+        'peak_rss_mb': round(peak_rss, 1) if peak_rss is not None else None
+    }
+
+def run_in_subprocess(scenario, rows, workers, fixture_dir, base_url):
+    env = dict(os.environ, UNIPROT_REST_URL=base_url, UNIPROT_REST_REQUESTS_PER_SECOND="0")
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--single', scenario, str(rows), str(workers),
+         '--fixtures', fixture_dir],
+        env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def print_table(results):
+    columns = ['scenario', 'rows', 'workers', 'seconds', 'rows_per_second', 'p50_ms', 'p95_ms', 'peak_rss_mb']
+    widths = [max(len(column), *(len(str(result[column])) for result in results)) for column in columns]
+    print('  '.join(column.ljust(width) for column, width in zip(columns, widths)))
+    for result in results:
+        print('  '.join(str(result[column]).ljust(width) for column, width in zip(columns, widths)))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pipeline UniProt trên server giả lập")
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument('--rows', nargs='+', type=int, default=[10, 100, 1000])
+    parser.add_argument('--workers', nargs='+', type=int, default=[1, 4, 8])
+    parser.add_argument('--latency', type=float, default=20.0, help="Độ trễ giả lập mỗi request (ms)")
+    parser.add_argument('--fixtures', default=fixtures.DEFAULT_FIXTURE_DIR,
+                        help="Thư mục dữ liệu, tự sinh 300 protein giả lập nếu chưa có")
+    parser.add_argument('--output', help="Ghi kết quả ra file .json hoặc .csv")
+    parser.add_argument('--single', nargs=3, metavar=('SCENARIO', 'ROWS', 'WORKERS'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.single:
+        scenario, rows, workers = args.single
+        print(json.dumps(run_scenario(scenario, int(rows), int(workers), args.fixtures)))
+        return
+    
+    if not os.path.exists(os.path.join(args.fixtures, fixtures.PROTEINS_FILE)):
+        fixtures.synthesize(args.fixtures)
+    
+    import mock_server
+    server = mock_server.start_server(args.fixtures, latency=args.latency / 1000)
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    
+    results = []
+    try:
+        for scenario in args.scenarios:
+            for rows in args.rows:
+                # Parse HTML chạy một luồng, không phụ thuộc số worker
+                for workers in (args.workers[:1] if scenario == 'html' else args.workers):
+                    result = run_in_subprocess(scenario, rows, workers, args.fixtures, base_url)
+                    print(f"{scenario} rows={rows} workers={workers}: {result['rows_per_second']} dòng/giây",
+                          file=sys.stderr)
+                    results.append(result)
+    finally:
+        server.shutdown()
+    
+    print_table(results)
+    if args.output:
+        with open(args.output, 'w', newline='', encoding='utf-8') as f:
+            if args.output.endswith('.csv'):
+                writer = csv.DictWriter(f, fieldnames=list(results[0]))
+                writer.writeheader()
+                writer.writerows(results)
+            else:
+                json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""Bộ dữ liệu UniProt dùng cho benchmark: ghi lại từ UniProt thật hoặc sinh giả lập
+
+Cấu trúc thư mục:
+    proteins.json            danh sách {query, accession, entry_name}
+    search/<query>.tsv       kết quả tìm kiếm đã ghi lại (nếu có)
+    entries/<accession>.json entry JSON (cross-reference PDB/AlphaFoldDB)
+    structure/<accession>.html  trang entry với bảng 3D structure
+
+Chạy:
+    python benchmarks/fixtures.py synth -n 300 -o .cache/bench_fixtures
+    python benchmarks/fixtures.py record queries.txt -o benchmarks/recorded [--html]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DEFAULT_FIXTURE_DIR = os.path.join(".cache", "bench_fixtures")
+PROTEINS_FILE = "proteins.json"
+
+def load_proteins(fixture_dir):
+    with open(os.path.join(fixture_dir, PROTEINS_FILE), encoding='utf-8') as f:
+        return json.load(f)
+
+def _write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+def _safe_name(query):
+    return ''.join(c if c.isalnum() or c in '-_' else '_' for c in query)
+
+def search_path(fixture_dir, query):
+    return os.path.join(fixture_dir, "search", f"{_safe_name(query)}.tsv")
+
+def entry_path(fixture_dir, accession):
+    return os.path.join(fixture_dir, "entries", f"{accession}.json")
+
+def structure_path(fixture_dir, accession):
+    return os.path.join(fixture_dir, "structure", f"{accession}.html")
+
+def _synthetic_entry(accession, rng):
+    length = rng.randint(80, 1500)
+    xrefs = []
+    for i in range(rng.choice([0, 0, 1, 2, 4, 8, 20])):
+        start = rng.randint(1, length - 20)
+        end = rng.randint(start + 10, length)
+        method = rng.choice(['X-ray', 'X-ray', 'EM', 'NMR'])
+        resolution = '-' if method == 'NMR' else f"{rng.uniform(1.0, 4.0):.2f} A"
+        xrefs.append({
+            'database': 'PDB',
+            'id': f"{rng.randint(1, 9)}{''.join(rng.choice('ABCDEFGHJKLMNPQRSTUVWXYZ') for _ in range(3))}",
+            'properties': [
+                {'key': 'Method', 'value': method},
+                {'key': 'Resolution', 'value': resolution},
+                {'key': 'Chains', 'value': f"A/B={start}-{end}"}
+            ]
+        })
+    xrefs.append({'database': 'AlphaFoldDB', 'id': accession, 'properties': [{'key': 'Description', 'value': '-'}]})
+    return {'primaryAccession': accession, 'sequence': {'length': length}, 'uniProtKBCrossReferences': xrefs,
+            'entryAudit': {'entryVersion': rng.randint(1, 200), 'lastAnnotationUpdateDate': '2024-01-01'}}
+
+def structure_page(rows):
+    """Trang entry có mục #structure chứa bảng 3D structure (giống trang UniProt đã render)"""
+    import uniprot_pipeline as pipeline
+    parts = ["<html><body><nav>", ''.join(f"<a href='/menu/{i}'>Menu {i}</a>" for i in range(100)), "</nav>",
+             "<section id='function'><table><tr><th>Feature</th><th>Position</th></tr>",
+             ''.join(f"<tr><td>Region {i}</td><td>{i}-{i + 9}</td></tr>" for i in range(30)),
+             "</table></section><section id='structure'><table><thead><tr>",
+             ''.join(f"<th>{column}</th>" for column in pipeline.STRUCTURE_COLUMNS), "</tr></thead><tbody>"]
+    for row in rows:
+        cells = []
+        for value in row:
+            label, _, links = value.partition(" | Links: ")
+            anchors = ''.join(f"<a href='{url}'>{url.split('/')[2]}</a>" for url in links.split('; ') if url)
+            cells.append(f"<td>{label}{anchors}</td>")
+        parts.append(f"<tr>{''.join(cells)}</tr>")
+    parts.append("</tbody></table></section></body></html>")
+    return ''.join(parts)
+
+def _structure_rows(entry):
+    import uniprot_pipeline as pipeline
+    length = entry.get('sequence', {}).get('length')
+    rows = []
+    for xref in entry.get('uniProtKBCrossReferences', []):
+        if xref.get('database') == 'PDB':
+            rows.append(pipeline._pdb_structure_row(xref))
+        elif xref.get('database') == 'AlphaFoldDB':
+            rows.append(pipeline._alphafold_structure_row(xref, length))
+    return rows
+
+def synthesize(fixture_dir, count=300, seed=0):
+    """Sinh bộ dữ liệu giả lập có phân bố số structure/protein giống UniProt"""
+    rng = random.Random(seed)
+    proteins = []
+    for i in range(count):
+        accession = f"Q{i:05d}"
+        entry = _synthetic_entry(accession, rng)
+        proteins.append({'query': f"GENE{i}", 'accession': accession, 'entry_name': f"GENE{i}_HUMAN"})
+        _write(entry_path(fixture_dir, accession), json.dumps(entry))
+        _write(structure_path(fixture_dir, accession), structure_page(_structure_rows(entry)))
+    _write(os.path.join(fixture_dir, PROTEINS_FILE), json.dumps(proteins, indent=1))
+    return proteins
+
+def record(fixture_dir, queries, with_html=False):
+    """Ghi lại kết quả tìm kiếm, entry JSON (và trang entry nếu with_html) từ UniProt thật"""
+    import uniprot_pipeline as pipeline
+    proteins = []
+    for line in queries:
+        tokens = line.split()
+        if not tokens or tokens[0].startswith('#'):
+            continue
+        query, entry_name = tokens[0], tokens[1] if len(tokens) > 1 else ""
+        
+        response = pipeline.uniprot_client.get(
+            f"{pipeline.UNIPROT_REST_URL}/uniprotkb/search",
+            params={'query': query, 'fields': 'accession,id', 'format': 'tsv', 'size': 500}
+        )
+        response.raise_for_status()
+        _write(search_path(fixture_dir, query), response.text)
+        
+        accession = pipeline.get_entry_from_uniprot_rest(query, entry_name)
+        if not accession:
+            print(f"Bỏ qua {query}: không tìm thấy {entry_name}", file=sys.stderr)
+            continue
+        proteins.append({'query': query, 'accession': accession, 'entry_name': entry_name})
+        
+        response = pipeline.uniprot_client.get(
+            f"{pipeline.UNIPROT_REST_URL}/uniprotkb/{accession}",
+            params={'format': 'json', 'fields': 'accession,length,xref_pdb,xref_alphafolddb'}
+        )
+        response.raise_for_status()
+        _write(entry_path(fixture_dir, accession), response.text)
+        
+        if with_html:
+            from selenium.webdriver.common.by import By
+            from selenium.webdriver.support.ui import WebDriverWait
+            from selenium.webdriver.support import expected_conditions as EC
+            from selenium.common.exceptions import TimeoutException
+            
+            url = f"https://www.uniprot.org/uniprotkb/{accession}/entry#structure"
+            with pipeline._driver_session(None) as driver:
+                driver.get(url)
+                try:
+                    WebDriverWait(driver, pipeline.SELENIUM_WAIT_SECONDS).until(
+                        EC.presence_of_element_located((By.CSS_SELECTOR, "#structure table tr"))
+                    )
+                except TimeoutException:
+                    print(f"Timeout chờ bảng 3D structure của {accession}", file=sys.stderr)
+                _write(structure_path(fixture_dir, accession), driver.page_source)
+        print(f"Đã ghi {query} -> {accession}", file=sys.stderr)
+    
+    _write(os.path.join(fixture_dir, PROTEINS_FILE), json.dumps(proteins, indent=1))
+    return proteins
+
+def main():
+    parser = argparse.ArgumentParser(description="Tạo bộ dữ liệu UniProt cho benchmark")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    synth_parser = subparsers.add_parser('synth', help="Sinh dữ liệu giả lập")
+    synth_parser.add_argument('-n', '--count', type=int, default=300, help="Số protein")
+    synth_parser.add_argument('-o', '--output', default=DEFAULT_FIXTURE_DIR)
+    synth_parser.add_argument('--seed', type=int, default=0)
+    
+    record_parser = subparsers.add_parser('record', help="Ghi lại từ UniProt thật")
+    record_parser.add_argument('queries', help="File mỗi dòng `Query Entry_Name`")
+    record_parser.add_argument('-o', '--output', required=True)
+    record_parser.add_argument('--html', action='store_true', help="Ghi cả trang entry bằng Selenium")
+    
+    args = parser.parse_args()
+    if args.command == 'synth':
+        proteins = synthesize(args.output, args.count, args.seed)
+    else:
+        with open(args.queries, encoding='utf-8') as f:
+            proteins = record(args.output, f, args.html)
+    print(f"{len(proteins)} protein tại {args.output}")
+
+if __name__ == "__main__":
+    main()
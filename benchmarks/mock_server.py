@@ -0,0 +1,151 @@
+"""Server HTTP giả lập UniProt REST API, trả lời từ bộ dữ liệu của benchmarks/fixtures.py
+
+Chạy: python benchmarks/mock_server.py .cache/bench_fixtures --port 8765 --latency 50
+rồi đặt UNIPROT_REST_URL=http://127.0.0.1:8765 khi chạy App.py.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fixtures
+
+class FixtureStore:
+    """Dữ liệu đã ghi lại, đọc từ đĩa một lần khi khởi động"""
+
+    def __init__(self, fixture_dir):
+        self.fixture_dir = fixture_dir
+        self.proteins = fixtures.load_proteins(fixture_dir)
+        self.by_entry_name = {p['entry_name']: p for p in self.proteins if p['entry_name']}
+        self.by_query = {}
+        for protein in self.proteins:
+            self.by_query.setdefault(protein['query'].upper(), []).append(protein)
+        self.entries = {}
+        for protein in self.proteins:
+            with open(fixtures.entry_path(fixture_dir, protein['accession']), encoding='utf-8') as f:
+                self.entries[protein['accession']] = f.read()
+
+    def search(self, query):
+        """Kết quả TSV: bản ghi lại nếu có, nếu không thì tạo từ danh sách protein"""
+        combined = re.fullmatch(r'\((.*)\) AND id:(\w+)', query)
+        if combined:
+            # (gene) AND id:ENTRY_NAME: kết quả của gene, chỉ giữ dòng có Entry Name trùng
+            lines = self.search(combined.group(1)).splitlines(keepends=True)
+            return lines[0] + ''.join(line for line in lines[1:] if line.split('\t')[1].strip() == combined.group(2))
+        
+        path = fixtures.search_path(self.fixture_dir, query)
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                return f.read()
+        
+        accessions = re.findall(r'accession:(\w+)', query)
+        if accessions:
+            # Kiểm tra version theo lô (delta-sync): fields accession,version,date_modified
+            rows = []
+            for accession in accessions:
+                if accession in self.entries:
+                    audit = json.loads(self.entries[accession]).get('entryAudit', {})
+                    rows.append(f"{accession}\t{audit.get('entryVersion', 1)}\t"
+                                f"{audit.get('lastAnnotationUpdateDate', '2024-01-01')}\n")
+            return "Entry\tEntry version\tDate of last modification\n" + ''.join(rows)
+        
+        names = re.findall(r'id:(\w+)', query)
+        if names:
+            hits = [self.by_entry_name[name] for name in names if name in self.by_entry_name]
+        else:
+            hits = self.by_query.get(query.strip().upper(), [])
+        return "Entry\tEntry Name\n" + ''.join(f"{p['accession']}\t{p['entry_name']}\n" for p in hits)
+
+    def structure_html(self, accession):
+        path = fixtures.structure_path(self.fixture_dir, accession)
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding='utf-8') as f:
+            return f.read()
+
+def make_handler(store, latency=0.0):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Header và body được ghi riêng: không tắt Nagle thì mỗi response keep-alive
+        # chờ delayed ACK (~40 ms) và benchmark đo độ trễ của TCP thay vì của pipeline
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            if latency:
+                time.sleep(latency)
+            url = urlparse(self.path)
+            params = parse_qs(url.query)
+            parts = [part for part in url.path.split('/') if part]
+            
+            if parts == ['uniprotkb', 'search']:
+                self._send_search(params)
+            elif len(parts) == 2 and parts[0] == 'uniprotkb':
+                accession = parts[1].split('.')[0]
+                body = store.entries.get(accession)
+                self._send(200 if body else 404, body or json.dumps({'messages': ['not found']}), 'application/json')
+            elif len(parts) == 3 and parts[0] == 'uniprotkb' and parts[2] == 'entry':
+                body = store.structure_html(parts[1])
+                self._send(200 if body else 404, body or "", 'text/html')
+            else:
+                self._send(404, "", 'text/plain')
+
+        def _send_search(self, params):
+            """Phân trang theo size như UniProt: trang tiếp theo nằm trong header Link (rel="next")"""
+            lines = store.search(params.get('query', [''])[0]).splitlines(keepends=True)
+            size = int(params.get('size', ['500'])[0])
+            cursor = int(params.get('cursor', ['0'])[0])
+            rows = lines[1 + cursor:1 + cursor + size]
+            headers = {}
+            if 1 + cursor + size < len(lines):
+                next_params = dict((key, values[0]) for key, values in params.items())
+                next_params['cursor'] = str(cursor + size)
+                next_url = f"http://{self.headers['Host']}/uniprotkb/search?{urlencode(next_params)}"
+                headers['Link'] = f'<{next_url}>; rel="next"'
+            self._send(200, lines[0] + ''.join(rows), 'text/plain; format=tsv', headers)
+
+        def _send(self, status, body, content_type, headers=None):
+            data = body.encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+    
+    return Handler
+
+def start_server(fixture_dir, port=0, latency=0.0):
+    """Chạy server trong luồng nền, trả về server (server.server_port là cổng thực tế)"""
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(FixtureStore(fixture_dir), latency))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Server giả lập UniProt REST API cho benchmark")
+    parser.add_argument('fixture_dir', nargs='?', default=fixtures.DEFAULT_FIXTURE_DIR)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help="Độ trễ mỗi request (ms)")
+    args = parser.parse_args()
+    
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), make_handler(FixtureStore(args.fixture_dir), args.latency / 1000))
+    server.daemon_threads = True
+    print(f"http://127.0.0.1:{server.server_port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
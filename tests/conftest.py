@@ -0,0 +1,66 @@
+"""Fixture dùng chung: server UniProt giả lập (benchmarks/mock_server.py) và thư mục làm việc tạm
+
+Test không gọi UniProt thật và không dùng Selenium; cache, checkpoint và exports
+được ghi trong thư mục tạm của từng test.
+"""
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+# Đặt trước khi import uniprot_pipeline: bộ giới hạn tốc độ được tạo lúc import
+os.environ['UNIPROT_REST_REQUESTS_PER_SECOND'] = "0"
+
+import uniprot_pipeline as pipeline
+import fixtures
+import mock_server
+
+pipeline.USE_SELENIUM_FALLBACK = False
+
+PROTEIN_COUNT = 30
+
+@pytest.fixture(scope='session')
+def uniprot_server(tmp_path_factory):
+    """Server giả lập với PROTEIN_COUNT protein; trả về danh sách protein của bộ dữ liệu"""
+    fixture_dir = str(tmp_path_factory.mktemp("fixtures"))
+    proteins = fixtures.synthesize(fixture_dir, count=PROTEIN_COUNT)
+    server = mock_server.start_server(fixture_dir)
+    url = f"http://127.0.0.1:{server.server_port}"
+    
+    # Process con của queue-work -p đọc URL từ biến môi trường
+    previous_url, previous_env = pipeline.UNIPROT_REST_URL, os.environ.get('UNIPROT_REST_URL')
+    pipeline.UNIPROT_REST_URL = url
+    os.environ['UNIPROT_REST_URL'] = url
+    yield proteins
+    
+    server.shutdown()
+    pipeline.UNIPROT_REST_URL = previous_url
+    if previous_env is None:
+        os.environ.pop('UNIPROT_REST_URL', None)
+    else:
+        os.environ['UNIPROT_REST_URL'] = previous_env
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    """Chạy mỗi test trong thư mục tạm để .cache/ và exports/ không lẫn giữa các test"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+@pytest.fixture
+def input_frame(uniprot_server):
+    """Bảng Query/Entry Name gồm mọi protein giả lập, một dòng trùng và một dòng không tồn tại"""
+    rows = [(protein['query'], protein['entry_name']) for protein in uniprot_server]
+    rows.append(rows[0])
+    rows.append(("NOSUCHGENE", "NOSUCHGENE_HUMAN"))
+    return pd.DataFrame(rows, columns=pipeline.REQUIRED_COLUMNS)
+
+@pytest.fixture
+def input_csv(workdir, input_frame):
+    path = str(workdir / "input.csv")
+    input_frame.to_csv(path, index=False)
+    return path
@@ -0,0 +1,146 @@
+import threading
+
+import pandas as pd
+import pytest
+
+import uniprot_pipeline as pipeline
+
+class Clock:
+    """Thay time.time() để điều khiển created_at/accessed_at của cache"""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+def test_entries_expire_after_ttl(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(pipeline.time, 'time', clock)
+    cache = pipeline.ResponseCache(ttl=60)
+    cache.set_many({'a': "P04637", 'b': None})
+    
+    clock.now += 59
+    assert cache.get_many(['a', 'b']) == {'a': "P04637", 'b': None}
+    
+    clock.now += 2
+    assert cache.get('a') is None
+    assert (cache.hits, cache.misses) == (2, 1)
+
+def test_eviction_drops_expired_then_least_recently_used(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(pipeline.time, 'time', clock)
+    cache = pipeline.ResponseCache(ttl=100, max_entries=2)
+    for key in ['old', 'a', 'b', 'c']:
+        cache.set(key, key.upper())
+        clock.now += 10
+    
+    # 'a' vừa được đọc nên được giữ, 'b' là mục ít dùng nhất
+    assert cache.get('a') == "A"
+    clock.now += 61
+    cache._evict()
+    
+    assert cache.size() == 2
+    assert cache.get_many(['old', 'a', 'b', 'c']) == {'a': "A", 'c': "C"}
+
+def test_eviction_runs_while_writing():
+    cache = pipeline.ResponseCache(max_entries=100)
+    cache.set_many({f"key{i}": i for i in range(1000)})
+    assert cache.size() == 100
+
+def test_force_refresh_overwrites(uniprot_server):
+    cache = pipeline.ResponseCache()
+    protein = uniprot_server[0]
+    key = pipeline.entry_cache_key(protein['query'], protein['entry_name'])
+    cache.set(key, "STALE")
+    
+    df = pipeline.resolve_entries_batch(
+        pd.DataFrame([(protein['query'], protein['entry_name'])], columns=pipeline.REQUIRED_COLUMNS),
+        cache=cache, force_refresh=True
+    )
+    assert df['Entry ID'].tolist() == [protein['accession']]
+    assert cache.get(key) == protein['accession']
+
+def test_missing_structures_are_cached_as_empty(uniprot_server, monkeypatch):
+    cache = pipeline.ResponseCache()
+    # Accession không có trên server: 404 là kết quả chắc chắn, lần sau không gọi lại UniProt
+    assert pipeline.get_structure_rows("Q99999", "", cache=cache) == []
+    assert cache.get(pipeline.structure_cache_key("Q99999")) == []
+    
+    def unreachable(*args):
+        raise AssertionError("không được gọi UniProt khi đã có trong cache")
+    monkeypatch.setattr(pipeline, '_fetch_structure_data', unreachable)
+    assert pipeline.get_structure_rows("Q99999", "", cache=cache) == []
+
+def test_transient_structure_errors_are_not_cached(monkeypatch):
+    def transient(*args):
+        raise pipeline.TransientFetchError("timeout")
+    monkeypatch.setattr(pipeline, '_fetch_structure_data', transient)
+    cache = pipeline.ResponseCache()
+    
+    with pytest.raises(pipeline.TransientFetchError):
+        pipeline.get_structure_rows("Q00001", "", cache=cache)
+    assert cache.get(pipeline.structure_cache_key("Q00001")) is None
+
+def test_cache_stats_are_counted_per_run():
+    cache = pipeline.ResponseCache()
+    cache.set_many({'a': 1, 'b': 2})
+    barrier = threading.Barrier(2)
+    results = {}
+    
+    def run(name, keys):
+        with pipeline.counting_cache_stats({'hits': 0, 'misses': 0}) as stats:
+            barrier.wait()
+            for _ in range(50):
+                cache.get_many(keys)
+        results[name] = stats
+    
+    # Hai lần chạy song song trên cùng một cache không cộng lẫn hit/miss của nhau
+    threads = [threading.Thread(target=run, args=('hits', ['a', 'b'])),
+               threading.Thread(target=run, args=('misses', ['x']))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == {'hits': {'hits': 100, 'misses': 0}, 'misses': {'hits': 0, 'misses': 50}}
+    assert (cache.hits, cache.misses) == (100, 50)
+
+def test_locked_cache_is_a_miss_and_skips_writes():
+    cache = pipeline.ResponseCache(busy_timeout=0.1)
+    cache.set('a', "P04637")
+    
+    # Một tiến trình worker khác giữ khóa ghi: đọc vẫn được, ghi bị bỏ qua thay vì lỗi
+    other = pipeline.sqlite3.connect(cache.path, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    assert cache.get('a') == "P04637"
+    cache.set('b', "P38398")
+    other.execute("ROLLBACK")
+    assert cache.get('b') is None
+    
+    other.close()
+
+class LockedReads:
+    """Kết nối SQLite mà mọi câu SELECT đều gặp lỗi khóa, như khi đang checkpoint WAL"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, *args):
+        if sql.startswith("SELECT"):
+            raise pipeline.sqlite3.OperationalError("database is locked")
+        return self.conn.execute(sql, *args)
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+def test_unreadable_cache_is_a_miss():
+    cache = pipeline.ResponseCache()
+    cache.set('a', "P04637")
+    conn = cache._conn
+    
+    cache._conn = LockedReads(conn)
+    assert cache.get('a') is None
+    assert cache.misses == 1
+    
+    cache._conn = conn
+    assert cache.get('a') == "P04637"
@@ -0,0 +1,73 @@
+import threading
+
+import pytest
+
+import uniprot_pipeline as pipeline
+
+class CancelAfter:
+    """progress_callback bật cancel_event khi bước 2 đã lấy xong `entries` Entry ID"""
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.cancel_event = threading.Event()
+
+    def __call__(self, stage, done, total, **info):
+        if stage == 'structures' and done >= self.entries:
+            self.cancel_event.set()
+
+def _run(input_frame, checkpoint, **options):
+    return pipeline.run_pipeline(input_frame, max_workers=2, checkpoint=checkpoint, **options)
+
+def test_resume_after_cancel_matches_full_run(input_frame, monkeypatch):
+    expected_entries, expected_structures = _run(input_frame, None)
+    
+    checkpoint = pipeline.JobCheckpoint(pipeline.JobCheckpoint.job_id_for(input_frame.to_csv().encode()))
+    progress = CancelAfter(10)
+    with pytest.raises(pipeline.PipelineCancelled):
+        _run(input_frame, checkpoint, progress_callback=progress, cancel_event=progress.cancel_event)
+    interrupted = checkpoint.summary()
+    assert interrupted.get('extracted', 0) >= 10
+    assert interrupted.get('resolved', 0) > 0
+    extracted_before = set(checkpoint.load_structures())
+    
+    # Chạy tiếp: chỉ các Entry ID chưa xong được lấy lại, kết quả giống lần chạy liền mạch
+    fetched = []
+    get_structure_rows = pipeline.get_structure_rows
+    def counting_get_structure_rows(entry_id, *args):
+        fetched.append(entry_id)
+        return get_structure_rows(entry_id, *args)
+    monkeypatch.setattr(pipeline, 'get_structure_rows', counting_get_structure_rows)
+    entries, structures = _run(input_frame, checkpoint)
+    
+    assert fetched and not extracted_before & set(fetched)
+    assert entries['Entry ID'].tolist() == expected_entries['Entry ID'].tolist()
+    assert entries['Status'].tolist() == expected_entries['Status'].tolist()
+    assert sorted(structures.values.tolist()) == sorted(expected_structures.values.tolist())
+    assert set(checkpoint.summary()) <= {'extracted', 'failed'}
+
+def test_force_refresh_discards_checkpoint(input_frame):
+    checkpoint = pipeline.JobCheckpoint("force-refresh")
+    _run(input_frame, checkpoint)
+    checkpoint.mark_rows([(0, 'failed', "", "Lỗi tạm thời: giả lập")])
+    
+    entries, _ = _run(input_frame, checkpoint, force_refresh=True)
+    assert entries.loc[0, 'Status'] == pipeline.STATUS_SUCCESS
+
+def test_runner_reports_active_job_for_checkpoint(workdir, input_frame, monkeypatch):
+    release = threading.Event()
+    def blocked_run_pipeline(df_input, **options):
+        release.wait(10)
+        return df_input, None
+    monkeypatch.setattr(pipeline, 'run_pipeline', blocked_run_pipeline)
+    
+    runner = pipeline.JobRunner()
+    checkpoint = pipeline.JobCheckpoint("active-job")
+    job = runner.submit("input.csv", input_frame, pipeline.StreamingExporter(str(workdir / "run")),
+                        checkpoint=checkpoint)
+    assert runner.active_job("active-job") is job
+    assert runner.active_job("other-file") is None
+    
+    release.set()
+    job.future.result(10)
+    assert job.status == pipeline.JOB_DONE
+    assert runner.active_job("active-job") is None
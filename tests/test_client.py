@@ -0,0 +1,90 @@
+import threading
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import uniprot_pipeline as pipeline
+
+class ScriptedServer:
+    """Server trả lần lượt các response (status, headers) đã định sẵn, sau đó luôn trả 200"""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.count = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                server.count += 1
+                status, headers = server.responses.pop(0) if server.responses else (200, {})
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', "2")
+                self.end_headers()
+                self.wfile.write(b"ok")
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}/uniprotkb/search"
+
+@pytest.fixture
+def scripted():
+    servers = []
+    def start(*responses):
+        servers.append(ScriptedServer(responses))
+        return servers[-1]
+    yield start
+    for server in servers:
+        server.httpd.shutdown()
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Ghi lại thời gian chờ giữa các lần thử thay vì chờ thật"""
+    delays = []
+    monkeypatch.setattr(pipeline.time, 'sleep', delays.append)
+    return delays
+
+def test_retry_after_seconds_is_honoured(scripted, sleeps):
+    server = scripted((429, {'Retry-After': "2"}), (503, {'Retry-After': "1.5"}))
+    response = pipeline.UniProtClient().get(server.url)
+    assert response.status_code == 200
+    assert sleeps == [2.0, 1.5]
+    assert server.count == 3
+
+def test_retry_after_http_date(scripted, sleeps):
+    server = scripted((429, {'Retry-After': formatdate(pipeline.time.time() + 10, usegmt=True)}))
+    assert pipeline.UniProtClient().get(server.url).status_code == 200
+    assert len(sleeps) == 1 and 8 <= sleeps[0] <= 10
+
+def test_retry_after_is_capped(scripted, sleeps):
+    server = scripted((429, {'Retry-After': "3600"}))
+    assert pipeline.UniProtClient().get(server.url).status_code == 200
+    assert sleeps == [pipeline.HTTP_BACKOFF_MAX]
+
+def test_429_without_retry_after_backs_off_exponentially(scripted, sleeps):
+    server = scripted(*[(429, {})] * 3)
+    assert pipeline.UniProtClient().get(server.url).status_code == 200
+    # Full jitter: lần thử thứ n chờ trong khoảng [0, HTTP_BACKOFF_BASE * 2^n]
+    assert len(sleeps) == 3
+    for attempt, delay in enumerate(sleeps):
+        assert 0 <= delay <= pipeline.HTTP_BACKOFF_BASE * 2 ** attempt
+
+def test_gives_up_after_max_retries(scripted, sleeps):
+    server = scripted(*[(429, {'Retry-After': "1"})] * 10)
+    with pytest.raises(pipeline.TransientFetchError):
+        pipeline.UniProtClient(max_retries=2).get(server.url)
+    assert server.count == 3
+    assert sleeps == [1.0, 1.0]
+
+def test_client_errors_are_not_retried(scripted, sleeps):
+    server = scripted((404, {'Retry-After': "1"}))
+    assert pipeline.UniProtClient().get(server.url).status_code == 404
+    assert server.count == 1 and sleeps == []
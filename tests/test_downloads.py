@@ -0,0 +1,111 @@
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import uniprot_pipeline as pipeline
+
+BODY = b"data_1TUP\n" + b"ATOM line\n" * 2000
+
+class FileServer:
+    """Server một file có ETag, hỗ trợ Range/If-Range như RCSB; ghi lại header của từng request"""
+
+    def __init__(self, body=BODY, etag='"v1"'):
+        self.body = body
+        self.etag = etag
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                server.requests.append(dict(self.headers))
+                status, headers, data = server.respond(self.headers)
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}/1TUP.cif"
+
+    def respond(self, headers):
+        range_header = headers.get('Range')
+        if not range_header or headers.get('If-Range', self.etag) != self.etag:
+            return 200, {'ETag': self.etag}, self.body
+        start = int(range_header.split('=')[1].rstrip('-'))
+        if start >= len(self.body):
+            return 416, {'Content-Range': f"bytes */{len(self.body)}"}, b""
+        content_range = f"bytes {start}-{len(self.body) - 1}/{len(self.body)}"
+        return 206, {'ETag': self.etag, 'Content-Range': content_range}, self.body[start:]
+
+@pytest.fixture
+def file_server():
+    server = FileServer()
+    yield server
+    server.httpd.shutdown()
+
+def _write_part(downloader, content, etag=None):
+    part_path = f"{downloader.output_dir}/1TUP.cif.part"
+    with open(part_path, 'wb') as f:
+        f.write(content)
+    if etag is not None:
+        with open(part_path + ".etag", 'w', encoding='utf-8') as f:
+            f.write(etag)
+
+def _assert_complete(downloader, entry):
+    with open(f"{downloader.output_dir}/1TUP.cif", 'rb') as f:
+        assert f.read() == BODY
+    assert entry['status'] == 'downloaded'
+    assert entry['sha256'] == hashlib.sha256(BODY).hexdigest()
+
+def test_resume_part_with_known_etag(workdir, file_server):
+    downloader = pipeline.StructureDownloader(output_dir=str(workdir / "structures"))
+    _write_part(downloader, BODY[:1000], etag='"v1"')
+
+    entry = downloader._fetch(file_server.url, "1TUP.cif")
+    _assert_complete(downloader, entry)
+    assert file_server.requests[-1]['Range'] == "bytes=1000-"
+    assert file_server.requests[-1]['If-Range'] == '"v1"'
+
+def test_part_without_etag_restarts(workdir, file_server):
+    downloader = pipeline.StructureDownloader(output_dir=str(workdir / "structures"))
+    _write_part(downloader, b"garbage")
+
+    entry = downloader._fetch(file_server.url, "1TUP.cif")
+    _assert_complete(downloader, entry)
+    assert 'Range' not in file_server.requests[-1]
+
+def test_changed_file_replaces_part(workdir, file_server):
+    downloader = pipeline.StructureDownloader(output_dir=str(workdir / "structures"))
+    _write_part(downloader, b"old version", etag='"v0"')
+
+    # If-Range không khớp: server trả cả file mới thay vì phần còn lại
+    entry = downloader._fetch(file_server.url, "1TUP.cif")
+    _assert_complete(downloader, entry)
+    assert entry['etag'] == '"v1"'
+
+def test_complete_part_accepted_on_416(workdir, file_server):
+    downloader = pipeline.StructureDownloader(output_dir=str(workdir / "structures"))
+    _write_part(downloader, BODY, etag='"v1"')
+
+    entry = downloader._fetch(file_server.url, "1TUP.cif")
+    _assert_complete(downloader, entry)
+    assert len(file_server.requests) == 1
+
+def test_oversized_part_refetched_on_416(workdir, file_server):
+    downloader = pipeline.StructureDownloader(output_dir=str(workdir / "structures"))
+    _write_part(downloader, BODY + b"trailing bytes", etag='"v1"')
+
+    entry = downloader._fetch(file_server.url, "1TUP.cif")
+    _assert_complete(downloader, entry)
+    assert [request.get('Range') for request in file_server.requests] == [f"bytes={len(BODY) + 14}-", None]
@@ -0,0 +1,53 @@
+import threading
+import time
+
+import uniprot_pipeline as pipeline
+
+class FakeDriver:
+    current_url = "about:blank"
+
+    def quit(self):
+        pass
+
+def _run_threads(target, count):
+    threads = [threading.Thread(target=target, daemon=True) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    return not any(thread.is_alive() for thread in threads)
+
+def test_recycled_driver_wakes_waiters(monkeypatch):
+    created = []
+    monkeypatch.setattr(pipeline, 'create_driver', lambda: created.append(FakeDriver()) or created[-1])
+    pool = pipeline.DriverPool(size=1, max_pages=2)
+    leased = []
+
+    def worker():
+        for _ in range(3):
+            with pool.lease() as driver:
+                leased.append(driver)
+                time.sleep(0.01)
+    
+    # Driver bị tái tạo sau max_pages trang: luồng đang chờ phải được đánh thức để tạo driver mới
+    assert _run_threads(worker, 4)
+    assert len(leased) == 12 and None not in leased
+    assert len(created) == 6
+    pool.shutdown()
+
+def test_failed_create_wakes_waiters(monkeypatch):
+    failures = [True]
+    monkeypatch.setattr(pipeline, 'create_driver', lambda: None if failures and failures.pop() else FakeDriver())
+    pool = pipeline.DriverPool(size=1)
+    leased = []
+
+    def worker():
+        with pool.lease() as driver:
+            leased.append(driver)
+            time.sleep(0.01)
+    
+    assert _run_threads(worker, 3)
+    assert leased.count(None) == 1
+    pool.shutdown()
+    with pool.lease() as driver:
+        assert driver is None
@@ -0,0 +1,66 @@
+import gzip
+
+import uniprot_pipeline as pipeline
+
+IDMAPPING = [
+    ("P04637", "UniProtKB-ID", "P53_HUMAN"),
+    ("P04637", "Gene_Name", "TP53"),
+    ("P38398", "UniProtKB-ID", "BRCA1_HUMAN"),
+    ("P38398", "Gene_Name", "BRCA1"),
+    # Gene name của hai accession: không đủ để chọn khi thiếu Entry Name
+    ("Q00001", "UniProtKB-ID", "HLA1_HUMAN"),
+    ("Q00001", "Gene_Name", "HLA"),
+    ("Q00002", "UniProtKB-ID", "HLA2_HUMAN"),
+    ("Q00002", "Gene_Name", "HLA"),
+    ("P04637", "RefSeq", "NP_000537.3"),
+]
+
+def _write_idmapping(path):
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        f.writelines('\t'.join(row) + '\n' for row in IDMAPPING)
+
+def test_build_from_idmapping_and_lookup(workdir):
+    source = str(workdir / "HUMAN_9606_idmapping.dat.gz")
+    _write_idmapping(source)
+    index = pipeline.AccessionIndex(str(workdir / "index.sqlite"))
+
+    assert index.build(source, batch_size=2) == 4
+    assert index.size() == 4
+    found = index.lookup_many([
+        ("TP53", "P53_HUMAN"), ("BRCA1", ""), ("tp53", ""), ("HLA", ""),
+        ("HLA", "HLA2_HUMAN"), ("NOSUCHGENE", "NOSUCHGENE_HUMAN")
+    ])
+    assert found == {
+        ("TP53", "P53_HUMAN"): "P04637", ("BRCA1", ""): "P38398", ("tp53", ""): "P04637",
+        ("HLA", "HLA2_HUMAN"): "Q00002"
+    }
+    index.close()
+
+def test_build_from_entry_list(workdir):
+    source = workdir / "entries.tsv"
+    source.write_text("Entry\tEntry Name\nP04637\tP53_HUMAN\nP38398\tBRCA1_HUMAN\n", encoding='utf-8')
+    index = pipeline.AccessionIndex(str(workdir / "index.sqlite"))
+
+    assert index.build(str(source)) == 2
+    assert index.lookup_many([("BRCA1", "BRCA1_HUMAN")]) == {("BRCA1", "BRCA1_HUMAN"): "P38398"}
+    index.close()
+
+def test_pipeline_only_queries_rows_missing_from_index(workdir, input_frame, uniprot_server, monkeypatch):
+    source = workdir / "entries.tsv"
+    source.write_text(
+        ''.join(f"{protein['accession']}\t{protein['entry_name']}\n" for protein in uniprot_server[:20]),
+        encoding='utf-8'
+    )
+    assert pipeline.cli_main(['build-index', str(source), '--index', str(workdir / "index.sqlite")]) == 0
+    index = pipeline.AccessionIndex(str(workdir / "index.sqlite"))
+
+    sent = []
+    fetch = pipeline.fetch_accessions_by_entry_names
+    monkeypatch.setattr(pipeline, 'fetch_accessions_by_entry_names', lambda names: sent.extend(names) or fetch(names))
+    entries, _ = pipeline.run_pipeline(input_frame, max_workers=2, index=index)
+
+    assert sorted(sent) == sorted([protein['entry_name'] for protein in uniprot_server[20:]] + ["NOSUCHGENE_HUMAN"])
+    expected = {protein['entry_name']: protein['accession'] for protein in uniprot_server}
+    resolved = entries[entries['Entry Name'] != "NOSUCHGENE_HUMAN"]
+    assert (resolved['Entry ID'] == resolved['Entry Name'].map(expected)).all()
+    index.close()
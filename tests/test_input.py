@@ -0,0 +1,65 @@
+import io
+
+import pandas as pd
+import pytest
+
+import uniprot_pipeline as pipeline
+
+ROWS = [(f"GENE{i}", f"GENE{i}_HUMAN") for i in range(7)]
+
+def _frame_with_extra_columns():
+    # Cột thừa đứng trước và sau để kiểm tra chỉ lấy đúng 2 cột theo tên
+    frame = pd.DataFrame(ROWS, columns=pipeline.REQUIRED_COLUMNS)
+    frame.insert(0, 'Note', "ghi chú")
+    frame['Organism'] = "Homo sapiens"
+    return frame
+
+def _write_input(path, extension):
+    frame = _frame_with_extra_columns()
+    if extension == '.csv':
+        frame.to_csv(path, index=False, encoding='utf-8-sig')
+    elif extension == '.tsv':
+        frame.to_csv(path, index=False, sep='\t')
+    elif extension == '.xlsx':
+        frame.to_excel(path, index=False)
+    else:
+        lines = ["# danh sách gen", ""] + [f"{query} {entry_name}" for query, entry_name in ROWS]
+        path.write_text('\n'.join(lines), encoding='utf-8')
+
+@pytest.mark.parametrize('extension', ['.csv', '.tsv', '.xlsx', '.txt'])
+def test_chunks_keep_required_columns(workdir, extension):
+    path = workdir / f"input{extension}"
+    _write_input(path, extension)
+
+    chunks = list(pipeline.iter_input_chunks(str(path), path.name, chunk_size=3))
+    assert [len(chunk) for chunk in chunks] == [3, 3, 1]
+    assert all(list(chunk.columns) == pipeline.REQUIRED_COLUMNS for chunk in chunks)
+
+    table = pipeline.load_input_table(str(path), path.name, chunk_size=3)
+    assert list(table.itertuples(index=False, name=None)) == ROWS
+    assert table.index.tolist() == list(range(len(ROWS)))
+
+@pytest.mark.parametrize('extension', ['.csv', '.tsv', '.xlsx'])
+def test_header_and_table_from_same_upload(workdir, extension):
+    path = workdir / f"input{extension}"
+    _write_input(path, extension)
+    upload = io.BytesIO(path.read_bytes())
+
+    # Giao diện đọc header rồi đọc bảng từ cùng file upload, file không bị đóng giữa hai lần
+    assert pipeline.read_input_header(upload, path.name) == ['Note', 'Query', 'Entry Name', 'Organism']
+    table = pipeline.load_input_table(upload, path.name, chunk_size=2)
+    assert not upload.closed
+    assert list(table.itertuples(index=False, name=None)) == ROWS
+
+def test_gene_list_single_codes():
+    upload = io.BytesIO("TP53\nP53_HUMAN\nBRCA1, BRCA1_HUMAN\n".encode('utf-8'))
+    table = pipeline.load_input_table(upload, "genes.txt")
+    assert list(table.itertuples(index=False, name=None)) == [
+        ("TP53", ""), ("P53_HUMAN", "P53_HUMAN"), ("BRCA1", "BRCA1_HUMAN")
+    ]
+
+def test_empty_csv_gives_empty_table(workdir):
+    path = workdir / "empty.csv"
+    path.write_text("Query,Entry Name\n", encoding='utf-8')
+    table = pipeline.load_input_table(str(path), path.name)
+    assert table.empty and list(table.columns) == pipeline.REQUIRED_COLUMNS
@@ -0,0 +1,83 @@
+import functools
+
+import pandas as pd
+import pytest
+
+import uniprot_pipeline as pipeline
+import fixtures
+import mock_server
+
+GENE_FAMILY = "KINASE"
+
+@pytest.fixture
+def paging_server(tmp_path_factory, monkeypatch):
+    """Server giả lập có một truy vấn gene trả về nhiều trang kết quả (2 dòng/trang)"""
+    fixture_dir = str(tmp_path_factory.mktemp("paging"))
+    proteins = fixtures.synthesize(fixture_dir, count=5)
+    fixtures._write(
+        fixtures.search_path(fixture_dir, GENE_FAMILY),
+        "Entry\tEntry Name\n" + ''.join(f"{p['accession']}\t{p['entry_name']}\n" for p in proteins)
+    )
+    server = mock_server.start_server(fixture_dir)
+    monkeypatch.setattr(pipeline, 'UNIPROT_REST_URL', f"http://127.0.0.1:{server.server_port}")
+    monkeypatch.setattr(pipeline, 'REST_PAGE_SIZE', 2)
+    yield proteins
+    server.shutdown()
+
+def test_entry_lookup_filters_by_entry_name(paging_server):
+    # Entry Name nằm ở trang thứ 3 của truy vấn gene nhưng được lọc ngay trong truy vấn
+    assert pipeline.get_entry_from_uniprot_rest(GENE_FAMILY, "GENE4_HUMAN") == "Q00004"
+    assert pipeline.get_entry_from_uniprot_rest(GENE_FAMILY, "") == "Q00000"
+    assert pipeline.get_entry_from_uniprot_rest(GENE_FAMILY, "OTHER_HUMAN") is None
+
+def test_search_follows_link_pages(paging_server):
+    names = [protein['entry_name'] for protein in paging_server]
+    found = pipeline.fetch_accessions_by_entry_names(names)
+    assert found == [(protein['accession'], protein['entry_name']) for protein in paging_server]
+
+def test_search_stops_at_page_cap(paging_server, monkeypatch):
+    monkeypatch.setattr(pipeline, 'REST_MAX_PAGES', 2)
+    names = [protein['entry_name'] for protein in paging_server]
+    assert len(pipeline.fetch_accessions_by_entry_names(names)) == 4
+
+def test_batch_failure_falls_back_to_row_lookup(input_frame, monkeypatch):
+    fetch = pipeline.fetch_accessions_by_entry_names
+    batches, rows = [], []
+    def failing_second_chunk(names):
+        batches.append(names)
+        if "GENE10_HUMAN" in names:
+            raise pipeline.TransientFetchError("HTTP 503")
+        return fetch(names)
+    get_entry_id = pipeline.get_entry_id
+    def counting_get_entry_id(query, entry_name, pool=None):
+        rows.append(entry_name)
+        return get_entry_id(query, entry_name, pool)
+    monkeypatch.setattr(pipeline, 'fetch_accessions_by_entry_names', failing_second_chunk)
+    monkeypatch.setattr(pipeline, 'get_entry_id', counting_get_entry_id)
+    
+    batch = pipeline.resolve_entries_batch(input_frame, chunk_size=10, max_workers=1)
+    assert len(batches) == 4
+    assert (batch['Entry ID'] == "").sum() == 11
+    
+    # Các dòng của lô lỗi được tra từng dòng và vẫn có Entry ID
+    monkeypatch.setattr(pipeline, 'resolve_entries_batch', functools.partial(pipeline.resolve_entries_batch, chunk_size=10))
+    entries, _ = pipeline.run_pipeline(input_frame, max_workers=2)
+    assert sorted(rows) == sorted(["NOSUCHGENE_HUMAN"] + [f"GENE{i}_HUMAN" for i in range(10, 20)])
+    assert (entries['Status'] == pipeline.STATUS_SUCCESS).sum() == len(input_frame) - 1
+
+def test_batch_skips_cached_and_invalid_entry_names(uniprot_server, monkeypatch):
+    sent = []
+    fetch = pipeline.fetch_accessions_by_entry_names
+    monkeypatch.setattr(pipeline, 'fetch_accessions_by_entry_names', lambda names: sent.extend(names) or fetch(names))
+    cache = pipeline.ResponseCache()
+    cache.set(pipeline.entry_cache_key("GENE0", "GENE0_HUMAN"), "Q00000")
+    df_input = pd.DataFrame(
+        [("GENE0", "GENE0_HUMAN"), ("GENE1", "GENE1_HUMAN"), ("GENE2", "GENE2 HUMAN"), ("GENE3", "")],
+        columns=pipeline.REQUIRED_COLUMNS
+    )
+    
+    batch = pipeline.resolve_entries_batch(df_input, cache=cache)
+    # Entry Name không hợp lệ không được đưa vào truy vấn OR, để tra từng dòng sau
+    assert sent == ["GENE1_HUMAN"]
+    assert batch['Entry ID'].tolist() == ["Q00000", "Q00001", "", ""]
+    assert cache.get(pipeline.entry_cache_key("GENE1", "GENE1_HUMAN")) == "Q00001"
@@ -0,0 +1,104 @@
+import random
+
+import pandas as pd
+
+import uniprot_pipeline as pipeline
+import fixtures
+
+STRUCTURE_PAGE = """
+<html><body>
+<section id="function"><table>
+<tr><th>Feature</th><th>Position</th></tr>
+<tr><td>PDB-like region</td><td>1-10</td></tr>
+</table></section>
+<section id="structure"><table>
+<thead><tr><th>Source</th><th>Identifier</th><th>Method</th><th>Resolution</th><th>Chain</th>
+<th>Positions</th><th>Links</th></tr></thead>
+<tbody>
+<tr><td>PDB</td><td>1TUP</td><td>X-ray</td><td>2.20 Å</td><td>A/B/C</td><td>94-312</td>
+<td><a href="https://www.rcsb.org/structure/1TUP">RCSB-PDB</a><a href="/uniprotkb/P04637/entry">PDBe</a></td></tr>
+<tr><td>PDB</td><td>2FEJ</td><td>NMR</td><td>-</td><td>A</td><td>1-93, 300-393</td><td></td></tr>
+<tr><td>AlphaFoldDB</td><td>AF-P04637-F1</td><td>Predicted</td><td></td><td>A</td><td>1-393</td><td></td></tr>
+</tbody></table></section>
+</body></html>
+"""
+
+def test_parse_structure_table_reads_structure_section():
+    data, headers = pipeline.parse_structure_table(STRUCTURE_PAGE, "TP53", "P53_HUMAN")
+    assert headers == pipeline.STRUCTURE_HEADERS
+    assert [row[:8] for row in data] == [
+        ["TP53", "P53_HUMAN", "PDB", "1TUP", "X-ray", "2.20 Å", "A/B/C", "94-312"],
+        ["TP53", "P53_HUMAN", "PDB", "2FEJ", "NMR", "-", "A", "1-93, 300-393"],
+        ["TP53", "P53_HUMAN", "AlphaFoldDB", "AF-P04637-F1", "Predicted", "", "A", "1-393"],
+    ]
+    # Link tương đối được đổi thành URL đầy đủ của UniProt
+    assert data[0][8].endswith(
+        " | Links: https://www.rcsb.org/structure/1TUP; https://www.uniprot.org/uniprotkb/P04637/entry"
+    )
+
+def test_parse_structure_table_without_table():
+    assert pipeline.parse_structure_table("<html><body><p>No structure</p></body></html>", "X", "X_HUMAN") is None
+
+def test_parse_structure_table_matches_rest_rows():
+    entry = fixtures._synthetic_entry("Q00001", random.Random(3))
+    rows = fixtures._structure_rows(entry)
+    data, headers = pipeline.parse_structure_table(fixtures.structure_page(rows), "GENE1", "GENE1_HUMAN")
+    
+    # Cùng structure dù lấy từ trang web hay từ REST API
+    assert [row[2:8] for row in data] == [row[:6] for row in rows]
+    parsed = pipeline.structure_records(data, headers)
+    expected = pipeline.structure_records(rows, pipeline.STRUCTURE_COLUMNS)
+    assert parsed['Links'].tolist() == expected['Links'].tolist()
+
+def test_structure_records_types():
+    data, headers = pipeline.parse_structure_table(STRUCTURE_PAGE, "TP53", "P53_HUMAN")
+    records = pipeline.structure_records(data, headers)
+    
+    assert list(records.columns) == pipeline.STRUCTURE_RECORD_COLUMNS
+    assert records['Resolution'].tolist()[0] == 2.2
+    assert records['Resolution'].isna().tolist() == [False, True, True]
+    assert records['Start'].tolist() == [94, 1, 1]
+    assert records['End'].tolist() == [312, 393, 393]
+    assert records['Links'].tolist() == [
+        ["https://www.rcsb.org/structure/1TUP", "https://www.uniprot.org/uniprotkb/P04637/entry"], [], []
+    ]
+    assert records['Source'].dtype == 'category'
+
+def test_structure_records_from_frame_without_query_columns():
+    frame = pd.DataFrame([["PDB", "1ABC", "EM", "3.1 A", "A", "5-20", ""]], columns=pipeline.STRUCTURE_COLUMNS)
+    records = pipeline.structure_records(frame)
+    assert list(records.columns) == pipeline.STRUCTURE_RECORD_COLUMNS[2:]
+    assert records.loc[0, 'Resolution'] == 3.1
+    assert (records.loc[0, 'Start'], records.loc[0, 'End']) == (5, 20)
+
+def test_fallback_table_without_standard_headers_maps_by_position(caplog):
+    page = """
+    <html><body><table>
+    <tr><th>Nguồn</th><th>Mã</th><th>Phương pháp</th><th>Độ phân giải</th><th>Chuỗi</th><th>Vị trí</th><th>Liên kết</th></tr>
+    <tr><td>PDB</td><td>1TUP</td><td>X-ray</td><td>2.20 Å</td><td>A</td><td>94-312</td><td></td></tr>
+    </table></body></html>
+    """
+    data, headers = pipeline.parse_structure_table(page, "TP53", "P53_HUMAN")
+    assert data == [["TP53", "P53_HUMAN", "PDB", "1TUP", "X-ray", "2.20 Å", "A", "94-312", ""]]
+    assert "lấy cột theo vị trí" in caplog.text
+
+def test_fallback_table_without_header_row_keeps_first_row():
+    page = """
+    <html><body><table>
+    <tr><td>PDB</td><td>1TUP</td><td>X-ray</td><td>2.20 Å</td><td>A</td><td>94-312</td><td></td></tr>
+    <tr><td>AlphaFoldDB</td><td>AF-P04637-F1</td><td>Predicted</td><td></td><td>A</td><td>1-393</td><td></td></tr>
+    </table></body></html>
+    """
+    data, _ = pipeline.parse_structure_table(page, "TP53", "P53_HUMAN")
+    assert [row[3] for row in data] == ["1TUP", "AF-P04637-F1"]
+
+def test_fallback_table_logs_dropped_columns(caplog):
+    page = """
+    <html><body><table>
+    <tr><th>Source</th><th>Identifier</th><th>Ghi chú</th></tr>
+    <tr><td>PDB</td><td>1TUP</td><td>ghi chú</td></tr>
+    </table></body></html>
+    """
+    data, _ = pipeline.parse_structure_table(page, "TP53", "P53_HUMAN")
+    assert data == [["TP53", "P53_HUMAN", "PDB", "1TUP", "", "", "", "", ""]]
+    assert "Ghi chú" in caplog.text
@@ -0,0 +1,35 @@
+import threading
+
+import uniprot_pipeline as pipeline
+
+def test_snapshot_reports_rate_of_current_stage():
+    progress = pipeline.JobProgress()
+    progress.estimator.update(0, now=0.0)
+    progress.stage = 'entries'
+    progress.estimator.update(10, now=2.0)
+    progress._events['entries'] = ('entries', 10, 30, {})
+    
+    (stage, done, total, info), = progress.snapshot()
+    assert (stage, done, total) == ('entries', 10, 30)
+    assert info['rate'] == 5.0 and info['eta'] == 4.0
+
+def test_snapshot_while_stages_change():
+    progress = pipeline.JobProgress()
+    stop = threading.Event()
+    
+    def pipeline_thread():
+        # Đổi stage liên tục: estimator bị reset trong lúc giao diện đọc tiến độ
+        while not stop.is_set():
+            for stage in ['entries', 'structures']:
+                for done in range(5):
+                    progress(stage, done, 5)
+    
+    thread = threading.Thread(target=pipeline_thread, daemon=True)
+    thread.start()
+    try:
+        for _ in range(2000):
+            for stage, done, total, info in progress.snapshot():
+                assert info.get('rate') is None or info['eta'] is not None
+    finally:
+        stop.set()
+        thread.join(5)
@@ -0,0 +1,56 @@
+import os
+
+import pandas as pd
+
+import uniprot_pipeline as pipeline
+
+def _read_outputs(run_dir):
+    """Entry_IDs.csv theo thứ tự dòng, 3D_Structures.csv đã sắp xếp (thứ tự ghi phụ thuộc luồng)"""
+    entries = pd.read_csv(os.path.join(run_dir, "Entry_IDs.csv"), dtype=str, keep_default_na=False)
+    structures = pd.read_csv(os.path.join(run_dir, "3D_Structures.csv"), dtype=str, keep_default_na=False)
+    structures = structures.sort_values(list(structures.columns)).reset_index(drop=True)
+    return entries, structures
+
+def _queue_summary(queue_path):
+    shard_queue = pipeline.ShardQueue(queue_path)
+    try:
+        return shard_queue.summary()
+    finally:
+        shard_queue.close()
+
+def test_queue_merge_matches_run(workdir, input_csv):
+    run_dir = str(workdir / "run")
+    merge_dir = str(workdir / "merge")
+    queue_path = str(workdir / "queue.sqlite")
+    
+    assert pipeline.cli_main(['run', input_csv, '-o', run_dir, '--no-cache', '--no-selenium']) == 0
+    
+    assert pipeline.cli_main(['queue-init', input_csv, queue_path, '--shard-rows', '7']) == 0
+    assert pipeline.cli_main(['queue-work', queue_path, '-p', '2', '-w', '2', '--no-cache', '--no-selenium']) == 0
+    assert _queue_summary(queue_path) == {'done': 5}
+    assert pipeline.cli_main(['queue-merge', queue_path, '-o', merge_dir]) == 0
+    
+    run_entries, run_structures = _read_outputs(run_dir)
+    merge_entries, merge_structures = _read_outputs(merge_dir)
+    pd.testing.assert_frame_equal(merge_entries, run_entries)
+    pd.testing.assert_frame_equal(merge_structures, run_structures)
+    assert (run_entries['Status'] == pipeline.STATUS_NOT_FOUND).sum() == 1
+    assert os.path.exists(os.path.join(merge_dir, "UniProt_3D_Structures.xlsx"))
+
+def test_expired_lease_cannot_overwrite_new_owner(workdir, input_frame):
+    shard_queue = pipeline.ShardQueue(str(workdir / "queue.sqlite"))
+    shard_queue.create(input_frame.head(4), shard_rows=4)
+    
+    # Lease của w1 hết hạn ngay nên w2 nhận lại shard
+    shard_id, df_shard = shard_queue.claim('w1', lease_seconds=-1)
+    assert shard_queue.claim('w2')[0] == shard_id
+    
+    results = df_shard.assign(**{'Entry ID': "", 'Final URL': "", 'Status': pipeline.STATUS_NOT_FOUND})
+    assert not shard_queue.heartbeat(shard_id, 'w1')
+    assert not shard_queue.fail(shard_id, 'w1', "lỗi")
+    assert not shard_queue.complete(shard_id, 'w1', results, None)
+    assert shard_queue.summary() == {'running': 1}
+    
+    assert shard_queue.complete(shard_id, 'w2', results, None)
+    assert shard_queue.summary() == {'done': 1}
+    shard_queue.close()
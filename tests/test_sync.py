@@ -0,0 +1,95 @@
+import json
+import threading
+from http.server import ThreadingHTTPServer
+
+import pandas as pd
+import pytest
+
+import uniprot_pipeline as pipeline
+import fixtures
+import mock_server
+
+@pytest.fixture
+def versioned_server(tmp_path_factory, monkeypatch):
+    """Server giả lập có thể sửa entry (version, cross-reference) giữa các lần chạy"""
+    fixture_dir = str(tmp_path_factory.mktemp("sync"))
+    proteins = fixtures.synthesize(fixture_dir, count=6)
+    store = mock_server.FixtureStore(fixture_dir)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), mock_server.make_handler(store))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(pipeline, 'UNIPROT_REST_URL', f"http://127.0.0.1:{server.server_port}")
+    yield store, proteins
+    server.shutdown()
+
+def _run(proteins, path, monkeypatch):
+    fetched = []
+    get_structure_rows = pipeline.get_structure_rows
+    def counting_get_structure_rows(entry_id, *args):
+        fetched.append(entry_id)
+        return get_structure_rows(entry_id, *args)
+    monkeypatch.setattr(pipeline, 'get_structure_rows', counting_get_structure_rows)
+
+    sync = pipeline.DeltaSync(path)
+    df_input = pd.DataFrame([(p['query'], p['entry_name']) for p in proteins], columns=pipeline.REQUIRED_COLUMNS)
+    entries, structures = pipeline.run_pipeline(df_input, max_workers=2, sync=sync)
+    report = sync.report(entries)
+    sync.close()
+    return sync, sorted(fetched), report, structures
+
+def _update_entry(store, accession, change):
+    entry = json.loads(store.entries[accession])
+    change(entry)
+    entry['entryAudit']['entryVersion'] += 1
+    store.entries[accession] = json.dumps(entry)
+
+def test_only_changed_entries_are_refetched(workdir, versioned_server, monkeypatch):
+    store, proteins = versioned_server
+    path = str(workdir / "versions.sqlite")
+    accessions = sorted(p['accession'] for p in proteins)
+
+    sync, fetched, report, first = _run(proteins, path, monkeypatch)
+    assert sync.stats == {'unchanged': 0, 'changed': 0, 'new': 6}
+    assert fetched == accessions and report.empty
+
+    sync, fetched, report, second = _run(proteins, path, monkeypatch)
+    assert sync.stats == {'unchanged': 6, 'changed': 0, 'new': 0}
+    assert fetched == []
+    pd.testing.assert_frame_equal(second, first)
+
+    # Một entry lên version: bỏ một PDB cũ và thêm một PDB mới
+    changed = next(a for a in accessions if '"PDB"' in store.entries[a])
+    old_id = next(x['id'] for x in json.loads(store.entries[changed])['uniProtKBCrossReferences'] if x['database'] == 'PDB')
+    def replace_pdb(entry):
+        xrefs = entry['uniProtKBCrossReferences']
+        xrefs[:] = [x for x in xrefs if x['id'] != old_id]
+        xrefs.insert(0, {'database': 'PDB', 'id': "9ZZZ", 'properties': [{'key': 'Method', 'value': 'EM'}]})
+    _update_entry(store, changed, replace_pdb)
+
+    sync, fetched, report, third = _run(proteins, path, monkeypatch)
+    assert sync.stats == {'unchanged': 5, 'changed': 1, 'new': 0}
+    assert fetched == [changed]
+    assert sorted(zip(report['Entry ID'], report['Change'], report['Identifier'])) == sorted([
+        (changed, pipeline.CHANGE_ADDED, "9ZZZ"), (changed, pipeline.CHANGE_REMOVED, old_id)
+    ])
+    assert report['Entry Name'].tolist() == [p['entry_name'] for p in proteins if p['accession'] == changed] * 2
+    assert "9ZZZ" in third['Identifier'].tolist() and old_id not in third['Identifier'].tolist()
+
+def test_failed_version_check_refetches(workdir, versioned_server, monkeypatch):
+    store, proteins = versioned_server
+    path = str(workdir / "versions.sqlite")
+    _run(proteins, path, monkeypatch)
+
+    fetch_entry_versions = pipeline.fetch_entry_versions
+    def unavailable(entry_ids):
+        raise pipeline.TransientFetchError("HTTP 503")
+    monkeypatch.setattr(pipeline, 'fetch_entry_versions', unavailable)
+
+    # Không biết version thì không dùng lại kết quả cũ, và lần sau vẫn phải lấy lại
+    sync, fetched, report, _ = _run(proteins, path, monkeypatch)
+    assert sync.stats == {'unchanged': 0, 'changed': 6, 'new': 0}
+    assert len(fetched) == 6 and report.empty
+
+    monkeypatch.setattr(pipeline, 'fetch_entry_versions', fetch_entry_versions)
+    sync, fetched, _, _ = _run(proteins, path, monkeypatch)
+    assert sync.stats['unchanged'] == 0 and len(fetched) == 6
@@ -0,0 +1,3156 @@
+"""Lõi xử lý không phụ thuộc giao diện: tra cứu UniProt, cache, checkpoint, pipeline, xuất file, hàng đợi
+
+Streamlit (App.py), dòng lệnh và các process worker của hàng đợi đều dùng module này;
+module không import Streamlit.
+Chạy dòng lệnh: python uniprot_pipeline.py run input.xlsx (hoặc python App.py run ...).
+"""
+import pandas as pd
+import requests
+# selenium, bs4 và webdriver-manager chỉ được import khi thật sự cần browser để
+# mỗi lần Streamlit rerun không phải nạp lại
+import time
+import io
+import os
+import sys
+from datetime import datetime
+import logging
+import shutil
+import threading
+import sqlite3
+import json
+import csv
+import hashlib
+import random
+import argparse
+from email.utils import parsedate_to_datetime
+import atexit
+import weakref
+import contextvars
+import zipfile
+import gzip
+import socket
+import multiprocessing
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlparse
+
+
+# Cấu hình logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Số browser trong pool và số trang tối đa trước khi tái tạo browser
+DRIVER_POOL_SIZE = 1
+DRIVER_MAX_PAGES = 50
+
+# Cửa sổ tính tốc độ xử lý
+THROUGHPUT_WINDOW_SECONDS = 30.0
+
+# Job chạy nền: số job chạy đồng thời và các trạng thái
+JOB_RUNNER_WORKERS = 2
+# Job đã xong được giữ tối đa JOB_HISTORY_LIMIT job và JOB_HISTORY_SECONDS giây
+JOB_HISTORY_LIMIT = 20
+JOB_HISTORY_SECONDS = 6 * 3600
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+JOB_CANCELLED = 'cancelled'
+
+# Thời gian chờ tối đa cho các phần tử trên trang UniProt
+SELENIUM_WAIT_SECONDS = 30
+COOKIE_BUTTON_XPATH = "//button[contains(text(), 'I agree, dismiss this banner')]"
+
+# Số luồng xử lý song song và giới hạn request/giây tới UniProt
+MAX_WORKERS = 4
+UNIPROT_REQUESTS_PER_SECOND = 2.0
+
+# UniProt REST API (không cần browser), có thể trỏ sang server giả lập qua biến môi trường
+UNIPROT_REST_URL = os.environ.get("UNIPROT_REST_URL", "https://rest.uniprot.org").rstrip("/")
+UNIPROT_REST_REQUESTS_PER_SECOND = float(os.environ.get("UNIPROT_REST_REQUESTS_PER_SECOND", 10.0))
+HTTP_TIMEOUT = 30
+USE_SELENIUM_FALLBACK = True
+
+# Số kết quả mỗi trang tìm kiếm và số trang tối đa đi theo header Link
+REST_PAGE_SIZE = 500
+REST_MAX_PAGES = 20
+
+# Kết nối keep-alive, số request đồng thời và retry với exponential backoff
+HTTP_MAX_CONNECTIONS = 16
+HTTP_MAX_CONCURRENCY = 8
+HTTP_MAX_RETRIES = 4
+HTTP_BACKOFF_BASE = 0.5
+HTTP_BACKOFF_MAX = 30.0
+HTTP_RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Giá trị cột Status
+STATUS_SUCCESS = "✅ Thành công"
+STATUS_NOT_FOUND = "❌ Không tìm thấy"
+STATUS_TRANSIENT = "⚠️ Lỗi tạm thời"
+
+# Số Entry Name trong một truy vấn tra cứu theo lô
+BATCH_CHUNK_SIZE = 100
+
+# Các cột bắt buộc của file đầu vào và số dòng đọc mỗi lần khi xử lý file lớn
+REQUIRED_COLUMNS = ['Query', 'Entry Name']
+INPUT_CHUNK_ROWS = 5000
+
+# Cache kết quả tra cứu trên đĩa
+CACHE_PATH = os.path.join(".cache", "uniprot_cache.sqlite")
+CACHE_TTL_SECONDS = 7 * 24 * 3600
+CACHE_MAX_ENTRIES = 200000
+# Thời gian chờ khóa ghi khi nhiều tiến trình worker dùng chung file cache
+CACHE_BUSY_TIMEOUT = 5.0
+
+# Index offline Entry Name/Gene Name -> accession, dựng bằng `python App.py build-index`
+ACCESSION_INDEX_PATH = os.path.join(".cache", "accession_index.sqlite")
+ACCESSION_INDEX_BATCH_SIZE = 50000
+
+# Delta-sync: version của từng entry kèm các dòng 3D structure đã lấy ở lần chạy trước
+SYNC_STATE_PATH = os.path.join(".cache", "entry_versions.sqlite")
+CHANGE_ADDED = "➕ Thêm mới"
+CHANGE_REMOVED = "➖ Bị gỡ"
+CHANGE_HEADERS = ['Query', 'Entry Name', 'Entry ID', 'Change', 'Source', 'Identifier', 'Old Version', 'New Version']
+
+# Checkpoint trạng thái từng dòng để chạy tiếp khi bị gián đoạn
+CHECKPOINT_PATH = os.path.join(".cache", "checkpoints.sqlite")
+
+# Hàng đợi shard (SQLite) cho nhiều process/máy cùng xử lý một file lớn
+QUEUE_SHARD_ROWS = 500
+QUEUE_LEASE_SECONDS = 300
+QUEUE_HEARTBEAT_SECONDS = 30
+QUEUE_MAX_ATTEMPTS = 3
+
+# Thư mục ghi kết quả trong lúc chạy
+EXPORT_DIR = "exports"
+
+# Tải file cấu trúc (bước 3, tùy chọn): thư mục dùng chung giữa các lần chạy để bỏ qua file đã có
+STRUCTURE_DOWNLOAD_DIR = os.path.join(EXPORT_DIR, "structures")
+RCSB_DOWNLOAD_URL = "https://files.rcsb.org/download/{pdb_id}.cif"
+ALPHAFOLD_API_URL = "https://alphafold.ebi.ac.uk/api/prediction/{accession}"
+DOWNLOAD_WORKERS = 4
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+# Lock file của tiến trình đã chết được coi là bỏ rơi sau thời gian này
+DOWNLOAD_LOCK_STALE_SECONDS = 30 * 60
+STRUCTURE_METHODS = ['X-ray', 'EM', 'NMR']
+
+# Các cột của bảng 3D structure trong file Excel xuất ra
+STRUCTURE_COLUMNS = ['Source', 'Identifier', 'Method', 'Resolution', 'Chain', 'Positions', 'Links']
+STRUCTURE_HEADERS = ['Query', 'Entry Name'] + STRUCTURE_COLUMNS
+STRUCTURE_LINKS_SEPARATOR = " | Links: "
+
+# Bảng 3D structure dạng cột có kiểu (Parquet): resolution là số, vị trí tách start/end, links là list
+STRUCTURE_RECORD_COLUMNS = ['Query', 'Entry Name', 'Source', 'Identifier', 'Method', 'Resolution', 'Chain',
+                            'Start', 'End', 'Links']
+
+# Đường dẫn browser và chromedriver thường gặp (Debian/Ubuntu, Streamlit Cloud)
+BROWSER_PATHS = [
+    '/usr/bin/chromium',
+    '/usr/bin/chromium-browser',
+    '/usr/bin/google-chrome',
+    '/usr/bin/google-chrome-stable'
+]
+CHROMEDRIVER_PATHS = [
+    '/usr/bin/chromedriver',
+    '/usr/lib/chromium/chromedriver',
+    '/usr/lib/chromium-browser/chromedriver'
+]
+
+def install_chromium():
+    """Tìm browser chromium/chrome đã cài trên máy"""
+    path = shutil.which('chromium')
+    if path:
+        logger.info(f"Chromium đã được cài đặt tại: {path}")
+        return path
+    
+    for path in BROWSER_PATHS:
+        if os.path.exists(path):
+            logger.info(f"Tìm thấy browser tại: {path}")
+            return path
+    
+    logger.warning("Không tìm thấy chromium")
+    return None
+
+def find_chromedriver():
+    """Tìm chromedriver có sẵn, None thì để Selenium Manager tự tìm"""
+    path = shutil.which('chromedriver')
+    if path:
+        return path
+    for path in CHROMEDRIVER_PATHS:
+        if os.path.exists(path):
+            return path
+    return None
+
+class BrowserSetup:
+    """Browser và chromedriver tìm được một lần cho cả process, kèm kết quả kiểm tra gần nhất"""
+
+    def __init__(self):
+        self.browser_path = install_chromium()
+        self.driver_path = find_chromedriver()
+        self.check = None
+        self.checked_at = None
+
+    def describe(self):
+        browser = self.browser_path or "Selenium Manager tự tìm"
+        driver = self.driver_path or "Selenium Manager tự tìm"
+        return f"browser: `{browser}`, driver: `{driver}`"
+
+_browser_setup = None
+_browser_setup_lock = threading.Lock()
+
+def get_browser_setup():
+    """Thông tin browser dùng chung cho mọi luồng của process (giao diện, dòng lệnh, worker)"""
+    global _browser_setup
+    with _browser_setup_lock:
+        if _browser_setup is None:
+            _browser_setup = BrowserSetup()
+        return _browser_setup
+
+def create_driver():
+    """Tạo Chrome driver với cấu hình tối ưu"""
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service
+    from selenium.webdriver.chrome.options import Options
+    
+    setup = get_browser_setup()
+    chrome_options = Options()
+    
+    # Cấu hình cơ bản
+    chrome_options.add_argument("--headless")
+    chrome_options.add_argument("--no-sandbox")
+    chrome_options.add_argument("--disable-dev-shm-usage")
+    chrome_options.add_argument("--disable-gpu")
+    chrome_options.add_argument("--disable-software-rasterizer")
+    chrome_options.add_argument("--disable-extensions")
+    chrome_options.add_argument("--disable-plugins")
+    chrome_options.add_argument("--disable-images")
+    chrome_options.add_argument("--disable-javascript")
+    chrome_options.add_argument("--window-size=1920,1080")
+    chrome_options.add_argument("--single-process")
+    chrome_options.add_argument("--no-zygote")
+    chrome_options.add_argument("--disable-background-timer-throttling")
+    chrome_options.add_argument("--disable-backgrounding-occluded-windows")
+    chrome_options.add_argument("--disable-renderer-backgrounding")
+    chrome_options.add_argument("--disable-features=TranslateUI,VizDisplayCompositor")
+    chrome_options.add_argument("--disable-ipc-flooding-protection")
+    chrome_options.add_argument("--memory-pressure-off")
+    chrome_options.add_argument("--max_old_space_size=4096")
+    
+    # User agent
+    chrome_options.add_argument("--user-agent=Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
+    
+    # Tắt automation detection
+    chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
+    chrome_options.add_experimental_option('useAutomationExtension', False)
+    
+    # Không chờ tải hết ảnh/stylesheet, các hàm scrape tự chờ phần tử cần thiết
+    chrome_options.page_load_strategy = 'eager'
+    
+    # Đặt binary location nếu tìm thấy
+    if setup.browser_path:
+        chrome_options.binary_location = setup.browser_path
+    
+    with timed_span('driver_launch'):
+        try:
+            # Thử tạo driver
+            service = Service(setup.driver_path)
+            driver = webdriver.Chrome(service=service, options=chrome_options)
+            driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+            logger.info("Tạo driver thành công")
+            return driver
+            
+        except Exception as e:
+            logger.error(f"Lỗi tạo driver: {e}")
+            
+            # Thử với webdriver-manager
+            try:
+                from webdriver_manager.chrome import ChromeDriverManager
+                driver_path = ChromeDriverManager().install()
+                service = Service(driver_path)
+                driver = webdriver.Chrome(service=service, options=chrome_options)
+                driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+                logger.info("Tạo driver thành công với webdriver-manager")
+                # Các lần sau dùng thẳng driver này, không gọi lại webdriver-manager
+                setup.driver_path = driver_path
+                return driver
+            except Exception as e2:
+                logger.error(f"Lỗi với webdriver-manager: {e2}")
+                return None
+
+def test_driver(refresh=False):
+    """Kiểm tra browser/driver, dùng lại kết quả đã có trừ khi refresh"""
+    setup = get_browser_setup()
+    if setup.check is not None and not refresh:
+        return setup.check
+    
+    try:
+        driver = create_driver()
+        if driver:
+            try:
+                # Trang trống: chỉ kiểm tra browser khởi động và điều khiển được, không cần mạng
+                driver.get("about:blank")
+                version = driver.capabilities.get('browserVersion', '')
+            finally:
+                driver.quit()
+            logger.info(f"Driver test thành công: Chrome {version}")
+            setup.check = (True, f"Thành công: Chrome {version}")
+        else:
+            setup.check = (False, "Không thể tạo driver")
+    except Exception as e:
+        logger.error(f"Driver test thất bại: {e}")
+        setup.check = (False, f"Lỗi: {str(e)}")
+    setup.checked_at = datetime.now()
+    return setup.check
+
+class SpanRecorder:
+    """Ghi lại thời gian của từng bước (driver, điều hướng, chờ, parse, HTTP, xuất file) theo dòng"""
+
+    # Biên của các khoảng trong histogram (ms)
+    HISTOGRAM_EDGES_MS = [0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000]
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self._spans = []
+        self._lock = threading.Lock()
+
+    def record(self, stage, label, start, duration):
+        with self._lock:
+            self._spans.append((stage, label, start - self.origin, duration, threading.current_thread().name))
+
+    def to_frame(self):
+        """Mỗi span một dòng: stage, label, start_s, duration_ms, thread"""
+        with self._lock:
+            spans = list(self._spans)
+        df = pd.DataFrame(spans, columns=['stage', 'label', 'start_s', 'duration_ms', 'thread'])
+        df['duration_ms'] = df['duration_ms'] * 1000
+        return df
+
+    def summary(self):
+        """Số lần, tổng thời gian và phân vị theo từng stage, stage tốn thời gian nhất lên đầu"""
+        durations = self.to_frame().groupby('stage')['duration_ms']
+        summary = pd.DataFrame({
+            'count': durations.count(),
+            'total_s': durations.sum() / 1000,
+            'mean_ms': durations.mean(),
+            'p50_ms': durations.median(),
+            'p95_ms': durations.quantile(0.95),
+            'max_ms': durations.max()
+        })
+        return summary.sort_values('total_s', ascending=False).round(2)
+
+    def histogram(self):
+        """Số span theo khoảng thời gian (dòng) và stage (cột)"""
+        df = self.to_frame()
+        edges = self.HISTOGRAM_EDGES_MS + [float('inf')]
+        labels = [f"<{high:g}ms" if high != float('inf') else f"≥{low:g}ms" for low, high in zip(edges, edges[1:])]
+        bins = pd.cut(df['duration_ms'], bins=edges, labels=labels, right=False)
+        return pd.crosstab(bins, df['stage']).reindex(labels, fill_value=0)
+
+    def to_json(self):
+        return self.to_frame().to_json(orient='records', force_ascii=False)
+
+    def to_csv(self):
+        return self.to_frame().to_csv(index=False)
+
+    def save(self, path):
+        """Ghi ra file .json hoặc .csv theo phần mở rộng"""
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            f.write(self.to_json() if path.lower().endswith('.json') else self.to_csv())
+
+# Recorder của lần chạy hiện tại, None thì timed_span không làm gì. Dùng ContextVar để
+# các job chạy song song không ghi lẫn vào nhau; luồng con nhận qua submit_in_context
+_active_spans = contextvars.ContextVar('active_spans', default=None)
+
+@contextmanager
+def recording_spans(spans):
+    """Bật recorder trong khối lệnh và các tác vụ gửi đi bằng submit_in_context"""
+    token = _active_spans.set(spans)
+    try:
+        yield spans
+    finally:
+        _active_spans.reset(token)
+
+def submit_in_context(executor, fn, *args):
+    """executor.submit nhưng giữ context hiện tại (recorder thời gian) cho luồng con"""
+    return executor.submit(contextvars.copy_context().run, fn, *args)
+
+@contextmanager
+def timed_span(stage, label=""):
+    """Đo thời gian một khối lệnh và ghi vào recorder đang bật"""
+    recorder = _active_spans.get()
+    if recorder is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        recorder.record(stage, label, start, time.perf_counter() - start)
+
+class RateLimiter:
+    """Giới hạn tốc độ request dùng chung cho mọi luồng"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_time = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """Chờ tới lượt gửi request tiếp theo"""
+        with self._lock:
+            now = time.monotonic()
+            wait_time = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.interval
+        if wait_time > 0:
+            with timed_span('rate_limit'):
+                time.sleep(wait_time)
+
+uniprot_rate_limiter = RateLimiter(UNIPROT_REQUESTS_PER_SECOND)
+rest_rate_limiter = RateLimiter(UNIPROT_REST_REQUESTS_PER_SECOND)
+
+# Số hit/miss cache của lần chạy hiện tại: cache dùng chung cho mọi job nên không thể lấy
+# hiệu bộ đếm tổng của cache khi nhiều job chạy song song; luồng con nhận qua submit_in_context
+_cache_stats = contextvars.ContextVar('cache_stats', default=None)
+
+@contextmanager
+def counting_cache_stats(stats):
+    """Cộng hit/miss của ResponseCache trong khối lệnh vào dict stats ('hits', 'misses')"""
+    token = _cache_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _cache_stats.reset(token)
+
+class ResponseCache:
+    """Cache SQLite cho kết quả tra cứu UniProt, có TTL và loại bỏ theo LRU"""
+
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES,
+                 busy_timeout=CACHE_BUSY_TIMEOUT):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=busy_timeout, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache(accessed_at)")
+        self._conn.commit()
+
+    def get(self, key):
+        """Trả về giá trị đã lưu hoặc None nếu không có/hết hạn"""
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys):
+        """Lấy nhiều khóa trong một lần truy vấn, trả về dict khóa -> giá trị"""
+        keys = list(dict.fromkeys(keys))
+        now = time.time()
+        found = {}
+        
+        with self._lock:
+            try:
+                # SQLite giới hạn số tham số trong một câu lệnh
+                for i in range(0, len(keys), 500):
+                    chunk = keys[i:i + 500]
+                    placeholders = ','.join('?' * len(chunk))
+                    rows = self._conn.execute(
+                        f"SELECT key, value FROM cache WHERE key IN ({placeholders}) AND created_at >= ?",
+                        chunk + [now - self.ttl]
+                    ).fetchall()
+                    found.update((key, json.loads(value)) for key, value in rows)
+            except sqlite3.OperationalError as e:
+                # Cache bị tiến trình khác khóa quá lâu: coi như miss để tra lại từ UniProt
+                logger.warning(f"Không đọc được cache, coi như chưa có: {e}")
+                found = {}
+            
+            if found:
+                try:
+                    self._conn.executemany(
+                        "UPDATE cache SET accessed_at = ? WHERE key = ?",
+                        [(now, key) for key in found]
+                    )
+                    self._conn.commit()
+                except sqlite3.OperationalError as e:
+                    # Chỉ mất thông tin LRU, giá trị đọc được vẫn dùng được
+                    self._conn.rollback()
+                    logger.warning(f"Không cập nhật được thời gian truy cập cache: {e}")
+            
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+            stats = _cache_stats.get()
+            if stats is not None:
+                stats['hits'] += len(found)
+                stats['misses'] += len(keys) - len(found)
+        return found
+
+    def set(self, key, value):
+        """Lưu một giá trị vào cache"""
+        self.set_many({key: value})
+
+    def set_many(self, items):
+        """Lưu nhiều giá trị vào cache trong một transaction"""
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    [(key, json.dumps(value), now, now) for key, value in items.items()]
+                )
+                self._writes += len(items)
+                if self._writes >= 1000:
+                    self._evict()
+                    self._writes = 0
+                self._conn.commit()
+            except sqlite3.OperationalError as e:
+                # Bỏ qua lần ghi thay vì làm lỗi job, kết quả sẽ được tra lại ở lần chạy sau
+                self._conn.rollback()
+                logger.warning(f"Không ghi được {len(items)} mục vào cache: {e}")
+
+    def _evict(self):
+        """Xóa mục hết hạn và các mục ít dùng nhất khi vượt quá giới hạn"""
+        self._conn.execute("DELETE FROM cache WHERE created_at < ?", (time.time() - self.ttl,))
+        count = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed_at LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+    def clear(self):
+        """Xóa toàn bộ cache"""
+        with self._lock:
+            self._conn.execute("DELETE FROM cache")
+            self._conn.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def size(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+class AccessionIndex:
+    """Index Entry Name/Gene Name -> accession trong SQLite, dựng từ file idmapping của UniProt
+    
+    Hỗ trợ file idmapping.dat (accession, loại ID, giá trị; lấy UniProtKB-ID và
+    Gene_Name) và danh sách 2 cột Entry/Entry Name, có thể nén .gz.
+    """
+
+    def __init__(self, path=ACCESSION_INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS entries (entry_name TEXT PRIMARY KEY, accession TEXT NOT NULL) WITHOUT ROWID;"
+            "CREATE TABLE IF NOT EXISTS genes (gene_name TEXT NOT NULL, accession TEXT NOT NULL, "
+            "PRIMARY KEY (gene_name, accession)) WITHOUT ROWID;"
+        )
+        self._conn.commit()
+
+    def build(self, source_path, batch_size=ACCESSION_INDEX_BATCH_SIZE):
+        """Đọc file idmapping theo luồng và ghi vào index, trả về số Entry Name đã ghi"""
+        opener = gzip.open if source_path.endswith('.gz') else open
+        entries, genes = [], []
+        count = 0
+        with opener(source_path, 'rt', encoding='utf-8') as f, self._lock:
+            # Tắt journal khi dựng để ghi nhanh, index có thể dựng lại nếu bị ngắt
+            self._conn.execute("PRAGMA journal_mode=OFF")
+            self._conn.execute("PRAGMA synchronous=OFF")
+            for line in f:
+                cols = line.rstrip('\n').split('\t')
+                if len(cols) >= 3:
+                    accession, id_type, value = cols[0], cols[1], cols[2]
+                    if id_type == 'UniProtKB-ID':
+                        entries.append((value, accession))
+                    elif id_type == 'Gene_Name':
+                        genes.append((value.upper(), accession))
+                elif len(cols) == 2 and cols[0] != 'Entry':
+                    entries.append((cols[1], cols[0]))
+                
+                if len(entries) >= batch_size or len(genes) >= batch_size:
+                    count += self._flush(entries, genes)
+                    entries, genes = [], []
+            count += self._flush(entries, genes)
+            self._conn.commit()
+            self._conn.execute("PRAGMA journal_mode=DELETE")
+        logger.info(f"Đã dựng index {self.path}: {count} Entry Name")
+        return count
+
+    def _flush(self, entries, genes):
+        self._conn.executemany("INSERT OR REPLACE INTO entries (entry_name, accession) VALUES (?, ?)", entries)
+        self._conn.executemany("INSERT OR IGNORE INTO genes (gene_name, accession) VALUES (?, ?)", genes)
+        return len(entries)
+
+    def lookup_many(self, pairs, chunk_size=500):
+        """Tra cứu các cặp (Query, Entry Name), trả về {cặp: accession} cho các cặp có trong index
+        
+        Không có Entry Name thì chỉ nhận Query là gene name ứng với đúng một accession.
+        """
+        pairs = list(dict.fromkeys(pairs))
+        names = list({entry_name for _, entry_name in pairs if entry_name})
+        genes = list({query.upper() for query, entry_name in pairs if not entry_name and query})
+        
+        by_name, by_gene = {}, {}
+        with self._lock:
+            for i in range(0, len(names), chunk_size):
+                chunk = names[i:i + chunk_size]
+                by_name.update(self._conn.execute(
+                    f"SELECT entry_name, accession FROM entries WHERE entry_name IN ({','.join('?' * len(chunk))})",
+                    chunk
+                ).fetchall())
+            for i in range(0, len(genes), chunk_size):
+                chunk = genes[i:i + chunk_size]
+                by_gene.update(self._conn.execute(
+                    f"SELECT gene_name, MIN(accession) FROM genes WHERE gene_name IN ({','.join('?' * len(chunk))}) "
+                    "GROUP BY gene_name HAVING COUNT(*) = 1",
+                    chunk
+                ).fetchall())
+        
+        found = {}
+        for query, entry_name in pairs:
+            accession = by_name.get(entry_name) if entry_name else by_gene.get(query.upper())
+            if accession:
+                found[(query, entry_name)] = accession
+        return found
+
+    def size(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class DeltaSync:
+    """Đồng bộ gia tăng: lưu version/ngày sửa đổi của từng entry kèm các dòng 3D structure
+    
+    check() so version trên UniProt theo lô và trả về kết quả đã lưu của các entry
+    không đổi; entry đã đổi được lấy lại rồi record() ghi structure thêm/bị gỡ vào changes.
+    """
+
+    def __init__(self, path=SYNC_STATE_PATH):
+        self.path = path
+        self.changes = []
+        self.stats = {'unchanged': 0, 'changed': 0, 'new': 0}
+        self._stored = {}
+        self._current = {}
+        self._lock = threading.Lock()
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entry_versions ("
+            "accession TEXT PRIMARY KEY, version TEXT NOT NULL, date_modified TEXT NOT NULL, "
+            "rows TEXT NOT NULL, synced_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def check(self, entry_ids, chunk_size=BATCH_CHUNK_SIZE, max_workers=MAX_WORKERS, reuse=True):
+        """Trả về {entry_id: rows} đã lưu của các entry có version không đổi
+        
+        reuse=False (force refresh) vẫn hỏi version để lưu kèm kết quả mới nhưng không dùng lại entry nào.
+        """
+        entry_ids = list(dict.fromkeys(entry_ids))
+        with self._lock:
+            for i in range(0, len(entry_ids), 500):
+                chunk = entry_ids[i:i + 500]
+                for accession, version, date_modified, rows in self._conn.execute(
+                    "SELECT accession, version, date_modified, rows FROM entry_versions "
+                    f"WHERE accession IN ({','.join('?' * len(chunk))})",
+                    chunk
+                ):
+                    self._stored[accession] = (version, date_modified, json.loads(rows))
+        
+        # Hỏi cả entry chưa từng lưu để có version lưu kèm kết quả, mỗi lô một request
+        known = [entry_id for entry_id in entry_ids if entry_id in self._stored]
+        chunks = [entry_ids[i:i + chunk_size] for i in range(0, len(entry_ids), chunk_size)]
+        if chunks:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [submit_in_context(executor, fetch_entry_versions, chunk) for chunk in chunks]
+                for future in as_completed(futures):
+                    try:
+                        for accession, version, date_modified in future.result():
+                            self._current[accession] = (version, date_modified)
+                    except requests.RequestException as e:
+                        # Không biết version thì coi như đã đổi và lấy lại
+                        logger.warning(f"Lỗi kiểm tra version theo lô, các entry này sẽ được lấy lại: {e}")
+        
+        unchanged = {
+            entry_id: self._stored[entry_id][2] for entry_id in known
+            if reuse and self._current.get(entry_id) == self._stored[entry_id][:2]
+        }
+        self.stats['unchanged'] += len(unchanged)
+        self.stats['changed'] += len(known) - len(unchanged)
+        self.stats['new'] += len(entry_ids) - len(known)
+        logger.info(f"Delta-sync: {self.stats}")
+        return unchanged
+
+    def record(self, entry_id, rows):
+        """Lưu các dòng vừa lấy của entry và ghi lại structure thêm/bị gỡ so với lần trước"""
+        # Không hỏi được version thì lưu rỗng, lần sau entry này sẽ được lấy lại
+        version, date_modified = self._current.get(entry_id, ("", ""))
+        
+        previous = self._stored.get(entry_id)
+        if previous is not None:
+            old = {(row[0], row[1]) for row in previous[2]}
+            new = {(row[0], row[1]) for row in rows}
+            with self._lock:
+                self.changes.extend(
+                    (entry_id, CHANGE_ADDED, source, identifier, previous[0], version)
+                    for source, identifier in sorted(new - old)
+                )
+                self.changes.extend(
+                    (entry_id, CHANGE_REMOVED, source, identifier, previous[0], version)
+                    for source, identifier in sorted(old - new)
+                )
+        
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entry_versions (accession, version, date_modified, rows, synced_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (entry_id, version, date_modified, json.dumps(rows), time.time())
+            )
+            self._conn.commit()
+
+    def report(self, df_entry_results):
+        """Bảng thay đổi theo protein (CHANGE_HEADERS) để ghi vào sheet Structure_Changes"""
+        changes = pd.DataFrame(
+            self.changes, columns=['Entry ID', 'Change', 'Source', 'Identifier', 'Old Version', 'New Version']
+        )
+        proteins = df_entry_results[['Query', 'Entry Name', 'Entry ID']].drop_duplicates()
+        return proteins.merge(changes, on='Entry ID')[CHANGE_HEADERS]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def entry_cache_key(query, entry_name):
+    return f"entry:{query}|{entry_name}"
+
+def structure_cache_key(entry_id):
+    return f"structure:{entry_id}"
+
+class SingleFlight:
+    """Gộp các lời gọi đồng thời cùng khóa thành một lần thực thi"""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func, *args, **kwargs):
+        """Chạy func một lần cho mỗi khóa, các luồng khác chờ và nhận cùng kết quả"""
+        with self._lock:
+            future = self._calls.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._calls[key] = future
+        
+        if not owner:
+            return future.result()
+        
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+_inflight = SingleFlight()
+
+class PooledDriver:
+    """Một browser trong pool cùng số trang đã tải"""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.pages = 0
+
+class DriverPool:
+    """Pool các Chrome driver, tạo khi có lượt mượn đầu tiên rồi cho mượn lại"""
+
+    def __init__(self, size=DRIVER_POOL_SIZE, max_pages=DRIVER_MAX_PAGES):
+        self.size = max(1, size)
+        self.max_pages = max_pages
+        self._idle = deque()
+        self._created = 0
+        self._lock = threading.Lock()
+        # Báo cho luồng đang chờ khi có driver rảnh hoặc còn chỗ tạo driver mới
+        self._available = threading.Condition(self._lock)
+        self._closed = False
+        _active_pools.add(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.shutdown()
+
+    def _new_slot(self):
+        driver = create_driver()
+        if driver is None:
+            self._free_slot()
+            return None
+        return PooledDriver(driver)
+
+    def _is_alive(self, slot):
+        try:
+            slot.driver.current_url
+            return True
+        except Exception:
+            return False
+
+    def _put_idle(self, slot):
+        with self._available:
+            self._idle.append(slot)
+            self._available.notify()
+
+    def _free_slot(self):
+        """Bớt một driver đã tạo và đánh thức một luồng đang chờ để nó tạo driver mới"""
+        with self._available:
+            self._created -= 1
+            self._available.notify()
+
+    def _discard(self, slot):
+        try:
+            slot.driver.quit()
+        except Exception:
+            pass
+        self._free_slot()
+
+    def _acquire(self):
+        while True:
+            with self._available:
+                while not self._idle and self._created >= self.size and not self._closed:
+                    self._available.wait()
+                if self._closed:
+                    return None
+                slot = self._idle.popleft() if self._idle else None
+                if slot is None:
+                    self._created += 1
+            if slot is None:
+                return self._new_slot()
+
+            if self._is_alive(slot):
+                return slot
+            logger.warning("Browser trong pool không phản hồi, tạo lại")
+            self._discard(slot)
+
+    def _release(self, slot, broken=False):
+        slot.pages += 1
+        if self._closed or broken or slot.pages >= self.max_pages:
+            if not self._closed and not broken:
+                logger.info(f"Tái tạo browser sau {slot.pages} trang")
+            self._discard(slot)
+        else:
+            self._put_idle(slot)
+
+    @contextmanager
+    def lease(self):
+        """Mượn một driver từ pool, trả về None nếu không tạo được"""
+        from selenium.common.exceptions import WebDriverException
+        
+        slot = self._acquire()
+        if slot is None:
+            yield None
+            return
+        broken = False
+        try:
+            yield slot.driver
+        except WebDriverException:
+            broken = True
+            raise
+        finally:
+            self._release(slot, broken)
+
+    def shutdown(self):
+        """Đóng toàn bộ browser trong pool"""
+        with self._available:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._available.notify_all()
+        for slot in idle:
+            self._discard(slot)
+        _active_pools.discard(self)
+
+_active_pools = weakref.WeakSet()
+
+@atexit.register
+def _shutdown_active_pools():
+    for pool in list(_active_pools):
+        pool.shutdown()
+
+@contextmanager
+def _driver_session(pool):
+    """Lấy driver từ pool, hoặc tạo driver riêng nếu không có pool"""
+    if pool is not None:
+        with pool.lease() as driver:
+            yield driver
+        return
+
+    driver = create_driver()
+    try:
+        yield driver
+    finally:
+        if driver:
+            try:
+                driver.quit()
+            except:
+                pass
+
+class TransientFetchError(requests.RequestException):
+    """UniProt tạm thời không trả lời được (hết số lần retry, lỗi mạng, 429/5xx)"""
+
+class PipelineCancelled(Exception):
+    """Pipeline dừng vì người dùng hủy job"""
+
+def _check_cancelled(cancel_event, futures=()):
+    """Hủy các tác vụ chưa chạy và dừng pipeline nếu cancel_event đã bật"""
+    if cancel_event is not None and cancel_event.is_set():
+        for future in futures:
+            future.cancel()
+        raise PipelineCancelled()
+
+class UniProtClient:
+    """Engine HTTP dùng chung: pool kết nối keep-alive, giới hạn đồng thời và retry/backoff"""
+
+    def __init__(self, max_connections=HTTP_MAX_CONNECTIONS, max_concurrency=HTTP_MAX_CONCURRENCY,
+                 max_retries=HTTP_MAX_RETRIES, rate_limiter=None):
+        self.max_retries = max_retries
+        self.rate_limiter = rate_limiter
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        
+        # Một session duy nhất, urllib3 giữ và chia sẻ kết nối giữa các luồng
+        self.session = requests.Session()
+        self.session.headers.update({'User-Agent': 'UniProt-3D-Structure-Extractor'})
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_connections, pool_block=True)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def get(self, url, params=None, headers=None, stream=False):
+        """GET có retry; trả về response với các mã lỗi không cần retry (vd: 400, 404)"""
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            if self.rate_limiter is not None:
+                self.rate_limiter.wait()
+            
+            try:
+                with self._semaphore, timed_span('http', url):
+                    response = self.session.get(url, params=params, headers=headers, stream=stream,
+                                                timeout=HTTP_TIMEOUT)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                last_error = e
+                delay = self._backoff(attempt)
+            else:
+                if response.status_code not in HTTP_RETRY_STATUSES:
+                    return response
+                last_error = requests.HTTPError(f"HTTP {response.status_code}", response=response)
+                response.close()
+                delay = self._retry_after(response)
+                if delay is None:
+                    delay = self._backoff(attempt)
+            
+            if attempt < self.max_retries:
+                logger.warning(f"Lỗi tạm thời ({last_error}), thử lại sau {delay:.1f}s: {url}")
+                time.sleep(delay)
+        
+        raise TransientFetchError(f"Hết {self.max_retries} lần thử lại: {last_error}")
+
+    @staticmethod
+    def _backoff(attempt):
+        """Exponential backoff với full jitter"""
+        return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * (2 ** attempt)))
+
+    @staticmethod
+    def _retry_after(response):
+        """Đọc header Retry-After (số giây hoặc ngày giờ HTTP)"""
+        value = response.headers.get('Retry-After')
+        if not value:
+            return None
+        try:
+            return min(HTTP_BACKOFF_MAX, max(0.0, float(value)))
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(value)
+            return min(HTTP_BACKOFF_MAX, max(0.0, retry_at.timestamp() - time.time()))
+        except (TypeError, ValueError):
+            return None
+
+uniprot_client = UniProtClient(rate_limiter=rest_rate_limiter)
+# RCSB/AlphaFold không dùng chung giới hạn tốc độ với UniProt
+download_client = UniProtClient(max_concurrency=DOWNLOAD_WORKERS)
+
+def search_pages(params):
+    """Các trang kết quả tìm kiếm REST theo header Link, tối đa REST_MAX_PAGES trang"""
+    url = f"{UNIPROT_REST_URL}/uniprotkb/search"
+    params = dict(params, format='tsv', size=REST_PAGE_SIZE)
+    for _ in range(REST_MAX_PAGES):
+        response = uniprot_client.get(url, params=params)
+        yield response
+        
+        # Trang tiếp theo nằm trong header Link (URL đã chứa sẵn query và cursor)
+        url = response.links.get('next', {}).get('url')
+        params = None
+        if not url:
+            return
+    logger.warning(f"Dừng sau {REST_MAX_PAGES} trang kết quả: {url}")
+
+def get_entry_from_uniprot_rest(gene_id, entry_name):
+    """Lấy Entry ID qua UniProt REST API, lỗi mạng được ném ra cho caller"""
+    # Lọc theo Entry Name ngay trong truy vấn: gene phổ biến có hàng nghìn kết quả
+    query = f"({gene_id}) AND id:{entry_name}" if entry_name else gene_id
+    for response in search_pages({'query': query, 'fields': 'accession,id'}):
+        if response.status_code == 400:
+            # Query không hợp lệ với cú pháp tìm kiếm của UniProt
+            logger.warning(f"Query không hợp lệ: {gene_id}")
+            return None
+        response.raise_for_status()
+        
+        # Dòng đầu là header: Entry, Entry Name. Không có Entry Name thì lấy kết quả đầu tiên
+        for line in response.text.splitlines()[1:]:
+            cols = line.split('\t')
+            if len(cols) >= 2 and (not entry_name or cols[1].strip() == entry_name):
+                entry = cols[0].strip()
+                logger.info(f"Tìm thấy entry {entry} cho {gene_id} (REST)")
+                return entry
+    
+    logger.warning(f"Không tìm thấy entry name '{entry_name}' cho {gene_id}")
+    return None
+
+def fetch_accessions_by_entry_names(entry_names):
+    """Tra cứu accession cho một lô Entry Name bằng một truy vấn OR"""
+    query = ' OR '.join(f"id:{name}" for name in entry_names)
+    found = []
+    
+    for response in search_pages({'query': query, 'fields': 'accession,id'}):
+        response.raise_for_status()
+        for line in response.text.splitlines()[1:]:
+            cols = line.split('\t')
+            if len(cols) >= 2:
+                found.append((cols[0].strip(), cols[1].strip()))
+    
+    return found
+
+def fetch_entry_versions(entry_ids):
+    """Version và ngày sửa đổi cuối của một lô accession bằng một truy vấn OR"""
+    query = ' OR '.join(f"accession:{entry_id}" for entry_id in entry_ids)
+    found = []
+    
+    for response in search_pages({'query': query, 'fields': 'accession,version,date_modified'}):
+        response.raise_for_status()
+        for line in response.text.splitlines()[1:]:
+            cols = line.split('\t')
+            if len(cols) >= 3:
+                found.append((cols[0].strip(), cols[1].strip(), cols[2].strip()))
+    
+    return found
+
+def resolve_entries_batch(df_input, chunk_size=BATCH_CHUNK_SIZE, max_workers=MAX_WORKERS,
+                          cache=None, force_refresh=False):
+    """Lấy Entry ID theo lô Entry Name và ghép lại vào DataFrame đầu vào"""
+    df = pd.DataFrame({
+        'Query': df_input['Query'].astype(str).str.strip(),
+        'Entry Name': df_input['Entry Name'].astype(str).str.strip()
+    }).reset_index(drop=True)
+    df['Entry ID'] = ""
+    
+    # Lấy các cặp (Query, Entry Name) đã có trong cache
+    keys = "entry:" + df['Query'] + "|" + df['Entry Name']
+    if cache is not None and not force_refresh:
+        cached = cache.get_many(keys.tolist())
+        df['Entry ID'] = keys.map(cached).fillna("")
+    
+    # Chỉ gửi các Entry Name hợp lệ (vd: P53_HUMAN) để tránh lỗi cú pháp truy vấn
+    names = df.loc[df['Entry ID'] == "", 'Entry Name'].drop_duplicates()
+    names = names[names.str.fullmatch(r'[A-Za-z0-9]+_[A-Za-z0-9]+')].tolist()
+    chunks = [names[i:i + chunk_size] for i in range(0, len(names), chunk_size)]
+    
+    found = []
+    if chunks:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [submit_in_context(executor, fetch_accessions_by_entry_names, chunk) for chunk in chunks]
+            for future in as_completed(futures):
+                try:
+                    found.extend(future.result())
+                except requests.RequestException as e:
+                    logger.warning(f"Lỗi tra cứu theo lô, các dòng này sẽ được tra từng dòng: {e}")
+    
+    if found:
+        mapping = pd.DataFrame(found, columns=['Batch ID', 'Entry Name']).drop_duplicates('Entry Name')
+        df = df.merge(mapping, on='Entry Name', how='left')
+        resolved = (df['Entry ID'] == "") & df['Batch ID'].notna()
+        df.loc[resolved, 'Entry ID'] = df.loc[resolved, 'Batch ID']
+        df = df.drop(columns='Batch ID')
+        
+        if cache is not None:
+            cache.set_many(dict(zip(keys[resolved], df.loc[resolved, 'Entry ID'])))
+    
+    return df
+
+def get_entry_id(gene_id, entry_name, pool=None):
+    """Lấy Entry ID, các lời gọi đồng thời cùng cặp Query/Entry Name dùng chung kết quả"""
+    return _inflight.do(entry_cache_key(gene_id, entry_name), _lookup_entry_id, gene_id, entry_name, pool)
+
+def _lookup_entry_id(gene_id, entry_name, pool=None):
+    """Lấy Entry ID, ưu tiên REST API và chỉ dùng Selenium khi API lỗi
+    
+    Trả về None khi UniProt xác nhận không có kết quả, ném TransientFetchError
+    khi không có câu trả lời chắc chắn (API lỗi và Selenium không tìm được).
+    """
+    try:
+        return get_entry_from_uniprot_rest(gene_id, entry_name)
+    except requests.RequestException as e:
+        logger.warning(f"REST API lỗi cho {gene_id}: {e}")
+        rest_error = e
+    
+    if USE_SELENIUM_FALLBACK:
+        logger.info(f"Chuyển sang Selenium cho {gene_id}")
+        entry = get_entry_from_uniprot_selenium(gene_id, entry_name, pool)
+        if entry:
+            return entry
+    
+    raise TransientFetchError(f"Không tra cứu được {gene_id}: {rest_error}")
+
+# Các browser đã xử lý cookie banner (banner chỉ hiện với profile mới)
+_cookie_handled_drivers = weakref.WeakSet()
+
+def dismiss_cookie_banner(driver):
+    """Đóng cookie banner một lần cho mỗi browser, không chờ nếu banner không có"""
+    if driver in _cookie_handled_drivers:
+        return
+    from selenium.webdriver.common.by import By
+    from selenium.common.exceptions import WebDriverException
+    
+    try:
+        buttons = driver.find_elements(By.XPATH, COOKIE_BUTTON_XPATH)
+        if buttons and buttons[0].is_displayed():
+            buttons[0].click()
+            logger.info("Đã đóng cookie banner")
+        else:
+            logger.info("Không có cookie banner")
+    except WebDriverException as e:
+        logger.info(f"Không đóng được cookie banner: {e}")
+    _cookie_handled_drivers.add(driver)
+
+def get_entry_from_uniprot_selenium(gene_id, entry_name, pool=None):
+    """Lấy Entry ID từ UniProt"""
+    from bs4 import BeautifulSoup
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.common.exceptions import TimeoutException
+    
+    url = f"https://www.uniprot.org/uniprotkb?query={gene_id}"
+    
+    try:
+        with _driver_session(pool) as driver:
+            if not driver:
+                logger.error("Không thể tạo driver")
+                return None
+            
+            logger.info(f"Đang truy cập: {url}")
+            uniprot_rate_limiter.wait()
+            with timed_span('navigate', gene_id):
+                driver.get(url)
+        
+            # Chờ trang tải
+            try:
+                with timed_span('wait', gene_id):
+                    WebDriverWait(driver, SELENIUM_WAIT_SECONDS).until(
+                        EC.presence_of_element_located((By.CLASS_NAME, "data-table"))
+                    )
+            except TimeoutException:
+                logger.warning(f"Timeout chờ bảng tải cho {gene_id}")
+                return None
+        
+            # Chấp nhận cookie
+            with timed_span('cookie', gene_id):
+                dismiss_cookie_banner(driver)
+        
+            html_content = driver.page_source
+            with timed_span('parse', gene_id):
+                soup = BeautifulSoup(html_content, 'html.parser')
+        
+            # Tìm bảng
+            table = soup.find('table', class_='data-table')
+            if not table:
+                table = soup.find('table')
+        
+            if not table:
+                logger.warning(f"Không tìm thấy bảng cho {gene_id}")
+                return None
+        
+            tbody = table.find('tbody')
+            if not tbody:
+                logger.warning(f"Không tìm thấy tbody cho {gene_id}")
+                return None
+        
+            rows = tbody.find_all('tr')
+            for row in rows:
+                cols = row.find_all('td')
+                if len(cols) > 3:
+                    current_entry_name = cols[3].text.strip()
+                    if current_entry_name == entry_name:
+                        entry = cols[1].text.strip()
+                        logger.info(f"Tìm thấy entry {entry} cho {gene_id}")
+                        return entry
+        
+            logger.warning(f"Không tìm thấy entry name '{entry_name}' cho {gene_id}")
+            return None
+        
+    except Exception as e:
+        logger.error(f"Lỗi khi xử lý {gene_id}: {e}")
+        return None
+
+def extract_3d_structure_table(final_url, query, entry_name, pool=None):
+    """Lấy thông tin từ bảng 3D structure"""
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.common.exceptions import TimeoutException
+    
+    try:
+        with _driver_session(pool) as driver:
+            if not driver:
+                logger.error("Không thể tạo driver cho 3D structure")
+                return None
+            
+            logger.info(f"Đang truy cập 3D structure: {final_url}")
+            uniprot_rate_limiter.wait()
+            with timed_span('navigate', query):
+                driver.get(final_url)
+            
+            # Chờ bảng trong mục structure xuất hiện thay vì sleep cố định
+            try:
+                with timed_span('wait', query):
+                    WebDriverWait(driver, SELENIUM_WAIT_SECONDS).until(
+                        EC.presence_of_element_located((By.CSS_SELECTOR, "#structure table tr"))
+                    )
+            except TimeoutException:
+                logger.warning(f"Timeout chờ bảng 3D structure cho {query}")
+        
+            # Chấp nhận cookie
+            with timed_span('cookie', query):
+                dismiss_cookie_banner(driver)
+        
+            html_content = driver.page_source
+        
+        # Parse sau khi trả driver về pool để browser phục vụ lượt khác
+        with timed_span('parse', query):
+            result = parse_structure_table(html_content, query, entry_name)
+        if result:
+            logger.info(f"Lấy được {len(result[0])} dòng dữ liệu cho {query}")
+        else:
+            logger.warning(f"Không có dữ liệu 3D structure cho {query}")
+        return result
+    
+    except Exception as e:
+        logger.error(f"Lỗi khi lấy dữ liệu 3D structure cho {query}: {e}")
+        return None
+
+# Từ khóa nhận diện header của bảng 3D structure
+STRUCTURE_KEYWORDS = ['SOURCE', 'IDENTIFIER', 'METHOD', 'RESOLUTION', 'CHAIN', 'POSITIONS', 'LINKS']
+
+def _cell_text(cell):
+    # Tương đương get_text(strip=True) của BeautifulSoup
+    return ''.join(text.strip() for text in cell.itertext())
+
+def _absolute_uniprot_url(href):
+    if href.startswith('/'):
+        return 'https://www.uniprot.org' + href
+    if not href.startswith('http'):
+        return 'https://www.uniprot.org/' + href
+    return href
+
+def _header_cells(table):
+    """Các ô header: hàng trong thead, nếu không có thì hàng đầu tiên"""
+    rows = table.xpath('./thead/tr[1]') or table.xpath('(./tr | ./tbody/tr)[1]')
+    return rows[0].xpath('./th | ./td') if rows else []
+
+def parse_structure_table(html_content, query, entry_name):
+    """Parse bảng 3D structure bằng lxml, chỉ trong mục #structure nếu có
+    
+    Trả về (data, STRUCTURE_HEADERS) hoặc None nếu không có bảng/dữ liệu.
+    """
+    import lxml.html
+    
+    document = lxml.html.fromstring(html_content)
+    section = document.xpath('//*[@id="structure"]')
+    tables = (section[0] if section else document).xpath('.//table')
+    
+    # Một lượt duyệt: bảng khớp header được chọn ngay, bảng có chữ AlphaFold/PDB là dự phòng
+    table, headers, fallback = None, None, None
+    for t in tables:
+        cells = [_cell_text(cell) for cell in _header_cells(t)]
+        joined = ' '.join(cells).upper()
+        if sum(1 for keyword in STRUCTURE_KEYWORDS if keyword in joined) >= 3:
+            table, headers = t, cells
+            break
+        if fallback is None and len(t.xpath('.//tr')) > 1:
+            text = t.text_content().upper()
+            if 'ALPHAFOLD' in text or 'PDB' in text or 'AF-' in text:
+                fallback = (t, cells)
+    
+    if table is None:
+        if fallback is None:
+            logger.warning(f"Không tìm thấy bảng 3D structure cho {query}")
+            return None
+        table, headers = fallback
+    
+    # Vị trí cột được xác định một lần từ header, theo thứ tự STRUCTURE_COLUMNS
+    positions = {header.upper(): i for i, header in enumerate(headers) if header}
+    column_indexes = [positions.get(column.upper()) for column in STRUCTURE_COLUMNS]
+    by_position = all(idx is None for idx in column_indexes)
+    if by_position:
+        # Bảng dự phòng không có header nào trùng tên cột: lấy cột theo thứ tự của UniProt
+        column_indexes = list(range(len(STRUCTURE_COLUMNS)))
+        logger.warning(f"Bảng 3D structure của {query} không có header chuẩn {headers}, lấy cột theo vị trí")
+    elif fallback is not None and table is fallback[0]:
+        known = {column.upper() for column in STRUCTURE_COLUMNS}
+        dropped = [header for header in headers if header and header.upper() not in known]
+        if dropped:
+            logger.warning(f"Bỏ các cột không nhận ra trong bảng 3D structure của {query}: {dropped}")
+    
+    # Không có thead thì hàng đầu là header khi khớp tên cột hoặc gồm các ô th,
+    # bảng lấy theo vị trí mà hàng đầu toàn ô td thì đó là dữ liệu
+    rows = table.xpath('./tr | ./tbody/tr')
+    if rows and not table.xpath('./thead/tr') and (not by_position or rows[0].xpath('./th')):
+        rows = rows[1:]
+    
+    data = []
+    for row in rows:
+        cells = row.xpath('./td | ./th')
+        row_data = []
+        for idx in column_indexes:
+            if idx is None or idx >= len(cells):
+                row_data.append("")
+                continue
+            cell = cells[idx]
+            cell_text = _cell_text(cell)
+            link_urls = [_absolute_uniprot_url(href) for href in cell.xpath('.//a/@href') if href]
+            if link_urls:
+                cell_text = _format_links(cell_text, link_urls)
+            row_data.append(cell_text)
+        
+        if any(row_data):
+            data.append([query, entry_name] + row_data)
+    
+    if not data:
+        return None
+    return data, list(STRUCTURE_HEADERS)
+
+def _format_links(label, urls):
+    """Ghép nhãn và link theo định dạng ô của bảng 3D structure"""
+    return f"{label}{STRUCTURE_LINKS_SEPARATOR}{'; '.join(urls)}"
+
+def _xref_properties(xref):
+    return {prop.get('key'): prop.get('value') for prop in xref.get('properties', [])}
+
+def _pdb_structure_row(xref):
+    """Chuyển một cross-reference PDB thành dòng của bảng 3D structure"""
+    pdb_id = xref['id']
+    props = _xref_properties(xref)
+    
+    resolution = props.get('Resolution', '-')
+    resolution = "" if resolution in ('', '-') else resolution.replace(' A', ' Å')
+    
+    # Chains có dạng "A/B=1-393, C=94-312"
+    chains, positions = [], []
+    for segment in props.get('Chains', '').split(','):
+        chain, _, position = segment.strip().partition('=')
+        if chain:
+            chains.append(chain)
+            positions.append(position)
+    
+    links = _format_links('PDBe, RCSB-PDB, PDBj, PDBsum', [
+        f"https://www.ebi.ac.uk/pdbe/entry/pdb/{pdb_id.lower()}",
+        f"https://www.rcsb.org/structure/{pdb_id}",
+        f"https://pdbj.org/mine/summary/{pdb_id.lower()}",
+        f"https://www.ebi.ac.uk/thornton-srv/databases/cgi-bin/pdbsum/GetPage.pl?pdbcode={pdb_id.lower()}"
+    ])
+    return ['PDB', pdb_id, props.get('Method', ''), resolution, ', '.join(chains), ', '.join(positions), links]
+
+def _alphafold_structure_row(xref, length):
+    """Chuyển một cross-reference AlphaFoldDB thành dòng của bảng 3D structure"""
+    accession = xref['id']
+    links = _format_links('AlphaFold', [f"https://alphafold.ebi.ac.uk/entry/{accession}"])
+    positions = f"1-{length}" if length else ""
+    return ['AlphaFoldDB', f"AF-{accession}-F1", 'Predicted', "", 'A', positions, links]
+
+def extract_3d_structure_json(entry_id, query, entry_name):
+    """Lấy bảng 3D structure từ cross-reference PDB/AlphaFoldDB của entry JSON"""
+    url = f"{UNIPROT_REST_URL}/uniprotkb/{entry_id}"
+    params = {
+        'format': 'json',
+        'fields': 'accession,length,xref_pdb,xref_alphafolddb'
+    }
+    
+    response = uniprot_client.get(url, params=params)
+    if response.status_code == 404:
+        logger.warning(f"Không tìm thấy entry {entry_id} cho {query}")
+        return None
+    response.raise_for_status()
+    
+    with timed_span('parse', entry_id):
+        entry = response.json()
+        length = entry.get('sequence', {}).get('length')
+        
+        data = []
+        for xref in entry.get('uniProtKBCrossReferences', []):
+            database = xref.get('database')
+            if database == 'PDB':
+                row = _pdb_structure_row(xref)
+            elif database == 'AlphaFoldDB':
+                row = _alphafold_structure_row(xref, length)
+            else:
+                continue
+            data.append([query, entry_name] + row)
+    
+    if data:
+        logger.info(f"Lấy được {len(data)} dòng dữ liệu cho {query} (REST)")
+        return data, list(STRUCTURE_HEADERS)
+    
+    logger.warning(f"Không có dữ liệu cho {query}")
+    return None
+
+def structure_records(structure_rows, headers=STRUCTURE_HEADERS):
+    """Chuyển các dòng 3D structure dạng chuỗi thành DataFrame có kiểu theo STRUCTURE_RECORD_COLUMNS
+    
+    Nhận DataFrame hoặc danh sách dòng theo headers; thiếu Query/Entry Name thì bỏ 2 cột đó.
+    """
+    if isinstance(structure_rows, pd.DataFrame):
+        df = structure_rows
+    else:
+        df = pd.DataFrame(list(structure_rows), columns=headers)
+    df = df.astype(str)
+    
+    # Ô lấy từ trang web có thể kèm link ở bất kỳ cột nào: tách nhãn và gom link về một cột
+    texts, link_texts = {}, []
+    for column in STRUCTURE_COLUMNS:
+        parts = df[column].str.partition(STRUCTURE_LINKS_SEPARATOR)
+        texts[column] = parts[0].str.strip()
+        link_texts.append(parts[2])
+    links = link_texts[0].str.cat(link_texts[1:], sep='; ')
+    
+    # "A/B=1-393, C=94-312" -> Start = 1, End = 393
+    positions = texts['Positions'].str.extractall(r'(\d+)\s*-\s*(\d+)').astype('int64')
+    bounds = positions.groupby(level=0).agg({0: 'min', 1: 'max'})
+    
+    records = pd.DataFrame({
+        'Query': df['Query'] if 'Query' in df else None,
+        'Entry Name': df['Entry Name'] if 'Entry Name' in df else None,
+        'Source': texts['Source'].astype('category'),
+        'Identifier': texts['Identifier'],
+        'Method': texts['Method'].astype('category'),
+        'Resolution': pd.to_numeric(texts['Resolution'].str.extract(r'(\d+(?:\.\d+)?)')[0], errors='coerce'),
+        'Chain': texts['Chain'],
+        'Start': bounds[0].reindex(df.index).astype('Int64'),
+        'End': bounds[1].reindex(df.index).astype('Int64'),
+        'Links': [[url for url in value.split('; ') if url] for value in links]
+    }, index=df.index)
+    if 'Query' not in df:
+        records = records.drop(columns=['Query', 'Entry Name'])
+    return records.reset_index(drop=True)
+
+def _normalize_structure_rows(data, headers):
+    """Sắp xếp lại các cột lấy từ trang web theo STRUCTURE_HEADERS"""
+    if headers == STRUCTURE_HEADERS:
+        return data
+    positions = {header.strip().upper(): i for i, header in enumerate(headers)}
+    return [
+        [row[positions[header.upper()]] if header.upper() in positions else "" for header in STRUCTURE_HEADERS]
+        for row in data
+    ]
+
+def get_structure_rows(entry_id, final_url, pool=None, cache=None, force_refresh=False):
+    """Các dòng 3D structure của một accession, dùng cache nếu có rồi mới gọi UniProt"""
+    key = structure_cache_key(entry_id)
+    if cache is not None and not force_refresh:
+        rows = cache.get(key)
+        if rows is not None:
+            return rows
+    return _inflight.do(key, _fetch_structure_rows, entry_id, final_url, pool, cache)
+
+def _fetch_structure_rows(entry_id, final_url, pool=None, cache=None):
+    result = _fetch_structure_data(entry_id, final_url, entry_id, "", pool)
+    
+    # Lưu theo accession, không kèm Query/Entry Name của dòng. Entry không có structure
+    # (hoặc 404) là kết quả chắc chắn nên cũng được cache dưới dạng danh sách rỗng;
+    # lỗi tạm thời được ném ra từ _fetch_structure_data và không bị cache
+    rows = [row[2:] for row in result[0]] if result else []
+    if cache is not None:
+        cache.set(structure_cache_key(entry_id), rows)
+    return rows
+
+def _fetch_structure_data(entry_id, final_url, query, entry_name, pool=None):
+    """Lấy dữ liệu 3D structure, ưu tiên REST API và chỉ dùng Selenium khi API lỗi"""
+    try:
+        return extract_3d_structure_json(entry_id, query, entry_name)
+    except (requests.RequestException, ValueError) as e:
+        logger.warning(f"REST API lỗi khi lấy 3D structure cho {query}: {e}")
+        rest_error = e
+    
+    if USE_SELENIUM_FALLBACK:
+        logger.info(f"Chuyển sang Selenium cho 3D structure của {query}")
+        result = extract_3d_structure_table(final_url, query, entry_name, pool)
+        if result:
+            data, headers = result
+            return _normalize_structure_rows(data, headers), list(STRUCTURE_HEADERS)
+    
+    raise TransientFetchError(f"Không lấy được 3D structure cho {query}: {rest_error}")
+
+def format_duration(seconds):
+    """Định dạng thời gian còn lại"""
+    minutes = int(seconds // 60)
+    seconds = int(seconds % 60)
+    
+    if minutes > 0:
+        return f"Còn khoảng {minutes} phút {seconds} giây"
+    else:
+        return f"Còn khoảng {seconds} giây"
+
+class ThroughputEstimator:
+    """Ước tính tốc độ xử lý và ETA bằng trung bình trượt trên cửa sổ thời gian gần nhất
+    
+    Không tự khóa: khi được cập nhật và đọc từ nhiều luồng (JobProgress) thì caller giữ lock.
+    """
+
+    def __init__(self, window_seconds=THROUGHPUT_WINDOW_SECONDS):
+        self.window_seconds = window_seconds
+        self.samples = deque()
+
+    def reset(self):
+        self.samples.clear()
+
+    def update(self, done, now=None):
+        now = time.monotonic() if now is None else now
+        self.samples.append((now, done))
+        # Giữ lại ít nhất 2 mẫu để luôn tính được tốc độ
+        while len(self.samples) > 2 and now - self.samples[0][0] > self.window_seconds:
+            self.samples.popleft()
+
+    def rate(self):
+        """Số đơn vị xử lý mỗi giây trong cửa sổ gần nhất, None nếu chưa đủ dữ liệu"""
+        if len(self.samples) < 2:
+            return None
+        (start_time, start_done), (end_time, end_done) = self.samples[0], self.samples[-1]
+        if end_time <= start_time or end_done <= start_done:
+            return None
+        return (end_done - start_done) / (end_time - start_time)
+
+    def eta(self, total):
+        """Số giây còn lại ước tính"""
+        rate = self.rate()
+        if not rate:
+            return None
+        return max(0.0, (total - self.samples[-1][1]) / rate)
+
+class JobCheckpoint:
+    """Lưu trạng thái từng dòng (pending/resolved/extracted/failed) của một job vào SQLite"""
+
+    def __init__(self, job_id, path=CHECKPOINT_PATH):
+        self.job_id = job_id
+        self.path = path
+        self._lock = threading.Lock()
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS job_rows ("
+            "job_id TEXT NOT NULL, row_idx INTEGER NOT NULL, query TEXT, entry_name TEXT, "
+            "state TEXT NOT NULL, entry_id TEXT NOT NULL DEFAULT '', error TEXT NOT NULL DEFAULT '', "
+            "updated_at REAL NOT NULL, PRIMARY KEY (job_id, row_idx));"
+            "CREATE TABLE IF NOT EXISTS job_structures ("
+            "job_id TEXT NOT NULL, entry_id TEXT NOT NULL, rows TEXT NOT NULL, "
+            "PRIMARY KEY (job_id, entry_id));"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def job_id_for(file_bytes):
+        """Job được xác định bởi nội dung file upload"""
+        return hashlib.sha256(file_bytes).hexdigest()[:16]
+
+    @staticmethod
+    def job_id_for_file(path, block_size=1 << 20):
+        """Như job_id_for nhưng băm file theo từng khối, không đọc cả file vào bộ nhớ"""
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(block_size), b""):
+                digest.update(block)
+        return digest.hexdigest()[:16]
+
+    def start(self, df_rows):
+        """Ghi các dòng đầu vào ở trạng thái pending, giữ nguyên các dòng đã có"""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO job_rows (job_id, row_idx, query, entry_name, state, updated_at) "
+                "VALUES (?, ?, ?, ?, 'pending', ?)",
+                [(self.job_id, int(idx), query, entry_name, now)
+                 for idx, query, entry_name in df_rows[['Query', 'Entry Name']].itertuples()]
+            )
+            self._conn.commit()
+
+    def load_rows(self):
+        """Trạng thái các dòng, index theo thứ tự dòng trong file"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT row_idx, state, entry_id, error FROM job_rows WHERE job_id = ? ORDER BY row_idx",
+                (self.job_id,)
+            ).fetchall()
+        return pd.DataFrame(rows, columns=['row_idx', 'state', 'entry_id', 'error']).set_index('row_idx')
+
+    def mark_rows(self, updates):
+        """Cập nhật danh sách (row_idx, state, entry_id, error)"""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE job_rows SET state = ?, entry_id = ?, error = ?, updated_at = ? "
+                "WHERE job_id = ? AND row_idx = ?",
+                [(state, entry_id, error, now, self.job_id, int(idx)) for idx, state, entry_id, error in updates]
+            )
+            self._conn.commit()
+
+    def mark_entry(self, entry_id, rows, error=""):
+        """Lưu kết quả bước 2 của một Entry ID và cập nhật các dòng đang chờ"""
+        state = 'extracted' if rows is not None else 'failed'
+        with self._lock:
+            if rows is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO job_structures (job_id, entry_id, rows) VALUES (?, ?, ?)",
+                    (self.job_id, entry_id, json.dumps(rows))
+                )
+            self._conn.execute(
+                "UPDATE job_rows SET state = ?, error = ?, updated_at = ? "
+                "WHERE job_id = ? AND entry_id = ? AND state = 'resolved'",
+                (state, error, time.time(), self.job_id, entry_id)
+            )
+            self._conn.commit()
+
+    def load_structures(self):
+        """Các dòng 3D structure đã lấy được, theo Entry ID"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT entry_id, rows FROM job_structures WHERE job_id = ?", (self.job_id,)
+            ).fetchall()
+        return {entry_id: json.loads(data) for entry_id, data in rows}
+
+    def summary(self):
+        """Số dòng theo từng trạng thái"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT state, COUNT(*) FROM job_rows WHERE job_id = ? GROUP BY state", (self.job_id,)
+            ).fetchall()
+        return dict(rows)
+
+    def reset_failed(self):
+        """Đưa các dòng thất bại về trạng thái chờ để chạy lại"""
+        with self._lock:
+            # Dòng đã có Entry ID chỉ cần chạy lại bước 2
+            self._conn.execute(
+                "UPDATE job_rows SET state = CASE WHEN entry_id != '' THEN 'resolved' ELSE 'pending' END, "
+                "error = '', updated_at = ? WHERE job_id = ? AND state = 'failed'",
+                (time.time(), self.job_id)
+            )
+            self._conn.commit()
+
+    def clear(self):
+        """Xóa toàn bộ checkpoint của job"""
+        with self._lock:
+            self._conn.execute("DELETE FROM job_rows WHERE job_id = ?", (self.job_id,))
+            self._conn.execute("DELETE FROM job_structures WHERE job_id = ?", (self.job_id,))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class ShardQueue:
+    """Hàng đợi shard trong SQLite: chia file đầu vào thành các khối dòng để nhiều worker cùng nhận
+    
+    Worker nhận shard trong một transaction BEGIN IMMEDIATE và giữ lease bằng heartbeat;
+    shard hết lease (worker chết) được worker khác nhận lại. Nhiều máy dùng chung một file
+    queue cần ổ đĩa mạng hỗ trợ file lock của SQLite.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Tự quản lý transaction để khóa ghi ngay khi nhận shard
+        self._conn = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS shards ("
+            "shard_id INTEGER PRIMARY KEY, state TEXT NOT NULL, worker TEXT NOT NULL DEFAULT '', "
+            "attempts INTEGER NOT NULL DEFAULT 0, lease_until REAL NOT NULL DEFAULT 0, "
+            "error TEXT NOT NULL DEFAULT '', updated_at REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS shard_rows ("
+            "row_idx INTEGER PRIMARY KEY, shard_id INTEGER NOT NULL, query TEXT, entry_name TEXT);"
+            "CREATE INDEX IF NOT EXISTS shard_rows_shard ON shard_rows (shard_id);"
+            "CREATE TABLE IF NOT EXISTS shard_results ("
+            "shard_id INTEGER PRIMARY KEY, entries TEXT NOT NULL, structures TEXT NOT NULL);"
+        )
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def create(self, df_input, shard_rows=QUEUE_SHARD_ROWS):
+        """Chia đầu vào (DataFrame hoặc các khối) thành shard; trả về số shard"""
+        with self._transaction() as conn:
+            if conn.execute("SELECT COUNT(*) FROM shards").fetchone()[0]:
+                raise ValueError(f"Hàng đợi {self.path} đã có dữ liệu")
+            
+            row_idx = 0
+            for chunk in _input_chunks(df_input):
+                rows = list(chunk[REQUIRED_COLUMNS].astype(str).itertuples(index=False, name=None))
+                conn.executemany(
+                    "INSERT INTO shard_rows (row_idx, shard_id, query, entry_name) VALUES (?, ?, ?, ?)",
+                    [(row_idx + i, (row_idx + i) // shard_rows, query.strip(), entry_name.strip())
+                     for i, (query, entry_name) in enumerate(rows)]
+                )
+                row_idx += len(rows)
+            
+            shard_count = (row_idx + shard_rows - 1) // shard_rows
+            now = time.time()
+            conn.executemany(
+                "INSERT INTO shards (shard_id, state, updated_at) VALUES (?, 'pending', ?)",
+                [(shard_id, now) for shard_id in range(shard_count)]
+            )
+        return shard_count
+
+    def claim(self, worker_id, lease_seconds=QUEUE_LEASE_SECONDS):
+        """Nhận một shard đang chờ (hoặc hết lease); trả về (shard_id, DataFrame) hoặc None"""
+        now = time.time()
+        with self._transaction() as conn:
+            # Shard hết lease quá số lần cho phép thì coi là thất bại, không nhận lại mãi
+            conn.execute(
+                "UPDATE shards SET state = 'failed', error = 'Hết lease quá số lần cho phép', updated_at = ? "
+                "WHERE state = 'running' AND lease_until < ? AND attempts >= ?",
+                (now, now, QUEUE_MAX_ATTEMPTS)
+            )
+            row = conn.execute(
+                "SELECT shard_id FROM shards WHERE state = 'pending' OR (state = 'running' AND lease_until < ?) "
+                "ORDER BY shard_id LIMIT 1",
+                (now,)
+            ).fetchone()
+            if row is None:
+                return None
+            shard_id = row[0]
+            conn.execute(
+                "UPDATE shards SET state = 'running', worker = ?, attempts = attempts + 1, lease_until = ?, "
+                "updated_at = ? WHERE shard_id = ?",
+                (worker_id, now + lease_seconds, now, shard_id)
+            )
+            rows = conn.execute(
+                "SELECT row_idx, query, entry_name FROM shard_rows WHERE shard_id = ? ORDER BY row_idx",
+                (shard_id,)
+            ).fetchall()
+        
+        df_shard = pd.DataFrame(rows, columns=['row_idx'] + REQUIRED_COLUMNS).set_index('row_idx')
+        return shard_id, df_shard
+
+    def heartbeat(self, shard_id, worker_id, lease_seconds=QUEUE_LEASE_SECONDS):
+        """Gia hạn lease của shard worker đang giữ; False nếu shard đã bị worker khác nhận lại"""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE shards SET lease_until = ?, updated_at = ? "
+                "WHERE shard_id = ? AND worker = ? AND state = 'running'",
+                (now + lease_seconds, now, shard_id, worker_id)
+            )
+        return cursor.rowcount > 0
+
+    def complete(self, shard_id, worker_id, df_entry_results, df_final_results):
+        """Lưu kết quả của shard và đánh dấu xong
+        
+        Chỉ worker còn giữ shard mới được ghi; trả về False nếu shard đã hết lease và
+        bị worker khác nhận lại (kết quả của worker đó được giữ).
+        """
+        structures = df_final_results.values.tolist() if df_final_results is not None else []
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE shards SET state = 'done', error = '', updated_at = ? "
+                "WHERE shard_id = ? AND worker = ? AND state = 'running'",
+                (time.time(), shard_id, worker_id)
+            )
+            if cursor.rowcount == 0:
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO shard_results (shard_id, entries, structures) VALUES (?, ?, ?)",
+                (shard_id, df_entry_results.to_json(orient='split', index=False, force_ascii=False),
+                 json.dumps(structures, ensure_ascii=False))
+            )
+        return True
+
+    def fail(self, shard_id, worker_id, error):
+        """Trả shard về hàng đợi, hoặc đánh dấu thất bại khi đã thử đủ số lần (chỉ worker còn giữ shard)"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE shards SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "error = ?, lease_until = 0, updated_at = ? WHERE shard_id = ? AND worker = ? AND state = 'running'",
+                (QUEUE_MAX_ATTEMPTS, error, time.time(), shard_id, worker_id)
+            )
+        return cursor.rowcount > 0
+
+    def reset_failed(self):
+        """Đưa các shard thất bại về trạng thái chờ"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE shards SET state = 'pending', attempts = 0, error = '', updated_at = ? "
+                "WHERE state = 'failed'",
+                (time.time(),)
+            )
+
+    def summary(self):
+        """Số shard theo từng trạng thái"""
+        with self._lock:
+            rows = self._conn.execute("SELECT state, COUNT(*) FROM shards GROUP BY state").fetchall()
+        return dict(rows)
+
+    def load_results(self, partial=False):
+        """Gộp kết quả các shard theo thứ tự dòng của file đầu vào
+        
+        Shard chưa xong làm merge lỗi, trừ khi partial: khi đó các dòng của shard
+        đó vẫn có trong bảng Entry IDs với trạng thái lỗi tạm thời.
+        """
+        with self._lock:
+            shards = self._conn.execute("SELECT shard_id, state FROM shards ORDER BY shard_id").fetchall()
+        unfinished = [shard_id for shard_id, state in shards if state != 'done']
+        if unfinished and not partial:
+            raise ValueError(f"{len(unfinished)}/{len(shards)} shard chưa xong: {unfinished[:10]}")
+        
+        entry_frames, structure_rows = [], []
+        for shard_id, state in shards:
+            if state == 'done':
+                with self._lock:
+                    entries, structures = self._conn.execute(
+                        "SELECT entries, structures FROM shard_results WHERE shard_id = ?", (shard_id,)
+                    ).fetchone()
+                entry_frames.append(pd.read_json(io.StringIO(entries), orient='split', dtype=False))
+                structure_rows.extend(json.loads(structures))
+            else:
+                with self._lock:
+                    rows = self._conn.execute(
+                        "SELECT query, entry_name FROM shard_rows WHERE shard_id = ? ORDER BY row_idx", (shard_id,)
+                    ).fetchall()
+                missing = pd.DataFrame(rows, columns=REQUIRED_COLUMNS)
+                missing['Entry ID'] = ""
+                missing['Final URL'] = ""
+                missing['Status'] = STATUS_TRANSIENT
+                entry_frames.append(missing)
+        
+        df_entry_results = pd.concat(entry_frames, ignore_index=True) if entry_frames else pd.DataFrame(
+            columns=REQUIRED_COLUMNS + ['Entry ID', 'Final URL', 'Status']
+        )
+        df_final_results = pd.DataFrame(structure_rows, columns=STRUCTURE_HEADERS) if structure_rows else None
+        return df_entry_results, df_final_results
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def run_queue_worker(queue_path, worker_id=None, max_workers=MAX_WORKERS, cache=None):
+    """Nhận và xử lý shard cho tới khi hàng đợi hết việc; trả về số shard đã xong"""
+    shard_queue = ShardQueue(queue_path)
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    completed = 0
+    try:
+        while True:
+            claimed = shard_queue.claim(worker_id)
+            if claimed is None:
+                break
+            shard_id, df_shard = claimed
+            logger.info(f"{worker_id} nhận shard {shard_id} ({len(df_shard)} dòng)")
+            
+            stop = threading.Event()
+            heartbeat = threading.Thread(target=_queue_heartbeat, args=(shard_queue, shard_id, worker_id, stop),
+                                         daemon=True)
+            heartbeat.start()
+            try:
+                df_entry_results, df_final_results = run_pipeline(df_shard, max_workers=max_workers, cache=cache)
+                if shard_queue.complete(shard_id, worker_id, df_entry_results, df_final_results):
+                    completed += 1
+                else:
+                    logger.warning(f"{worker_id} mất lease shard {shard_id}, bỏ kết quả")
+            except Exception as e:
+                logger.exception(f"Shard {shard_id} lỗi")
+                if not shard_queue.fail(shard_id, worker_id, str(e)):
+                    logger.warning(f"{worker_id} mất lease shard {shard_id}")
+            finally:
+                stop.set()
+                heartbeat.join()
+    finally:
+        shard_queue.close()
+    logger.info(f"{worker_id} dừng: hàng đợi hết việc, đã xong {completed} shard")
+    return completed
+
+def _queue_heartbeat(shard_queue, shard_id, worker_id, stop):
+    while not stop.wait(QUEUE_HEARTBEAT_SECONDS):
+        # Lỗi SQLite (vd: file queue đang bị khóa) chỉ bỏ qua một nhịp, lần sau thử lại
+        try:
+            if not shard_queue.heartbeat(shard_id, worker_id):
+                logger.warning(f"{worker_id} mất lease shard {shard_id}")
+                return
+        except sqlite3.Error as e:
+            logger.warning(f"Không gia hạn được lease shard {shard_id}: {e}")
+
+def _queue_worker_process(queue_path, worker_id, max_workers, use_cache, use_selenium, rate_share, log_level):
+    """Điểm vào của process con khi chạy nhiều worker trên một máy"""
+    global USE_SELENIUM_FALLBACK
+    USE_SELENIUM_FALLBACK = use_selenium
+    logging.getLogger().setLevel(log_level)
+    # Các process trên cùng máy chia nhau giới hạn tốc độ tới UniProt
+    rest_rate_limiter.interval *= rate_share
+    uniprot_rate_limiter.interval *= rate_share
+    return run_queue_worker(queue_path, worker_id, max_workers, ResponseCache() if use_cache else None)
+
+class StreamingExporter:
+    """Ghi kết quả ra CSV ngay khi từng protein xong và xuất Excel ở chế độ write-only"""
+
+    def __init__(self, run_dir):
+        os.makedirs(run_dir, exist_ok=True)
+        self.run_dir = run_dir
+        self.structures_path = os.path.join(run_dir, "3D_Structures.csv")
+        self.entries_path = os.path.join(run_dir, "Entry_IDs.csv")
+        self.xlsx_path = None
+        self.parquet_path = None
+        self.rows_written = 0
+        self._lock = threading.Lock()
+        
+        # utf-8-sig để Excel đọc đúng tiếng Việt
+        self._structures_file = open(self.structures_path, 'w', newline='', encoding='utf-8-sig')
+        self._structures_writer = csv.writer(self._structures_file)
+        self._structures_writer.writerow(STRUCTURE_HEADERS)
+        self._structures_file.flush()
+
+    def write_entries(self, df_entry_results):
+        """Ghi bảng Entry IDs sau khi xong bước 1 (ghi lại nếu bước 2 đổi trạng thái dòng)"""
+        with timed_span('export', "Entry_IDs.csv"):
+            df_entry_results.to_csv(self.entries_path, index=False, encoding='utf-8-sig')
+
+    def append_structures(self, rows):
+        """Ghi thêm các dòng 3D structure và flush ngay xuống đĩa"""
+        if not rows:
+            return
+        with self._lock, timed_span('export', "3D_Structures.csv"):
+            self._structures_writer.writerows(rows)
+            self._structures_file.flush()
+            self.rows_written += len(rows)
+
+    def write_xlsx(self, df_entry_results, structure_rows, filename, df_changes=None):
+        """Xuất file Excel 2 sheet (thêm sheet Structure_Changes nếu có df_changes) bằng workbook write-only"""
+        self.xlsx_path = os.path.join(self.run_dir, filename)
+        with timed_span('export', filename):
+            _write_workbook(self.xlsx_path, structure_rows, df_entry_results.itertuples(index=False),
+                            list(df_entry_results.columns),
+                            df_changes.itertuples(index=False) if df_changes is not None else None)
+        logger.info(f"Đã xuất {self.xlsx_path}")
+        return self.xlsx_path
+
+    def write_parquet(self, df_final_results, filename="3D_Structures.parquet"):
+        """Xuất bảng 3D structure dạng cột có kiểu ra Parquet, None nếu chưa cài pyarrow"""
+        path = os.path.join(self.run_dir, filename)
+        with timed_span('export', filename):
+            records = structure_records(df_final_results)
+            try:
+                records.to_parquet(path, index=False)
+            except ImportError as e:
+                logger.warning(f"Bỏ qua file Parquet: {e}")
+                return None
+        self.parquet_path = path
+        logger.info(f"Đã xuất {path}")
+        return path
+
+    def close(self):
+        with self._lock:
+            if not self._structures_file.closed:
+                self._structures_file.close()
+
+def _write_workbook(target, structure_rows, entry_rows, entry_headers, change_rows=None):
+    """Ghi 2 sheet 3D_Structures và Entry_IDs (thêm Structure_Changes khi delta-sync) từng dòng một"""
+    from openpyxl import Workbook
+    
+    workbook = Workbook(write_only=True)
+    structures_sheet = workbook.create_sheet('3D_Structures')
+    structures_sheet.append(STRUCTURE_HEADERS)
+    for row in structure_rows:
+        structures_sheet.append(list(row))
+    
+    entries_sheet = workbook.create_sheet('Entry_IDs')
+    entries_sheet.append(entry_headers)
+    for row in entry_rows:
+        entries_sheet.append(list(row))
+    
+    if change_rows is not None:
+        changes_sheet = workbook.create_sheet('Structure_Changes')
+        changes_sheet.append(CHANGE_HEADERS)
+        for row in change_rows:
+            changes_sheet.append(list(row))
+    
+    workbook.save(target)
+
+def create_run_exporter():
+    """Tạo thư mục kết quả riêng cho một lần chạy"""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    return StreamingExporter(os.path.join(EXPORT_DIR, f"run_{timestamp}"))
+
+def build_partial_xlsx(run_dir):
+    """Tạo file Excel từ các CSV đã ghi được của một lần chạy (kể cả khi chưa xong)"""
+    structures_path = os.path.join(run_dir, "3D_Structures.csv")
+    entries_path = os.path.join(run_dir, "Entry_IDs.csv")
+    output = io.BytesIO()
+    
+    with open(structures_path, newline='', encoding='utf-8-sig') as structures_file:
+        structure_rows = csv.reader(structures_file)
+        next(structure_rows, None)
+        
+        entry_headers, entry_rows = [], []
+        entries_file = None
+        if os.path.exists(entries_path):
+            entries_file = open(entries_path, newline='', encoding='utf-8-sig')
+            entry_rows = csv.reader(entries_file)
+            entry_headers = next(entry_rows, [])
+        try:
+            _write_workbook(output, structure_rows, entry_rows, entry_headers)
+        finally:
+            if entries_file:
+                entries_file.close()
+    
+    return output.getvalue()
+
+class StructureDownloader:
+    """Tải song song file mmCIF (RCSB) và model AlphaFold của các dòng 3D structure
+    
+    File đã tải được ghi vào manifest.json kèm sha256 và ETag; lần sau file còn
+    nguyên thì được bỏ qua hoặc chỉ hỏi lại server bằng If-None-Match.
+    Nhiều downloader (job song song, worker của queue) có thể dùng chung thư mục:
+    mỗi file được tải dưới lock file riêng và manifest được gộp với bản trên đĩa khi lưu.
+    """
+
+    def __init__(self, output_dir=STRUCTURE_DOWNLOAD_DIR, methods=None, max_resolution=None,
+                 include_alphafold=True, max_workers=DOWNLOAD_WORKERS, client=None):
+        self.output_dir = output_dir
+        self.methods = {method.upper() for method in methods} if methods else None
+        self.max_resolution = max_resolution
+        self.include_alphafold = include_alphafold
+        self.max_workers = max_workers
+        self.client = client if client is not None else download_client
+        self.manifest_path = os.path.join(output_dir, "manifest.json")
+        self.records = []
+        self._lock = threading.Lock()
+        self._updated = {}
+        
+        os.makedirs(output_dir, exist_ok=True)
+        self.manifest = self._read_manifest()
+
+    def _read_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return {}
+        with open(self.manifest_path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def select(self, structure_rows):
+        """Các cặp (Source, Identifier) không trùng lặp thỏa bộ lọc method/resolution"""
+        structure_rows = list(structure_rows)
+        if not structure_rows:
+            return []
+        records = structure_records(structure_rows, STRUCTURE_COLUMNS)
+        
+        keep = records['Source'] == 'PDB'
+        if self.methods is not None:
+            keep &= records['Method'].astype(str).str.upper().isin(self.methods)
+        if self.max_resolution is not None:
+            # Không có resolution (NaN) thì bị loại
+            keep &= records['Resolution'] <= self.max_resolution
+        if self.include_alphafold:
+            keep |= records['Source'] == 'AlphaFoldDB'
+        
+        selected = records.loc[keep, ['Source', 'Identifier']].drop_duplicates()
+        return list(selected.itertuples(index=False, name=None))
+
+    def download(self, structure_rows, progress_callback=None, cancel_event=None):
+        """Tải các file đã chọn, trả về danh sách bản ghi manifest của lần chạy"""
+        targets = self.select(structure_rows)
+        records = []
+        _notify(progress_callback, 'downloads', 0, len(targets))
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {submit_in_context(executor, self._download_one, source, identifier): identifier
+                       for source, identifier in targets}
+            for done, future in enumerate(as_completed(futures), start=1):
+                record = future.result()
+                records.append(record)
+                if cancel_event is not None and cancel_event.is_set():
+                    # Giữ manifest của các file đã tải xong
+                    self.save_manifest()
+                    _check_cancelled(cancel_event, futures)
+                _notify(progress_callback, 'downloads', done, len(targets), label=futures[future],
+                        downloaded=sum(1 for r in records if r['status'] == 'downloaded'),
+                        failed=sum(1 for r in records if r['status'] == 'failed'))
+        
+        self.save_manifest()
+        self.records = records
+        return records
+
+    def _download_one(self, source, identifier):
+        record = {'source': source, 'identifier': identifier, 'file': "", 'status': 'failed', 'error': ""}
+        try:
+            with timed_span('download', identifier):
+                url, filename = self._resolve(source, identifier)
+                record['file'] = filename
+                record.update(self._fetch(url, filename))
+        except (requests.RequestException, TransientFetchError, OSError, ValueError) as e:
+            logger.warning(f"Không tải được {identifier}: {e}")
+            record['error'] = str(e)
+        return record
+
+    def _resolve(self, source, identifier):
+        """URL và tên file của một structure"""
+        if source == 'PDB':
+            return RCSB_DOWNLOAD_URL.format(pdb_id=identifier.upper()), f"{identifier.upper()}.cif"
+        
+        # Identifier AlphaFold có dạng AF-<accession>-F1, URL file lấy từ API
+        accession = identifier.split('-')[1] if identifier.startswith('AF-') else identifier
+        for extension in ('.cif', '.pdb'):
+            known = self.manifest.get(f"{identifier}{extension}")
+            if known and known.get('url'):
+                return known['url'], f"{identifier}{extension}"
+        response = self.client.get(ALPHAFOLD_API_URL.format(accession=accession))
+        response.raise_for_status()
+        predictions = response.json()
+        if not predictions:
+            raise ValueError(f"AlphaFold không có model cho {accession}")
+        # Không có cifUrl thì lấy pdbUrl, tên file theo đuôi của URL thật
+        url = predictions[0].get('cifUrl') or predictions[0]['pdbUrl']
+        extension = os.path.splitext(urlparse(url).path)[1].lower() or '.cif'
+        return url, f"{identifier}{extension}"
+
+    def _fetch(self, url, filename):
+        """Ghi file theo luồng, tải tiếp từ file .part nếu lần trước bị ngắt"""
+        path = os.path.join(self.output_dir, filename)
+        with _file_lock(path):
+            known = self.manifest.get(filename, {})
+            if os.path.exists(path) and not known.get('sha256'):
+                # File vừa được downloader khác tải xong, đọc lại manifest trên đĩa
+                known = self._read_manifest().get(filename, {})
+            return self._fetch_locked(url, filename, path, known)
+
+    def _fetch_locked(self, url, filename, path, known):
+        part_path = path + ".part"
+        # ETag của bản đang tải dở: chỉ tải tiếp khi chắc .part thuộc cùng phiên bản file
+        etag_path = part_path + ".etag"
+        
+        headers = {}
+        if os.path.exists(path) and known.get('sha256'):
+            if _file_sha256(path) == known['sha256']:
+                if not known.get('etag'):
+                    return dict(known, status='skipped')
+                headers['If-None-Match'] = known['etag']
+        
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        part_etag = _read_text(etag_path)
+        if offset and not headers:
+            if part_etag:
+                headers['Range'] = f"bytes={offset}-"
+                headers['If-Range'] = part_etag
+            else:
+                # Không biết .part thuộc phiên bản nào: bỏ và tải lại từ đầu
+                _remove_part(part_path)
+                offset = 0
+        
+        response = self.client.get(url, headers=headers, stream=True)
+        with response:
+            if response.status_code == 304:
+                return dict(known, status='skipped')
+            
+            if response.status_code == 416 and 'Range' in headers:
+                # Range vượt quá kích thước file: .part đã đủ nếu server báo đúng kích thước đó,
+                # nếu không thì .part hỏng, bỏ và tải lại từ đầu (lần sau không gửi Range)
+                if response.headers.get('Content-Range') != f"bytes */{offset}":
+                    _remove_part(part_path)
+                    return self._fetch_locked(url, filename, path, known)
+                etag = part_etag
+            else:
+                response.raise_for_status()
+                etag = response.headers.get('ETag', "")
+                
+                # 206: server chấp nhận Range, ghi tiếp vào cuối file .part nếu đúng vị trí đã yêu cầu
+                resumed = response.status_code == 206
+                if resumed and not response.headers.get('Content-Range', "").startswith(f"bytes {offset}-"):
+                    _remove_part(part_path)
+                    if 'Range' not in headers:
+                        raise ValueError(f"Server trả 206 không hợp lệ cho {url}")
+                    return self._fetch_locked(url, filename, path, known)
+                if not resumed:
+                    # ETag yếu (W/) không dùng được với If-Range
+                    if etag and not etag.startswith('W/'):
+                        _write_text(etag_path, etag)
+                    elif os.path.exists(etag_path):
+                        os.remove(etag_path)
+                
+                with open(part_path, 'ab' if resumed else 'wb') as f:
+                    for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                        f.write(chunk)
+        
+        os.replace(part_path, path)
+        if os.path.exists(etag_path):
+            os.remove(etag_path)
+        entry = {'url': url, 'etag': etag, 'sha256': _file_sha256(path), 'size': os.path.getsize(path)}
+        with self._lock:
+            self.manifest[filename] = entry
+            self._updated[filename] = entry
+        return dict(entry, status='downloaded')
+
+    def save_manifest(self):
+        """Gộp các file tải trong lần này vào manifest trên đĩa, giữ bản ghi của downloader khác"""
+        with self._lock, _file_lock(self.manifest_path):
+            manifest = self._read_manifest()
+            manifest.update(self._updated)
+            tmp_path = f"{self.manifest_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.manifest_path)
+            self.manifest = manifest
+
+    def package(self, run_dir, as_zip=False):
+        """Ghi manifest của lần chạy cạnh file Excel, kèm các file structure nếu as_zip"""
+        manifest = json.dumps(self.records, indent=1)
+        if not as_zip:
+            path = os.path.join(run_dir, "structures_manifest.json")
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(manifest)
+            return path
+        
+        path = os.path.join(run_dir, "structures.zip")
+        with timed_span('export', "structures.zip"), \
+                zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            for record in self.records:
+                if record['status'] != 'failed':
+                    archive.write(os.path.join(self.output_dir, record['file']), record['file'])
+            archive.writestr("manifest.json", manifest)
+        return path
+
+@contextmanager
+def _file_lock(path, stale_seconds=DOWNLOAD_LOCK_STALE_SECONDS, poll_seconds=0.05):
+    """Lock giữa các luồng và tiến trình bằng file <path>.lock tạo với O_EXCL"""
+    lock_path = path + ".lock"
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) > stale_seconds:
+                    logger.warning(f"Bỏ lock file cũ {lock_path}")
+                    os.remove(lock_path)
+                    continue
+            except OSError:
+                # Lock vừa được giải phóng giữa hai lệnh, thử lại ngay
+                continue
+            time.sleep(poll_seconds)
+    try:
+        os.write(fd, str(os.getpid()).encode())
+        yield
+    finally:
+        os.close(fd)
+        os.remove(lock_path)
+
+def _read_text(path):
+    if not os.path.exists(path):
+        return ""
+    with open(path, encoding='utf-8') as f:
+        return f.read().strip()
+
+def _write_text(path, text):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+def _remove_part(part_path):
+    """Bỏ file tải dở cùng ETag đi kèm"""
+    for stale_path in (part_path, part_path + ".etag"):
+        if os.path.exists(stale_path):
+            os.remove(stale_path)
+
+def _file_sha256(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _notify(progress_callback, stage, done, total, **info):
+    if progress_callback is not None:
+        progress_callback(stage, done, total, **info)
+
+def run_pipeline(df_input, max_workers=MAX_WORKERS, cache=None, force_refresh=False, exporter=None,
+                 checkpoint=None, progress_callback=None, spans=None, downloader=None, index=None,
+                 cancel_event=None, sync=None):
+    """Chạy 2 bước (Entry ID, 3D structure) không phụ thuộc giao diện
+    
+    df_input là DataFrame hoặc các khối DataFrame (vd: từ iter_input_chunks); các khối
+    được gộp lại thành một bảng 2 cột trước khi chạy.
+    progress_callback(stage, done, total, **info) được gọi từ luồng đang chạy
+    pipeline với stage là 'entries', 'structures' hoặc 'done'.
+    spans (SpanRecorder) nhận thời gian từng bước trong lúc chạy.
+    downloader (StructureDownloader) bật bước 3: tải file cấu trúc, stage 'downloads'.
+    index (AccessionIndex) được tra trước khi gọi UniProt ở bước 1.
+    cancel_event (threading.Event) được kiểm tra sau mỗi dòng; khi bật, pipeline ném
+    PipelineCancelled và các dòng đã xong vẫn nằm trong checkpoint/exporter.
+    sync (DeltaSync) bật đồng bộ gia tăng: bước 2 chỉ lấy lại entry có version đã đổi.
+    """
+    # Browser chỉ dùng khi REST API lỗi nên pool được khởi động khi cần
+    with recording_spans(spans), DriverPool(size=max_workers, max_pages=DRIVER_MAX_PAGES) as pool:
+        try:
+            return _run_pipeline(df_input, pool, max_workers, cache, force_refresh, exporter, checkpoint,
+                                 progress_callback, downloader, index, cancel_event, sync)
+        finally:
+            if exporter is not None:
+                exporter.close()
+
+def _input_chunks(df_input):
+    """DataFrame hoặc các khối DataFrame -> danh sách khối"""
+    return [df_input] if isinstance(df_input, pd.DataFrame) else df_input
+
+def _input_frame(df_input):
+    """Gộp mọi khối đầu vào thành một bảng Query/Entry Name (chỉ giữ 2 cột cần thiết)"""
+    chunks = _input_chunks(df_input)
+    frames = [
+        pd.DataFrame({
+            'Query': chunk['Query'].astype(str).str.strip(),
+            'Entry Name': chunk['Entry Name'].astype(str).str.strip()
+        })
+        for chunk in chunks
+    ]
+    if not frames:
+        return pd.DataFrame(columns=REQUIRED_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
+
+def _run_pipeline(df_input, pool, max_workers, cache, force_refresh, exporter, checkpoint, progress_callback,
+                  downloader=None, index=None, cancel_event=None, sync=None):
+    """Chạy 2 bước của pipeline với pool driver dùng chung"""
+    start_time = time.time()
+    
+    # Bước 1: Lấy Entry IDs
+    df_entry_results = _input_frame(df_input)
+    df_entry_results['Entry ID'] = ""
+    row_states = pd.Series('pending', index=df_entry_results.index)
+    saved_errors = pd.Series("", index=df_entry_results.index)
+    total_rows = len(df_entry_results)
+    
+    # Chạy tiếp từ checkpoint: bỏ qua các dòng đã có kết quả.
+    # Force refresh thì bỏ kết quả cũ, checkpoint chỉ ghi lại tiến độ của lần chạy này
+    if checkpoint is not None:
+        if force_refresh:
+            checkpoint.clear()
+        checkpoint.start(df_entry_results)
+        saved = checkpoint.load_rows().reindex(df_entry_results.index)
+        row_states = saved['state'].fillna('pending')
+        df_entry_results['Entry ID'] = saved['entry_id'].fillna("")
+        saved_errors = saved['error'].fillna("")
+        logger.info(f"Checkpoint {checkpoint.job_id}: {row_states.value_counts().to_dict()}")
+    
+    to_resolve = row_states == 'pending'
+    
+    # Tra index offline trước, chỉ các dòng không có trong index mới gọi UniProt
+    if index is not None and to_resolve.any():
+        pairs = list(zip(df_entry_results.loc[to_resolve, 'Query'], df_entry_results.loc[to_resolve, 'Entry Name']))
+        with timed_span('index'):
+            found = index.lookup_many(pairs)
+        df_entry_results.loc[to_resolve, 'Entry ID'] = [found.get(pair, "") for pair in pairs]
+        logger.info(f"Index offline: {len(found)}/{len(set(pairs))} cặp Query/Entry Name có accession")
+    
+    # Tra cứu theo lô bằng Entry Name, các dòng còn thiếu mới tra từng dòng
+    unresolved = to_resolve & (df_entry_results['Entry ID'] == "")
+    if unresolved.any():
+        _notify(progress_callback, 'entries', 0, total_rows, message="Đang tra cứu Entry IDs theo lô...")
+        batch_results = resolve_entries_batch(
+            df_entry_results[unresolved], max_workers=max_workers, cache=cache, force_refresh=force_refresh
+        )
+        df_entry_results.loc[unresolved, 'Entry ID'] = batch_results['Entry ID'].to_numpy()
+    
+    # Mỗi cặp (Query, Entry Name) lặp lại chỉ được tra cứu một lần
+    pending = df_entry_results[to_resolve & (df_entry_results['Entry ID'] == "")]
+    pending_pairs = pending.groupby(['Query', 'Entry Name'], sort=False).size()
+    batch_count = total_rows - len(pending)
+    done = success_count = batch_count
+    
+    _check_cancelled(cancel_event)
+    logger.info(
+        f"Tra cứu theo lô: {batch_count}/{total_rows} dòng có Entry ID, "
+        f"{len(pending_pairs)} cặp Query/Entry Name cần tra từng dòng"
+    )
+    _notify(progress_callback, 'entries', done, total_rows, success=success_count, pending=len(pending_pairs))
+    
+    resolved_pairs = {}
+    transient_pairs = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            submit_in_context(executor, get_entry_id, query, entry_name, pool): (query, entry_name)
+            for query, entry_name in pending_pairs.index
+        }
+        
+        # Báo tiến độ theo thứ tự hoàn thành
+        for future in as_completed(futures):
+            _check_cancelled(cancel_event, futures)
+            query, entry_name = futures[future]
+            try:
+                entry_id = future.result()
+            except TransientFetchError as e:
+                logger.error(f"Lỗi tạm thời khi tra cứu {query}: {e}")
+                transient_pairs[(query, entry_name)] = str(e)
+                entry_id = None
+            row_count = pending_pairs[(query, entry_name)]
+            done += row_count
+            
+            if entry_id:
+                resolved_pairs[(query, entry_name)] = entry_id
+                success_count += row_count
+                if cache is not None:
+                    cache.set(entry_cache_key(query, entry_name), entry_id)
+            
+            _notify(progress_callback, 'entries', done, total_rows, label=query, success=success_count,
+                    pending=len(pending_pairs))
+    
+    # Trả kết quả về mọi dòng có cùng cặp Query/Entry Name
+    if resolved_pairs:
+        missing = to_resolve & (df_entry_results['Entry ID'] == "")
+        df_entry_results.loc[missing, 'Entry ID'] = [
+            resolved_pairs.get(pair, "")
+            for pair in zip(df_entry_results.loc[missing, 'Query'], df_entry_results.loc[missing, 'Entry Name'])
+        ]
+    
+    has_entry = df_entry_results['Entry ID'] != ""
+    df_entry_results['Final URL'] = (
+        "https://www.uniprot.org/uniprotkb/" + df_entry_results['Entry ID'] + "/entry#structure"
+    ).where(has_entry, "")
+    df_entry_results['Status'] = has_entry.map({True: STATUS_SUCCESS, False: STATUS_NOT_FOUND})
+    
+    # Tách dòng lỗi tạm thời (mạng, 429/5xx) khỏi dòng thực sự không tìm thấy
+    pair_keys = pd.Series(list(zip(df_entry_results['Query'], df_entry_results['Entry Name'])),
+                          index=df_entry_results.index)
+    row_errors = pair_keys.map(transient_pairs).where(to_resolve & ~has_entry)
+    transient_rows = row_errors.notna() | (
+        (row_states == 'failed') & saved_errors.str.startswith("Lỗi tạm thời")
+    )
+    df_entry_results.loc[transient_rows, 'Status'] = STATUS_TRANSIENT
+    
+    if exporter is not None:
+        exporter.write_entries(df_entry_results)
+    
+    resolved_now = to_resolve & has_entry
+    failed_now = to_resolve & ~has_entry
+    row_states[resolved_now] = 'resolved'
+    row_states[failed_now] = 'failed'
+    if checkpoint is not None:
+        checkpoint.mark_rows(
+            [(idx, 'resolved', entry_id, "") for idx, entry_id in df_entry_results.loc[resolved_now, 'Entry ID'].items()]
+            + [
+                (idx, 'failed', "", f"Lỗi tạm thời: {row_errors[idx]}" if transient_rows[idx] else "Không tìm thấy Entry ID")
+                for idx in df_entry_results.index[failed_now]
+            ]
+        )
+    
+    # Bước 2: Lấy 3D Structure data
+    valid_results = df_entry_results[row_states.isin(['resolved', 'extracted'])]
+    
+    if len(valid_results) == 0:
+        logger.warning("Không có Entry ID nào hợp lệ")
+        _notify(progress_callback, 'done', total_rows, total_rows, elapsed=time.time() - start_time, structures=0)
+        return df_entry_results, None
+    
+    # Mỗi Entry ID chỉ được lấy một lần rồi chia lại cho các dòng
+    rows_by_entry = valid_results.groupby('Entry ID', sort=False)[['Query', 'Entry Name']].apply(
+        lambda group: list(group.itertuples(index=False, name=None))
+    )
+    structure_by_entry = checkpoint.load_structures() if checkpoint is not None else {}
+    structure_count = 0
+    protein_structure_count = 0
+    
+    def export_entry(entry_id, rows):
+        if exporter is not None:
+            exporter.append_structures([
+                [query, entry_name] + row
+                for query, entry_name in rows_by_entry[entry_id]
+                for row in rows
+            ])
+    
+    # Delta-sync kiểm tra version của mọi Entry ID, kể cả entry đã có trong checkpoint:
+    # chỉ entry có version không đổi được dùng lại, force refresh thì lấy lại tất cả
+    reused = set(structure_by_entry)
+    if sync is not None:
+        unchanged = sync.check(list(rows_by_entry.index), max_workers=max_workers, reuse=not force_refresh)
+        structure_by_entry = {entry_id: rows for entry_id, rows in unchanged.items() if rows}
+        reused = set(unchanged)
+    
+    # Các Entry ID đã lấy xong ở lần chạy trước được dùng lại
+    for entry_id in rows_by_entry.index.intersection(list(reused)):
+        rows = structure_by_entry.get(entry_id, [])
+        if checkpoint is not None:
+            checkpoint.mark_entry(entry_id, rows or None, "" if rows else "Không có dữ liệu 3D structure")
+        if rows:
+            export_entry(entry_id, rows)
+            structure_count += len(rows) * len(rows_by_entry[entry_id])
+    
+    to_extract = valid_results[~valid_results['Entry ID'].isin(list(reused))]
+    unique_entries = to_extract.drop_duplicates('Entry ID')[['Entry ID', 'Final URL']]
+    total_valid = len(unique_entries)
+    
+    _notify(progress_callback, 'structures', 0, total_valid, structures=structure_count, proteins_with_data=0)
+    
+    # Entry đã đổi version phải lấy mới, không dùng bản trong cache
+    refresh = force_refresh or sync is not None
+    transient_entries = set()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            submit_in_context(executor, get_structure_rows, entry_id, final_url, pool, cache, refresh): entry_id
+            for entry_id, final_url in unique_entries.itertuples(index=False)
+        }
+        
+        for done, future in enumerate(as_completed(futures), start=1):
+            _check_cancelled(cancel_event, futures)
+            entry_id = futures[future]
+            
+            try:
+                rows = future.result()
+                error = "" if rows else "Không có dữ liệu 3D structure"
+            except TransientFetchError as e:
+                logger.error(f"Lỗi tạm thời khi lấy 3D structure cho {entry_id}: {e}")
+                rows = None
+                error = f"Lỗi tạm thời: {e}"
+                transient_entries.add(entry_id)
+            
+            if checkpoint is not None:
+                checkpoint.mark_entry(entry_id, rows or None, error)
+            if sync is not None and not error.startswith("Lỗi tạm thời"):
+                sync.record(entry_id, rows or [])
+            
+            if rows:
+                structure_by_entry[entry_id] = rows
+                protein_structure_count += len(rows)
+                structure_count += len(rows) * len(rows_by_entry[entry_id])
+                export_entry(entry_id, rows)
+            
+            _notify(progress_callback, 'structures', done, total_valid, label=entry_id, structures=structure_count,
+                    protein_structures=protein_structure_count,
+                    rows_written=exporter.rows_written if exporter is not None else None)
+    
+    # Dòng có Entry ID nhưng lấy 3D structure bị lỗi tạm thời: chạy lại sau có thể thành công
+    if transient_entries:
+        df_entry_results.loc[df_entry_results['Entry ID'].isin(transient_entries), 'Status'] = STATUS_TRANSIENT
+        if exporter is not None:
+            exporter.write_entries(df_entry_results)
+    
+    # Giữ thứ tự dòng như file đầu vào
+    all_structure_data = [
+        [query, entry_name] + row
+        for query, entry_name, entry_id in valid_results[['Query', 'Entry Name', 'Entry ID']].itertuples(index=False)
+        for row in structure_by_entry.get(entry_id, [])
+    ]
+    
+    # Bước 3 (tùy chọn): tải file cấu trúc của các Entry ID trong file đầu vào
+    if downloader is not None:
+        _check_cancelled(cancel_event)
+        downloader.download(
+            [row for entry_id in rows_by_entry.index for row in structure_by_entry.get(entry_id, [])],
+            progress_callback, cancel_event
+        )
+    
+    _notify(progress_callback, 'done', total_valid, total_valid, elapsed=time.time() - start_time,
+            structures=len(all_structure_data))
+    
+    if all_structure_data:
+        df_final_results = pd.DataFrame(all_structure_data, columns=STRUCTURE_HEADERS)
+        return df_entry_results, df_final_results
+    else:
+        return df_entry_results, None
+
+class JobProgress:
+    """progress_callback cho job chạy nền: giữ sự kiện mới nhất của từng stage để giao diện đọc lại"""
+
+    def __init__(self):
+        self.estimator = ThroughputEstimator()
+        self.stage = None
+        self._events = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, stage, done, total, **info):
+        with self._lock:
+            if stage != self.stage:
+                self.stage = stage
+                self.estimator.reset()
+            if 'message' not in info:
+                self.estimator.update(done)
+            previous = self._events.get(stage)
+            merged = dict(previous[3]) if previous else {}
+            merged.update(info)
+            if 'message' not in info:
+                merged.pop('message', None)
+            self._events[stage] = (stage, done, total, merged)
+
+    def snapshot(self):
+        """Sự kiện mới nhất theo thứ tự các stage đã chạy, stage hiện tại kèm 'rate' và 'eta'
+        
+        Tốc độ được tính dưới cùng lock với __call__ nên giao diện chỉ nhận giá trị thường,
+        không đọc bộ ước tính trong lúc luồng pipeline đang cập nhật hoặc reset nó.
+        """
+        with self._lock:
+            events = []
+            for stage, done, total, info in self._events.values():
+                if stage == self.stage:
+                    info = dict(info, rate=self.estimator.rate(), eta=self.estimator.eta(total))
+                events.append((stage, done, total, info))
+            return events
+
+class PipelineJob:
+    """Một lần chạy pipeline trong nền: trạng thái, tiến độ, kết quả và cờ hủy"""
+
+    def __init__(self, job_id, label):
+        self.id = job_id
+        self.label = label
+        self.status = JOB_QUEUED
+        self.error = ""
+        self.result = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.progress = JobProgress()
+        self.cancel_event = threading.Event()
+        self.exporter = None
+        self.checkpoint_id = None
+        self.future = None
+
+    @property
+    def active(self):
+        return self.status in (JOB_QUEUED, JOB_RUNNING)
+
+    def release_frames(self):
+        """Bỏ các bảng kết quả sau khi phiên đã dựng ResultExplorer, job chỉ còn giữ thông tin nhỏ"""
+        if self.result is not None:
+            self.result['entries'] = None
+            self.result['structures'] = None
+
+    def snapshot(self):
+        """Trạng thái hiện tại để giao diện hiển thị (không chứa kết quả)"""
+        return {
+            'id': self.id,
+            'label': self.label,
+            'status': self.status,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'events': self.progress.snapshot()
+        }
+
+class JobRunner:
+    """Hàng đợi job pipeline chạy trên luồng nền, không bị dừng khi Streamlit rerun script"""
+
+    def __init__(self, max_workers=JOB_RUNNER_WORKERS, history_limit=JOB_HISTORY_LIMIT,
+                 history_seconds=JOB_HISTORY_SECONDS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='pipeline-job')
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self.history_limit = history_limit
+        self.history_seconds = history_seconds
+
+    def submit(self, label, df_input, exporter, spans=None, downloader=None, zip_structures=False, **options):
+        """Đưa một lần chạy vào hàng đợi; options được truyền cho run_pipeline"""
+        job = PipelineJob(f"{datetime.now().strftime('%H%M%S')}-{os.urandom(3).hex()}", label)
+        job.exporter = exporter
+        checkpoint = options.get('checkpoint')
+        job.checkpoint_id = checkpoint.job_id if checkpoint is not None else None
+        with self._lock:
+            self._evict()
+            self._jobs[job.id] = job
+        job.future = self._executor.submit(
+            self._run, job, df_input, exporter, spans, downloader, zip_structures, options
+        )
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def active_job(self, checkpoint_id):
+        """Job đang chờ/chạy trên checkpoint này, None nếu không có"""
+        with self._lock:
+            for job in self._jobs.values():
+                if job.active and job.checkpoint_id == checkpoint_id:
+                    return job
+        return None
+
+    def jobs(self, job_ids=None):
+        """Các job (mới nhất trước), chỉ lấy job_ids nếu có"""
+        with self._lock:
+            self._evict()
+            jobs = list(self._jobs.values())
+        if job_ids is not None:
+            jobs = [job for job in jobs if job.id in set(job_ids)]
+        return sorted(jobs, key=lambda job: job.created_at, reverse=True)
+
+    def _evict(self):
+        """Bỏ job đã xong quá hạn hoặc vượt số lượng giữ lại (gọi khi đang giữ lock)"""
+        finished = sorted(
+            (job for job in self._jobs.values() if not job.active),
+            key=lambda job: job.finished_at or job.created_at, reverse=True
+        )
+        expire_before = time.time() - self.history_seconds
+        for position, job in enumerate(finished):
+            if position >= self.history_limit or (job.finished_at or job.created_at) < expire_before:
+                del self._jobs[job.id]
+
+    def cancel(self, job_id):
+        """Hủy job: job đang chờ bị bỏ khỏi hàng đợi, job đang chạy dừng sau dòng hiện tại"""
+        job = self.get(job_id)
+        if job is None or not job.active:
+            return False
+        job.cancel_event.set()
+        if job.future is not None and job.future.cancel():
+            job.status = JOB_CANCELLED
+            job.finished_at = time.time()
+        return True
+
+    def _run(self, job, df_input, exporter, spans, downloader, zip_structures, options):
+        job.status = JOB_RUNNING
+        job.started_at = time.time()
+        cache_stats = {'hits': 0, 'misses': 0}
+        try:
+            with counting_cache_stats(cache_stats):
+                df_entry_results, df_final_results = run_pipeline(
+                    df_input, exporter=exporter, spans=spans, downloader=downloader,
+                    progress_callback=job.progress, cancel_event=job.cancel_event, **options
+                )
+            
+            sync = options.get('sync')
+            df_changes = sync.report(df_entry_results) if sync is not None else None
+            xlsx_path, parquet_path = None, None
+            if df_final_results is not None:
+                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                with recording_spans(spans):
+                    xlsx_path = exporter.write_xlsx(
+                        df_entry_results, df_final_results.itertuples(index=False),
+                        f"UniProt_3D_Structures_{timestamp}.xlsx", df_changes
+                    )
+                    parquet_path = exporter.write_parquet(df_final_results)
+            package_path = downloader.package(exporter.run_dir, zip_structures) if downloader is not None else None
+            
+            job.result = {
+                'entries': df_entry_results,
+                'structures': df_final_results,
+                'xlsx_path': xlsx_path,
+                'parquet_path': parquet_path,
+                'run_dir': exporter.run_dir,
+                'spans': spans,
+                'downloader': downloader,
+                'package_path': package_path,
+                'changes': df_changes,
+                'sync_stats': dict(sync.stats) if sync is not None else None,
+                'cache_hits': cache_stats['hits'],
+                'cache_misses': cache_stats['misses']
+            }
+            job.status = JOB_DONE
+        except PipelineCancelled:
+            logger.info(f"Job {job.id} đã bị hủy")
+            job.status = JOB_CANCELLED
+        except Exception as e:
+            logger.exception(f"Job {job.id} lỗi")
+            job.error = str(e)
+            job.status = JOB_FAILED
+        finally:
+            job.finished_at = time.time()
+
+def input_extension(name):
+    """Phần mở rộng (chữ thường) của file đầu vào"""
+    return os.path.splitext(name)[1].lower()
+
+def _open_input(source):
+    """Mở file theo đường dẫn, hoặc tua lại file upload về đầu"""
+    if isinstance(source, (str, os.PathLike)):
+        return open(source, 'rb')
+    source.seek(0)
+    return source
+
+def _parse_gene_list_line(line):
+    """Một dòng danh sách gen: `Query Entry_Name` hoặc chỉ một mã"""
+    tokens = line.replace(',', ' ').split()
+    if len(tokens) >= 2:
+        return tokens[0], tokens[1]
+    # Một mã dạng P53_HUMAN vừa là Query vừa là Entry Name, gene symbol thì lấy kết quả đầu tiên
+    token = tokens[0]
+    return token, token if '_' in token else ""
+
+def read_input_header(source, name):
+    """Đọc tên cột của file đầu vào mà không tải toàn bộ dữ liệu"""
+    extension = input_extension(name)
+    if extension == '.txt':
+        return list(REQUIRED_COLUMNS)
+    
+    f = _open_input(source)
+    try:
+        if extension == '.xlsx':
+            from openpyxl import load_workbook
+            workbook = load_workbook(f, read_only=True, data_only=True)
+            try:
+                header = next(workbook.active.iter_rows(max_row=1, values_only=True), ())
+            finally:
+                workbook.close()
+            return [str(value).strip() for value in header if value is not None]
+        if extension in ('.csv', '.tsv', '.tab'):
+            text = io.TextIOWrapper(f, encoding='utf-8-sig')
+            first_line = text.readline()
+            # Tách wrapper ra để không đóng theo file upload
+            text.detach()
+            delimiter = ',' if extension == '.csv' else '\t'
+            return [column.strip() for column in next(csv.reader([first_line], delimiter=delimiter), [])]
+        return list(pd.read_excel(f, nrows=0).columns)
+    finally:
+        if f is not source:
+            f.close()
+
+def iter_input_chunks(source, name, chunk_size=INPUT_CHUNK_ROWS):
+    """Đọc file đầu vào theo từng khối DataFrame (Query, Entry Name)
+    
+    Mỗi khối chỉ giữ 2 cột cần thiết, các cột khác của file không được nạp vào bộ nhớ.
+    Pipeline vẫn gộp mọi khối thành một bảng (bước 2 nhóm theo Entry ID trên toàn file),
+    nên bộ nhớ tăng theo số dòng, chỉ nhỏ hơn so với đọc cả file.
+    """
+    extension = input_extension(name)
+    f = _open_input(source)
+    try:
+        if extension == '.xlsx':
+            yield from _iter_xlsx_chunks(f, chunk_size)
+        elif extension in ('.csv', '.tsv', '.tab'):
+            reader = pd.read_csv(
+                f, sep=',' if extension == '.csv' else '\t', usecols=REQUIRED_COLUMNS, dtype=str,
+                keep_default_na=False, chunksize=chunk_size, encoding='utf-8-sig'
+            )
+            for chunk in reader:
+                yield chunk[REQUIRED_COLUMNS]
+        elif extension == '.txt':
+            text = io.TextIOWrapper(f, encoding='utf-8-sig')
+            try:
+                yield from _iter_gene_list_chunks(text, chunk_size)
+            finally:
+                text.detach()
+        else:
+            # .xls không đọc streaming được, chỉ lấy 2 cột cần thiết
+            df = pd.read_excel(f, usecols=REQUIRED_COLUMNS, dtype=str).fillna("")
+            for start in range(0, len(df), chunk_size):
+                yield df.iloc[start:start + chunk_size]
+    finally:
+        if f is not source:
+            f.close()
+
+def _iter_xlsx_chunks(f, chunk_size):
+    from openpyxl import load_workbook
+    workbook = load_workbook(f, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(value).strip() if value is not None else "" for value in next(rows, ())]
+        query_idx, name_idx = (header.index(column) for column in REQUIRED_COLUMNS)
+        
+        buffer = []
+        for row in rows:
+            query = row[query_idx] if query_idx < len(row) else None
+            entry_name = row[name_idx] if name_idx < len(row) else None
+            if query is None and entry_name is None:
+                continue
+            buffer.append(("" if query is None else str(query), "" if entry_name is None else str(entry_name)))
+            if len(buffer) >= chunk_size:
+                yield pd.DataFrame(buffer, columns=REQUIRED_COLUMNS)
+                buffer = []
+        if buffer:
+            yield pd.DataFrame(buffer, columns=REQUIRED_COLUMNS)
+    finally:
+        workbook.close()
+
+def _iter_gene_list_chunks(lines, chunk_size):
+    buffer = []
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        buffer.append(_parse_gene_list_line(line))
+        if len(buffer) >= chunk_size:
+            yield pd.DataFrame(buffer, columns=REQUIRED_COLUMNS)
+            buffer = []
+    if buffer:
+        yield pd.DataFrame(buffer, columns=REQUIRED_COLUMNS)
+
+def load_input_table(source, name, chunk_size=INPUT_CHUNK_ROWS):
+    """Ghép các khối đầu vào thành một DataFrame chỉ gồm 2 cột cần thiết"""
+    chunks = list(iter_input_chunks(source, name, chunk_size))
+    if not chunks:
+        return pd.DataFrame(columns=REQUIRED_COLUMNS)
+    return pd.concat(chunks, ignore_index=True)
+
+class ConsoleProgress:
+    """In tiến độ của pipeline ra stderr khi chạy bằng dòng lệnh"""
+
+    def __init__(self, stream=sys.stderr):
+        self.stream = stream
+        self.last_percent = {}
+
+    def __call__(self, stage, done, total, **info):
+        if stage == 'done':
+            print(f"\n✅ Hoàn thành trong {info.get('elapsed', 0):.1f}s, {info.get('structures', 0)} dòng 3D structure",
+                  file=self.stream)
+            return
+        
+        percent = int(done * 100 / total) if total else 100
+        if self.last_percent.get(stage) == percent:
+            return
+        self.last_percent[stage] = percent
+        label = {'entries': "Entry IDs", 'structures': "3D structure", 'downloads': "Tải file"}.get(stage, stage)
+        print(f"\r[{label}] {done}/{total} ({percent}%)", end="", file=self.stream, flush=True)
+        if percent == 100:
+            print(file=self.stream)
+
+def cli_main(argv=None):
+    """Chạy pipeline từ dòng lệnh, không cần Streamlit"""
+    parser = argparse.ArgumentParser(
+        prog="App.py",
+        description="Trích xuất thông tin cấu trúc 3D từ UniProt (chế độ dòng lệnh)"
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    run_parser = subparsers.add_parser('run', help="Xử lý một file Query/Entry Name")
+    run_parser.add_argument('input', help="File đầu vào .xlsx, .csv, .tsv có cột Query và Entry Name, hoặc danh sách gen .txt")
+    run_parser.add_argument('-o', '--output-dir', help="Thư mục kết quả (mặc định: exports/run_<thời gian>)")
+    run_parser.add_argument('-w', '--workers', type=int, default=MAX_WORKERS, help="Số luồng xử lý song song")
+    run_parser.add_argument('--no-cache', action='store_true', help="Không dùng cache trên đĩa")
+    run_parser.add_argument('--force-refresh', action='store_true', help="Tra cứu lại và ghi đè cache")
+    run_parser.add_argument('--resume', action='store_true', help="Chạy tiếp từ checkpoint của cùng file đầu vào")
+    run_parser.add_argument('--retry-failed', action='store_true', help="Chạy lại các dòng thất bại trong checkpoint")
+    run_parser.add_argument('--no-selenium', action='store_true', help="Không dùng Selenium khi REST API lỗi")
+    run_parser.add_argument('--index', metavar='PATH',
+                            help=f"Tra index offline trước khi gọi UniProt (vd: {ACCESSION_INDEX_PATH})")
+    run_parser.add_argument('--sync', nargs='?', const=SYNC_STATE_PATH, metavar='PATH',
+                            help="Delta-sync: chỉ lấy lại entry có version đã đổi so với lần chạy trước "
+                                 f"(mặc định lưu tại {SYNC_STATE_PATH}) và ghi sheet Structure_Changes")
+    run_parser.add_argument('--timings', help="Ghi thời gian từng bước ra file .json hoặc .csv")
+    run_parser.add_argument('--download-structures', action='store_true',
+                            help="Tải file mmCIF/AlphaFold của các structure tìm được")
+    run_parser.add_argument('--structures-dir', default=STRUCTURE_DOWNLOAD_DIR,
+                            help="Thư mục lưu file cấu trúc, dùng chung giữa các lần chạy")
+    run_parser.add_argument('--methods', nargs='+', help="Chỉ tải structure có method này (vd: X-ray EM)")
+    run_parser.add_argument('--max-resolution', type=float, help="Chỉ tải structure có resolution <= giá trị (Å)")
+    run_parser.add_argument('--no-alphafold', action='store_true', help="Không tải model AlphaFold")
+    run_parser.add_argument('--zip', action='store_true', help="Đóng gói file cấu trúc thành structures.zip")
+    run_parser.add_argument('-q', '--quiet', action='store_true', help="Chỉ log cảnh báo và lỗi")
+    
+    index_parser = subparsers.add_parser('build-index', help="Dựng index offline từ file idmapping của UniProt")
+    index_parser.add_argument('source', help="File idmapping.dat(.gz) hoặc danh sách Entry/Entry Name (.tsv)")
+    index_parser.add_argument('--index', default=ACCESSION_INDEX_PATH, help="File SQLite của index")
+    
+    queue_init_parser = subparsers.add_parser('queue-init', help="Chia file đầu vào thành shard trong hàng đợi SQLite")
+    queue_init_parser.add_argument('input', help="File đầu vào như lệnh run")
+    queue_init_parser.add_argument('queue', help="File SQLite của hàng đợi (đặt trên ổ dùng chung nếu chạy nhiều máy)")
+    queue_init_parser.add_argument('--shard-rows', type=int, default=QUEUE_SHARD_ROWS, help="Số dòng mỗi shard")
+    
+    queue_work_parser = subparsers.add_parser('queue-work', help="Nhận và xử lý shard cho tới khi hàng đợi hết việc")
+    queue_work_parser.add_argument('queue', help="File SQLite của hàng đợi")
+    queue_work_parser.add_argument('-w', '--workers', type=int, default=MAX_WORKERS, help="Số luồng mỗi process")
+    queue_work_parser.add_argument('-p', '--processes', type=int, default=1,
+                                   help="Số process worker trên máy này (chia nhau giới hạn tốc độ)")
+    queue_work_parser.add_argument('--worker-id', help="Tên worker (mặc định: <host>-<pid>)")
+    queue_work_parser.add_argument('--retry-failed', action='store_true', help="Đưa shard thất bại về hàng đợi")
+    queue_work_parser.add_argument('--no-cache', action='store_true', help="Không dùng cache trên đĩa")
+    queue_work_parser.add_argument('--no-selenium', action='store_true', help="Không dùng Selenium khi REST API lỗi")
+    queue_work_parser.add_argument('-q', '--quiet', action='store_true', help="Chỉ log cảnh báo và lỗi")
+    
+    queue_merge_parser = subparsers.add_parser('queue-merge', help="Gộp kết quả các shard thành file Excel 2 sheet")
+    queue_merge_parser.add_argument('queue', help="File SQLite của hàng đợi")
+    queue_merge_parser.add_argument('-o', '--output-dir', help="Thư mục kết quả (mặc định: exports/run_<thời gian>)")
+    queue_merge_parser.add_argument('--partial', action='store_true', help="Gộp cả khi còn shard chưa xong")
+    
+    args = parser.parse_args(argv)
+    
+    if args.command == 'build-index':
+        index = AccessionIndex(args.index)
+        count = index.build(args.source)
+        print(f"Đã ghi {count} Entry Name, index có {index.size()} Entry Name: {args.index}")
+        return 0
+    if args.command.startswith('queue-'):
+        return _queue_command(parser, args)
+    
+    if args.quiet:
+        logging.getLogger().setLevel(logging.WARNING)
+    if args.no_selenium:
+        global USE_SELENIUM_FALLBACK
+        USE_SELENIUM_FALLBACK = False
+    
+    missing_columns = [col for col in REQUIRED_COLUMNS if col not in read_input_header(args.input, args.input)]
+    if missing_columns:
+        parser.error(f"File thiếu cột: {missing_columns}")
+    if args.index and not os.path.exists(args.index):
+        parser.error(f"Không có index {args.index}, dựng bằng lệnh build-index")
+    
+    cache = None if args.no_cache else ResponseCache()
+    checkpoint = None
+    if args.resume or args.retry_failed:
+        checkpoint = JobCheckpoint(JobCheckpoint.job_id_for_file(args.input))
+        if args.retry_failed:
+            checkpoint.reset_failed()
+    
+    exporter = StreamingExporter(args.output_dir) if args.output_dir else create_run_exporter()
+    
+    spans = SpanRecorder() if args.timings else None
+    sync = DeltaSync(args.sync) if args.sync else None
+    downloader = None
+    if args.download_structures:
+        downloader = StructureDownloader(
+            args.structures_dir, methods=args.methods, max_resolution=args.max_resolution,
+            include_alphafold=not args.no_alphafold
+        )
+    
+    df_entry_results, df_final_results = run_pipeline(
+        iter_input_chunks(args.input, args.input), max_workers=args.workers, cache=cache,
+        force_refresh=args.force_refresh, exporter=exporter, checkpoint=checkpoint,
+        progress_callback=ConsoleProgress(), spans=spans, downloader=downloader,
+        index=AccessionIndex(args.index) if args.index else None, sync=sync
+    )
+    
+    structure_rows = df_final_results.itertuples(index=False) if df_final_results is not None else []
+    df_changes = sync.report(df_entry_results) if sync is not None else None
+    parquet_path = None
+    with recording_spans(spans):
+        xlsx_path = exporter.write_xlsx(df_entry_results, structure_rows, "UniProt_3D_Structures.xlsx", df_changes)
+        if df_final_results is not None:
+            parquet_path = exporter.write_parquet(df_final_results)
+    
+    success_count = int((df_entry_results['Entry ID'] != "").sum())
+    print(f"Entry IDs: {success_count}/{len(df_entry_results)} thành công")
+    print(f"Kết quả: {xlsx_path}")
+    if parquet_path:
+        print(f"Parquet: {parquet_path}")
+    if sync is not None:
+        print(f"Delta-sync: {sync.stats['unchanged']} entry không đổi, {sync.stats['changed']} đã đổi, "
+              f"{sync.stats['new']} mới; {len(df_changes)} structure thêm/bị gỡ")
+    
+    if downloader is not None:
+        statuses = pd.Series([record['status'] for record in downloader.records], dtype=object).value_counts()
+        print(f"File cấu trúc: {int(statuses.get('downloaded', 0))} tải mới, "
+              f"{int(statuses.get('skipped', 0))} đã có, {int(statuses.get('failed', 0))} thất bại")
+        print(f"Manifest: {downloader.package(exporter.run_dir, args.zip)}")
+    
+    if spans is not None:
+        spans.save(args.timings)
+        print(spans.summary().to_string())
+        print(f"Thời gian từng bước: {args.timings}")
+    return 0
+
+def _queue_command(parser, args):
+    """Các lệnh queue-init, queue-work, queue-merge"""
+    if args.command == 'queue-init':
+        missing_columns = [col for col in REQUIRED_COLUMNS if col not in read_input_header(args.input, args.input)]
+        if missing_columns:
+            parser.error(f"File thiếu cột: {missing_columns}")
+        try:
+            shard_count = ShardQueue(args.queue).create(iter_input_chunks(args.input, args.input), args.shard_rows)
+        except ValueError as e:
+            parser.error(str(e))
+        print(f"Đã tạo {shard_count} shard trong {args.queue}")
+        return 0
+    
+    if not os.path.exists(args.queue):
+        parser.error(f"Không có hàng đợi {args.queue}, tạo bằng lệnh queue-init")
+    
+    if args.command == 'queue-work':
+        global USE_SELENIUM_FALLBACK
+        if args.quiet:
+            logging.getLogger().setLevel(logging.WARNING)
+        if args.no_selenium:
+            USE_SELENIUM_FALLBACK = False
+        if args.retry_failed:
+            ShardQueue(args.queue).reset_failed()
+        
+        if args.processes <= 1:
+            run_queue_worker(args.queue, args.worker_id, args.workers, None if args.no_cache else ResponseCache())
+        else:
+            # spawn: process con không kế thừa luồng/kết nối của process cha
+            context = multiprocessing.get_context('spawn')
+            prefix = args.worker_id or socket.gethostname()
+            worker_args = (args.workers, not args.no_cache, USE_SELENIUM_FALLBACK, args.processes,
+                           logging.getLogger().level)
+            processes = [
+                context.Process(target=_queue_worker_process,
+                                args=(args.queue, f"{prefix}-{i}", *worker_args))
+                for i in range(args.processes)
+            ]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+        print(f"Hàng đợi: {ShardQueue(args.queue).summary()}")
+        return 0
+    
+    try:
+        df_entry_results, df_final_results = ShardQueue(args.queue).load_results(args.partial)
+    except ValueError as e:
+        parser.error(f"{e}, chạy thêm queue-work hoặc dùng --partial")
+    
+    exporter = StreamingExporter(args.output_dir) if args.output_dir else create_run_exporter()
+    exporter.write_entries(df_entry_results)
+    parquet_path = None
+    if df_final_results is not None:
+        exporter.append_structures(df_final_results.values.tolist())
+        parquet_path = exporter.write_parquet(df_final_results)
+    exporter.close()
+    structure_rows = df_final_results.itertuples(index=False) if df_final_results is not None else []
+    xlsx_path = exporter.write_xlsx(df_entry_results, structure_rows, "UniProt_3D_Structures.xlsx")
+    
+    success_count = int((df_entry_results['Entry ID'] != "").sum())
+    print(f"Entry IDs: {success_count}/{len(df_entry_results)} thành công")
+    print(f"Kết quả: {xlsx_path}")
+    if parquet_path:
+        print(f"Parquet: {parquet_path}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(cli_main())